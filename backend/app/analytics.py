@@ -0,0 +1,327 @@
+# app/analytics.py
+
+"""
+Mean opinion score (MOS) aggregation.
+
+Per image/question and per subject/question running sums (n, sum, sum of
+squares) of non-training rating values are kept in image_score_stats and
+subject_score_stats. record_scores() updates them with one upsert per table in
+the same transaction as the rating insert, so MOS, standard deviation and 95%
+confidence intervals are read without touching the ratings table.
+
+Statistics that need individual ratings -- z-score normalized MOS, DMOS against
+the hidden reference and ITU-R BT.500 subject screening -- are computed on
+demand with NumPy over a subject x image matrix of one question.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import upsert
+
+# Two-sided 95% normal quantile (BT.500 confidence interval)
+Z_95 = 1.959963984540054
+
+# (image_id, subject_id, question_id, rating_value)
+Score = Tuple[int, int, int, Optional[float]]
+
+
+# ---------------------
+# INCREMENTAL AGGREGATES
+# ---------------------
+def _upsert_sums(db: Session, model, key_names: Sequence[str], sums: Dict[tuple, List[float]]) -> None:
+    if not sums:
+        return
+    stmt = upsert(db, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_names),
+        set_={
+            "n": model.n + stmt.excluded.n,
+            "total": model.total + stmt.excluded.total,
+            "total_sq": model.total_sq + stmt.excluded.total_sq,
+        },
+    )
+    db.execute(stmt, [
+        {**dict(zip(key_names, key)), "n": n, "total": total, "total_sq": total_sq}
+        for key, (n, total, total_sq) in sums.items()
+    ])
+
+
+def record_scores(db: Session, scores: Iterable[Score]) -> None:
+    """
+    Add newly inserted (non-training) ratings to the running sums.
+    Runs in the caller's transaction.
+    """
+    by_image: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    by_subject: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    for image_id, subject_id, question_id, value in scores:
+        if value is None:
+            continue
+        for sums in (by_image[(image_id, question_id)], by_subject[(subject_id, question_id)]):
+            sums[0] += 1
+            sums[1] += value
+            sums[2] += value * value
+    _upsert_sums(db, models.ImageScoreStats, ("image_id", "question_id"), by_image)
+    _upsert_sums(db, models.SubjectScoreStats, ("subject_id", "question_id"), by_subject)
+
+
+def scores_query():
+    return (
+        select(
+            models.SessionImage.image_id,
+            models.Session.subject_id,
+            models.Rating.question_id,
+            models.Rating.rating_value,
+        )
+        .join(models.SessionImage, models.Rating.session_image_id == models.SessionImage.session_image_id)
+        .join(models.Session, models.SessionImage.session_id == models.Session.session_id)
+        .where(models.SessionImage.is_training == False, models.Rating.rating_value.is_not(None))  # noqa: E712
+    )
+
+
+def rebuild_score_stats(conn: Connection) -> None:
+    """
+    Recompute both aggregate tables from the ratings table.
+    """
+    scores = scores_query().subquery()
+    for model, key in (
+        (models.ImageScoreStats, scores.c.image_id),
+        (models.SubjectScoreStats, scores.c.subject_id),
+    ):
+        conn.execute(delete(model))
+        conn.execute(
+            insert(model).from_select(
+                [key.name, "question_id", "n", "total", "total_sq"],
+                select(
+                    key, scores.c.question_id, func.count(),
+                    func.sum(scores.c.rating_value),
+                    func.sum(scores.c.rating_value * scores.c.rating_value),
+                ).group_by(key, scores.c.question_id)
+            )
+        )
+
+
+# ---------------------
+# MOS FROM AGGREGATES
+# ---------------------
+def summarize(n: np.ndarray, total: np.ndarray, total_sq: np.ndarray):
+    """
+    Vectorized mean, sample standard deviation and 95% CI half-width.
+    """
+    n = n.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / n
+        var = np.where(n > 1, (total_sq - n * mean * mean) / (n - 1), np.nan)
+        std = np.sqrt(np.clip(var, 0.0, None))
+        ci95 = Z_95 * std / np.sqrt(n)
+    return mean, std, ci95
+
+
+def mos_table(db: Session, question_id: int, image_id: Optional[int] = None) -> List[dict]:
+    stmt = (
+        select(
+            models.ImageScoreStats.image_id,
+            models.ImageScoreStats.n,
+            models.ImageScoreStats.total,
+            models.ImageScoreStats.total_sq,
+        )
+        .where(models.ImageScoreStats.question_id == question_id)
+        .order_by(models.ImageScoreStats.image_id)
+    )
+    if image_id is not None:
+        stmt = stmt.where(models.ImageScoreStats.image_id == image_id)
+    rows = db.execute(stmt).all()
+    if not rows:
+        return []
+
+    image_ids, n, total, total_sq = (np.array(col) for col in zip(*rows))
+    mean, std, ci95 = summarize(n, total.astype(float), total_sq.astype(float))
+    return [
+        {
+            "image_id": int(image_ids[k]),
+            "question_id": question_id,
+            "n": int(n[k]),
+            "mos": _finite(mean[k]),
+            "std": _finite(std[k]),
+            "ci95": _finite(ci95[k]),
+        }
+        for k in range(len(rows))
+    ]
+
+
+# ---------------------
+# RATING MATRIX STATISTICS
+# ---------------------
+class RatingMatrix(NamedTuple):
+    subject_ids: np.ndarray
+    image_ids: np.ndarray
+    scores: np.ndarray  # subjects x images, NaN where unrated; repeats averaged
+
+
+def _score_triplets(db: Session, question_id: int, image_id: Optional[int] = None) -> np.ndarray:
+    stmt = (
+        select(models.Session.subject_id, models.SessionImage.image_id, models.Rating.rating_value)
+        .join(models.SessionImage, models.Rating.session_image_id == models.SessionImage.session_image_id)
+        .join(models.Session, models.SessionImage.session_id == models.Session.session_id)
+        .where(
+            models.Rating.question_id == question_id,
+            models.SessionImage.is_training == False,  # noqa: E712
+            models.Rating.rating_value.is_not(None),
+        )
+    )
+    if image_id is not None:
+        stmt = stmt.where(models.SessionImage.image_id == image_id)
+    return np.array(db.execute(stmt).all(), dtype=float).reshape(-1, 3)
+
+
+def rating_matrix(db: Session, question_id: int) -> RatingMatrix:
+    triplets = _score_triplets(db, question_id)
+    subject_ids, s_idx = np.unique(triplets[:, 0].astype(int), return_inverse=True)
+    image_ids, i_idx = np.unique(triplets[:, 1].astype(int), return_inverse=True)
+
+    sums = np.zeros((len(subject_ids), len(image_ids)))
+    counts = np.zeros_like(sums)
+    np.add.at(sums, (s_idx, i_idx), triplets[:, 2])
+    np.add.at(counts, (s_idx, i_idx), 1)
+    with np.errstate(invalid="ignore"):
+        scores = np.where(counts > 0, sums / counts, np.nan)
+    return RatingMatrix(subject_ids, image_ids, scores)
+
+
+def zscore_mos(db: Session, question_id: int, image_id: Optional[int] = None) -> List[dict]:
+    """
+    MOS of per-subject z-scores, using each subject's running mean/std from
+    subject_score_stats. Also rescaled to 0..100 ((z + 3) * 100 / 6).
+    """
+    triplets = _score_triplets(db, question_id, image_id)
+    if not len(triplets):
+        return []
+
+    stats = db.execute(
+        select(
+            models.SubjectScoreStats.subject_id,
+            models.SubjectScoreStats.n,
+            models.SubjectScoreStats.total,
+            models.SubjectScoreStats.total_sq,
+        )
+        .where(models.SubjectScoreStats.question_id == question_id)
+    ).all()
+    if not stats:
+        return []
+    stat_ids, n, total, total_sq = (np.array(col, dtype=float) for col in zip(*stats))
+    mean, std, _ = summarize(n, total, total_sq)
+
+    order = np.argsort(stat_ids)
+    stat_ids, mean, std = stat_ids[order], mean[order], std[order]
+    # Subjects without a stats row yet get no z-score
+    lookup = np.minimum(np.searchsorted(stat_ids, triplets[:, 0]), len(stat_ids) - 1)
+    known = stat_ids[lookup] == triplets[:, 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (triplets[:, 2] - mean[lookup]) / std[lookup]
+    valid = known & np.isfinite(z)
+
+    image_ids, i_idx = np.unique(triplets[valid, 1].astype(int), return_inverse=True)
+    counts = np.bincount(i_idx, minlength=len(image_ids))
+    z_mos = np.bincount(i_idx, weights=z[valid], minlength=len(image_ids)) / counts
+    return [
+        {
+            "image_id": int(image_ids[k]),
+            "question_id": question_id,
+            "n": int(counts[k]),
+            "z_mos": _finite(z_mos[k]),
+            "z_mos_rescaled": _finite((z_mos[k] + 3) * 100 / 6),
+        }
+        for k in range(len(image_ids))
+    ]
+
+
+def dmos(db: Session, question_id: int) -> List[dict]:
+    """
+    Differential MOS: per subject, reference score minus distorted score,
+    averaged over the subjects who rated both.
+    """
+    matrix = rating_matrix(db, question_id)
+    references = dict(db.execute(
+        select(models.Image.image_id, models.Image.reference_image_id)
+        .where(
+            models.Image.image_id.in_(matrix.image_ids.tolist()),
+            models.Image.reference_image_id.is_not(None),
+        )
+    ).all())
+    column = {int(image_id): k for k, image_id in enumerate(matrix.image_ids)}
+    pairs = [(dist, ref) for dist, ref in sorted(references.items()) if ref in column]
+    if not pairs:
+        return []
+
+    dist_idx = np.array([column[d] for d, _ in pairs])
+    ref_idx = np.array([column[r] for _, r in pairs])
+    diff = matrix.scores[:, ref_idx] - matrix.scores[:, dist_idx]
+    valid = ~np.isnan(diff)
+    n = valid.sum(axis=0)
+    total = np.where(valid, diff, 0.0).sum(axis=0)
+    total_sq = np.where(valid, diff * diff, 0.0).sum(axis=0)
+    mean, std, ci95 = summarize(n, total, total_sq)
+    return [
+        {
+            "image_id": dist,
+            "reference_image_id": ref,
+            "question_id": question_id,
+            "n": int(n[k]),
+            "dmos": _finite(mean[k]),
+            "std": _finite(std[k]),
+            "ci95": _finite(ci95[k]),
+        }
+        for k, (dist, ref) in enumerate(pairs)
+    ]
+
+
+def bt500_screening(matrix: RatingMatrix) -> List[dict]:
+    """
+    ITU-R BT.500 (Annex 2, 2.3.1) observer screening.
+
+    For each image the kurtosis coefficient beta2 decides whether scores are
+    treated as normal (threshold 2 sigma) or not (sqrt(20) sigma). A subject is
+    rejected when more than 5% of their scores fall outside the thresholds and
+    those outliers are not mostly on one side (|P - Q| / (P + Q) < 0.3).
+    """
+    scores = matrix.scores
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(scores, axis=0)
+        std = np.nanstd(scores, axis=0, ddof=1)
+        dev = scores - mean
+        m2 = np.nanmean(dev ** 2, axis=0)
+        m4 = np.nanmean(dev ** 4, axis=0)
+        beta2 = m4 / (m2 * m2)
+    normal = (beta2 >= 2) & (beta2 <= 4)
+    threshold = np.where(normal, 2.0, np.sqrt(20.0)) * std
+    # Images with fewer than two raters or no spread cannot flag anyone
+    usable = np.isfinite(threshold) & (threshold > 0)
+
+    rated = ~np.isnan(scores)
+    with np.errstate(invalid="ignore"):
+        p = ((scores >= mean + threshold) & rated & usable).sum(axis=1)
+        q = ((scores <= mean - threshold) & rated & usable).sum(axis=1)
+    n = rated.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rejected = ((p + q) / n > 0.05) & (np.abs(p - q) / (p + q) < 0.3)
+    return [
+        {
+            "subject_id": int(matrix.subject_ids[k]),
+            "n": int(n[k]),
+            "p": int(p[k]),
+            "q": int(q[k]),
+            "rejected": bool(rejected[k]),
+        }
+        for k in range(len(matrix.subject_ids))
+    ]
+
+
+def _finite(value) -> Optional[float]:
+    value = float(value)
+    return value if np.isfinite(value) else None
@@ -0,0 +1,166 @@
+# app/catalog.py
+
+"""
+Read-through, per-worker cache of the reference tables (questions, images).
+
+Each catalog keeps every row as its response schema, ordered by primary key.
+Lookups are served from memory; the worker re-reads the catalog's version
+stamp (one primary key lookup in catalog_versions) at most every
+settings.CATALOG_CHECK_SECONDS and reloads the whole table when the stamp has
+changed or settings.CATALOG_TTL_SECONDS have passed. Routers that insert or
+change rows call invalidate() before committing: it bumps the stamp in the
+same transaction, so every worker picks the change up on its next check.
+
+A lookup that misses re-checks the stamp immediately before reporting the row
+as missing, so rows created through another worker are never rejected.
+
+Async routers consult the catalogs through AsyncSession.run_sync(), i.e. on
+the event loop. There a reload fetches plain column tuples and builds the
+schemas in a worker thread, so a large table does not stall the loop, and
+concurrent requests needing the same reload share it.
+
+Snapshots are kept per study (see app.studies), since each study has its own
+tables.
+"""
+
+import asyncio
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+from . import models, schemas
+from .config import settings
+from .database import upsert
+from .studies import current_study
+
+
+class _Snapshot(NamedTuple):
+    version: int
+    items: Dict[int, BaseModel]
+    ids: List[int]  # sorted primary keys
+    loaded_at: float
+
+
+class Catalog:
+    def __init__(self, name: str, model, schema):
+        self.name = name
+        self.model = model
+        self.schema = schema
+        self._pk = model.__table__.primary_key.columns.values()[0]
+        # The columns the schema exposes, in table order
+        self.columns = [c for c in model.__table__.columns if c.key in schema.model_fields]
+        # study id (None: main database) -> snapshot, time of the last stamp check
+        self._snapshots: Dict[Optional[str], _Snapshot] = {}
+        self._checked_at: Dict[Optional[str], float] = {}
+        # study id -> (version, result of the reload in progress; None if it failed)
+        self._building: Dict[Optional[str], Tuple[int, asyncio.Future]] = {}
+
+    def _current(self, db: Session, force_check: bool = False) -> _Snapshot:
+        now = time.monotonic()
+        study = current_study()
+        snapshot = self._snapshots.get(study)
+        if (
+            snapshot is not None
+            and not force_check
+            and now - self._checked_at.get(study, 0.0) < settings.CATALOG_CHECK_SECONDS
+        ):
+            return snapshot
+
+        # No lock around the reload: async routers run this on the event loop
+        # through run_sync(), where a blocking lock held across awaited I/O
+        # would deadlock. Concurrent reloads are harmless; the snapshot is
+        # replaced in one assignment.
+        version = db.scalar(
+            select(models.CatalogVersion.version).where(models.CatalogVersion.name == self.name)
+        ) or 0
+        # Another request may have reloaded while the stamp was read
+        snapshot = self._snapshots.get(study)
+        if (
+            snapshot is None
+            or snapshot.version != version
+            or now - snapshot.loaded_at >= settings.CATALOG_TTL_SECONDS
+        ):
+            items = self._load_async(db, study, version) if in_greenlet() else self._build(self._fetch(db))
+            snapshot = _Snapshot(version, items, list(items), now)
+            self._snapshots[study] = snapshot
+        self._checked_at[study] = now
+        return snapshot
+
+    def _fetch(self, db: Session) -> Sequence[Row]:
+        return db.execute(select(*self.columns).order_by(self._pk)).all()
+
+    def _build(self, rows: Sequence[Row]) -> Dict[int, BaseModel]:
+        key = self._pk.key
+        items = {}
+        for row in rows:
+            values = row._mapping
+            items[values[key]] = self.schema.model_validate(values)
+        return items
+
+    def _load_async(self, db: Session, study: Optional[str], version: int) -> Dict[int, BaseModel]:
+        # Inside run_sync(): the fetch is awaited by the driver, the schemas
+        # are built in a worker thread. Requests that need the same version
+        # meanwhile wait for that reload instead of starting their own.
+        loop = asyncio.get_running_loop()
+        building = self._building.get(study)
+        if building is not None and building[0] == version and building[1].get_loop() is loop:
+            items = await_only(asyncio.shield(building[1]))
+            if items is not None:
+                return items
+            # The shared reload failed: try our own
+
+        entry = self._building[study] = (version, loop.create_future())
+        items = None
+        try:
+            rows = self._fetch(db)
+            items = await_only(loop.run_in_executor(None, self._build, rows))
+            return items
+        finally:
+            if self._building.get(study) is entry:
+                del self._building[study]
+            entry[1].set_result(items)
+
+    def get(self, db: Session, key: int) -> Optional[BaseModel]:
+        item = self._current(db).items.get(key)
+        if item is None:
+            item = self._current(db, force_check=True).items.get(key)
+        return item
+
+    def get_many(self, db: Session, keys: Iterable[int]) -> Dict[int, BaseModel]:
+        """
+        Map each existing key to its row; missing keys are left out.
+        """
+        keys = set(keys)
+        items = self._current(db).items
+        if not keys <= items.keys():
+            items = self._current(db, force_check=True).items
+        return {key: items[key] for key in keys if key in items}
+
+    def page(self, db: Session, after: Optional[int], limit: int) -> List[BaseModel]:
+        """
+        Up to `limit` rows with a primary key greater than `after`, in key order.
+        """
+        snapshot = self._current(db)
+        start = bisect_right(snapshot.ids, after) if after is not None else 0
+        return [snapshot.items[key] for key in snapshot.ids[start:start + limit]]
+
+    def invalidate(self, db: Session) -> None:
+        """
+        Bump the version stamp in the caller's transaction and drop this
+        worker's copy.
+        """
+        stmt = upsert(db, models.CatalogVersion).values(name=self.name, version=1)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"version": models.CatalogVersion.version + 1},
+        ))
+        self._snapshots.pop(current_study(), None)
+
+
+questions = Catalog("questions", models.Question, schemas.QuestionOut)
+images = Catalog("images", models.Image, schemas.ImageOut)
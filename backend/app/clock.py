@@ -0,0 +1,84 @@
+# app/clock.py
+
+"""
+Client clock synchronisation and server-time correction of client timestamps.
+
+Tablets time stimulus onset and response with their own high-resolution clock
+(performance.timeOrigin + performance.now(), in milliseconds). The interval
+between the two is exact; to place them on the server's time line the client
+estimates the offset of its clock NTP-style with POST /clock/sync:
+
+    t0  client clock when the request is sent        (client_sent_ms)
+    t1  server clock when the request is handled      (server_received_ms)
+    t2  server clock when the response is produced    (server_sent_ms)
+    t3  client clock when the response arrives
+
+    offset = ((t1 - t0) + (t2 - t3)) / 2    # server minus client
+    rtt    = (t3 - t0) - (t2 - t1)
+
+The offset is off by at most rtt / 2. Queueing on a busy server or network
+inflates the rtt of individual samples, so the client takes several and keeps
+the one with the smallest rtt (estimate_offset()). Ratings then carry the raw
+client timestamps with that clock_offset_ms and clock_rtt_ms, and
+corrected_timing() maps them to server time when the rating is written; the
+server's commit time (created_at) no longer matters for timing analyses.
+RatingCreate only accepts finite readings and offsets up to
+schemas.MAX_CLIENT_MS, so the corrected times are always valid datetimes.
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Rating fields describing the client clock; they are not stored as sent
+CLIENT_TIMING_FIELDS = frozenset({"stimulus_onset_client_ms", "response_client_ms", "clock_offset_ms", "clock_rtt_ms"})
+
+
+def server_time_ms() -> float:
+    """
+    Server wall clock in milliseconds since the Unix epoch.
+    """
+    return time.time_ns() / 1e6
+
+
+def estimate_offset(samples: Iterable[Tuple[float, float, float, float]]) -> Tuple[float, float]:
+    """
+    (offset_ms, rtt_ms) from the (t0, t1, t2, t3) sample with the smallest
+    round trip.
+    """
+    best: Optional[Tuple[float, float]] = None
+    for t0, t1, t2, t3 in samples:
+        rtt = (t3 - t0) - (t2 - t1)
+        if best is None or rtt < best[1]:
+            best = (((t1 - t0) + (t2 - t3)) / 2, rtt)
+    if best is None:
+        raise ValueError("No clock sync samples.")
+    return best
+
+
+def _server_datetime(client_ms: Optional[float], offset_ms: float) -> Optional[datetime]:
+    # Naive UTC, like the CURRENT_TIMESTAMP server defaults
+    if client_ms is None:
+        return None
+    return datetime.fromtimestamp((client_ms + offset_ms) / 1000, timezone.utc).replace(tzinfo=None)
+
+
+def corrected_timing(rating) -> Dict[str, Any]:
+    """
+    Rating columns derived from the client timing fields of a RatingCreate:
+    stimulus onset and response in server time, the offset's error bound
+    and, unless the client sent one, response_time (seconds) from the two
+    client timestamps. Always has the same keys, so rows of one batch can
+    be inserted with a single executemany.
+    """
+    onset, response = rating.stimulus_onset_client_ms, rating.response_client_ms
+    if onset is None and response is None:
+        return {"stimulus_onset_at": None, "responded_at": None, "clock_uncertainty_ms": None}
+    values = {
+        "stimulus_onset_at": _server_datetime(onset, rating.clock_offset_ms),
+        "responded_at": _server_datetime(response, rating.clock_offset_ms),
+        "clock_uncertainty_ms": rating.clock_rtt_ms / 2 if rating.clock_rtt_ms is not None else None,
+    }
+    if rating.response_time is None and onset is not None and response is not None:
+        values["response_time"] = (response - onset) / 1000
+    return values
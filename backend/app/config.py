@@ -2,8 +2,65 @@
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
+    # Any SQLAlchemy URL; SQLite-specific tuning is skipped for server databases
     SQLITE_URL: str = "sqlite:///./mydatabase.db"
+
+    # SQLite connect-time pragmas
+    SQLITE_JOURNAL_MODE: str = "WAL"  # readers no longer block behind writers
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # durable with WAL, far fewer fsyncs than FULL
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # wait for the write lock instead of failing
+    SQLITE_CACHE_SIZE: int = -64000  # negative = KiB, i.e. 64 MiB page cache per connection
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MiB memory-mapped I/O
+
+    # Stimulus images and their resized/re-encoded display derivatives
+    IMAGE_DIR: str = "backend/images"
+    IMAGE_CACHE_DIR: str = "backend/cache/derivatives"
+    IMAGE_CACHE_MAX_BYTES: int = 1 << 30  # 1 GiB, least recently used evicted first
+
+    # Questions/images catalog cache: stamp re-check interval and maximum age
+    CATALOG_CHECK_SECONDS: float = 1.0
+    CATALOG_TTL_SECONDS: float = 300.0
+
+    # Request/query instrumentation (/metrics). Every request is timed; the
+    # sampled fraction also has its SQL statements counted and timed.
+    METRICS_ENABLED: bool = True
+    METRICS_SAMPLE_RATE: float = 1.0
+    SLOW_QUERY_MS: float = 100.0
+    SERVER_TIMING: bool = False  # add a Server-Timing header to sampled responses
+
+    # Per-study databases (app/studies.py); engines are kept per worker process
+    STUDY_DB_DIR: str = "backend/studies"
+    STUDY_MAX_OPEN: int = 8  # idle engines beyond this are closed, least recently used first
+    STUDY_IDLE_SECONDS: float = 300.0
+    STUDY_CHECK_SECONDS: float = 1.0  # status/location re-check interval
+
+    # Live operator feed (app/feed.py)
+    FEED_MAX_PENDING: int = 1000  # undelivered events per subscriber before the oldest are dropped
+    FEED_KEEPALIVE_SECONDS: float = 15.0
+
+    # Write-behind ratings (app/write_behind.py): POST /ratings/ is acknowledged
+    # once in a local log and group-committed in the background
+    WRITE_BEHIND: bool = False
+    WRITE_BEHIND_DIR: str = "backend/wal"
+    WRITE_BEHIND_INTERVAL_MS: float = 5.0
+    WRITE_BEHIND_MAX_ROWS: int = 500  # commit at once when this many are waiting
+    WRITE_BEHIND_SEGMENT_BYTES: int = 4 << 20
+
+    # Inter-rater reliability jobs (app/reliability.py)
+    RELIABILITY_WORKERS: int = 2  # job threads per worker process
+    RELIABILITY_CHUNK_ROWS: int = 50000  # ratings fetched per round trip
+    RELIABILITY_MIN_CORRELATION: float = 0.7  # vs. the leave-one-out MOS
+    RELIABILITY_MIN_IMAGES: int = 5  # images needed before a correlation can flag a subject
+    RELIABILITY_MAX_REPEAT_STD: float = 0.2  # fraction of the question's scale range
+
+    # Connection pool (per worker process)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
     SECRET_KEY: str = "ANY_SECRET_KEY"  # only if needed for other features
+    # Apply pending migrations at startup instead of only checking the version
+    # (development convenience; run `python -m backend.app.migrations upgrade` in production)
+    AUTO_MIGRATE: bool = False
 
     class Config:
         env_file = ".env"  # optional
@@ -0,0 +1,156 @@
+# app/counterbalance.py
+
+"""
+Server-side presentation order generation for sessions.
+
+Orders are reproducible: the same spec, seed, subject and Latin-square row
+always produce the same playlist, so a session can be regenerated for audit.
+
+Strategies:
+    fixed         image_ids in the given order
+    random        seeded shuffle per subject
+    latin_square  one row of a balanced Latin square (Williams design) over
+                  image_ids, so every image appears in every position and
+                  follows every other image equally often across a cohort.
+                  Rows are handed out in turn per design (see design_key()
+                  and routers/playlists.py) rather than derived from subject
+                  ids, which are rarely contiguous.
+
+Source separation (no_repeat_source) reorders a finished order, which would
+undo the carry-over balance of a Latin square; latin_square orders are kept
+as they are, and asking to separate explicit sources in one is an error.
+"""
+
+import hashlib
+import random
+from collections import Counter
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+STRATEGIES = ("fixed", "random", "latin_square")
+
+
+def williams_row(n: int, row: int) -> List[int]:
+    """
+    Row `row` of a balanced Latin square over n conditions.
+
+    For odd n the design needs 2n rows; rows n..2n-1 are the mirrored rows.
+    """
+    if n == 0:
+        return []
+    # First row: 0, 1, n-1, 2, n-2, ...
+    first, low, high = [0], 1, n - 1
+    while len(first) < n:
+        first.append(low)
+        low += 1
+        if len(first) < n:
+            first.append(high)
+            high -= 1
+    rows = n if n % 2 == 0 else 2 * n
+    row %= rows
+    order = [(c + row) % n for c in first]
+    return order[::-1] if row >= n else order
+
+
+def separate_sources(order: Sequence[int], source_of: Callable[[int], Hashable]) -> List[int]:
+    """
+    Reorder as little as possible so no two consecutive items share a source.
+
+    Walks the order and takes the first remaining item whose source differs
+    from the previous one, except when the most frequent remaining source
+    must be placed now to keep the rest feasible.
+    Raises ValueError if one source makes up more than half of the items.
+    """
+    counts = Counter(source_of(i) for i in order)
+    if counts and counts.most_common(1)[0][1] > (len(order) + 1) // 2:
+        raise ValueError("Too many images share one source to avoid back-to-back repeats.")
+
+    remaining = list(order)
+    result: List[int] = []
+    prev: Optional[Hashable] = None
+    while remaining:
+        dominant, dominant_count = counts.most_common(1)[0]
+        if 2 * dominant_count > len(remaining):
+            pick = next(i for i, item in enumerate(remaining) if source_of(item) == dominant)
+        else:
+            pick = next(i for i, item in enumerate(remaining) if source_of(item) != prev)
+        item = remaining.pop(pick)
+        prev = source_of(item)
+        counts[prev] -= 1
+        if not counts[prev]:
+            del counts[prev]
+        result.append(item)
+    return result
+
+
+def interleave_training(test: List[int], training: List[int], every: Optional[int]) -> List[Tuple[int, bool]]:
+    """
+    Merge training items into the test order as (image_id, is_training) pairs.
+
+    every=None puts all training items first (warm-up); otherwise one training
+    item is inserted after every `every` test items until they run out.
+    """
+    if not every:
+        return [(i, True) for i in training] + [(i, False) for i in test]
+
+    merged: List[Tuple[int, bool]] = []
+    pending = list(training)
+    for position, image_id in enumerate(test, start=1):
+        merged.append((image_id, False))
+        if pending and position % every == 0:
+            merged.append((pending.pop(0), True))
+    merged.extend((i, True) for i in pending)
+    return merged
+
+
+def design_key(image_ids: Sequence[int], session_type: str) -> str:
+    """
+    Name of the Latin-square design of a playlist: sessions of one type over
+    the same ordered image_ids share a row counter.
+    """
+    digest = hashlib.sha256(",".join(map(str, image_ids)).encode()).hexdigest()[:32]
+    return f"{session_type.lower()}:{len(image_ids)}:{digest}"
+
+
+def build_order(
+    image_ids: Sequence[int],
+    *,
+    strategy: str,
+    seed: int,
+    subject_id: int,
+    session_type: str,
+    row: int = 0,
+    sources: Optional[Dict[int, str]] = None,
+    no_repeat_source: bool = True,
+    training_image_ids: Sequence[int] = (),
+    training_every: Optional[int] = None,
+) -> List[Tuple[int, bool]]:
+    """
+    Presentation order for one session as (image_id, is_training) pairs.
+
+    `row` selects the Latin-square row (taken modulo the square's size); it
+    is never reordered for source separation. In a "training" session every
+    item is a training item; otherwise training_image_ids are interleaved
+    with the test items.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}; expected one of {STRATEGIES}.")
+    if strategy == "latin_square" and no_repeat_source and sources:
+        raise ValueError("Source separation would break the Latin square's balance; set no_repeat_source=false.")
+
+    rng = random.Random(f"{seed}:{subject_id}:{session_type}")
+    if strategy == "random":
+        test = list(image_ids)
+        rng.shuffle(test)
+    elif strategy == "latin_square":
+        test = [image_ids[c] for c in williams_row(len(image_ids), row)]
+    else:
+        test = list(image_ids)
+
+    if no_repeat_source and strategy != "latin_square":
+        # Without an explicit source, an image is its own source content
+        source_map = sources or {}
+        test = separate_sources(test, lambda i: source_map.get(i, i))
+
+    if session_type.lower() == "training":
+        return [(i, True) for i in list(training_image_ids) + test]
+    return interleave_training(test, list(training_image_ids), training_every)
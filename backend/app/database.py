@@ -1,18 +1,340 @@
 # app/database.py
 
-from sqlalchemy import create_engine
+import asyncio
+import os
+import re
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.util import await_only
+from . import instrumentation
 from .config import settings
 
-# For SQLite, include connect_args={"check_same_thread": False}
-engine = create_engine(
-    settings.SQLITE_URL,
-    connect_args={"check_same_thread": False}, 
-    echo=False
-)
+
+def sqlite_pragmas() -> Dict[str, Any]:
+    """
+    Connect-time pragmas applied to every SQLite connection, from settings.
+    """
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+    }
+
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _engine_options(url: URL, pragmas: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Engine keyword arguments and connect-time pragmas for the backend in url.
+    """
+    options: Dict[str, Any] = {"echo": False}
+
+    if url.get_backend_name() == "sqlite":
+        pragmas = sqlite_pragmas() if pragmas is None else pragmas
+        # For SQLite, include connect_args={"check_same_thread": False}
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # An in-memory database only exists on its one connection
+            options["poolclass"] = StaticPool
+            return options, pragmas
+    else:
+        pragmas = {}
+        options["pool_pre_ping"] = True
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    return options, pragmas
+
+
+def _install_pragmas(sync_engine: Engine, pragmas: Dict[str, Any]) -> None:
+    if not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers only queue within the process
+    fcntl = None
+
+_WRITE_STATEMENT = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+class _WriteGate:
+    """
+    Queue for the write lock of one SQLite file. SQLite's busy handler polls
+    with growing sleeps (up to 100 ms) and no ordering, so under load a writer
+    that started waiting early keeps losing the lock to newcomers until
+    busy_timeout expires. Writers of this process line up in FIFO order
+    (a threading.Lock for sync engines, an asyncio.Lock per event loop for
+    async ones) and the head of each line takes an flock() on <database>-lock
+    (polled every few milliseconds, without blocking a thread), so only the
+    turn holders of each process meet in SQLite.
+
+    The gate only orders writers, SQLite's locking still guarantees
+    correctness: once a writer has waited busy_timeout in total it stops
+    waiting for its turn and falls back to the busy handler, so a process
+    holding the file lock for long (a migration, an export) cannot stall the
+    others.
+    """
+
+    # Sleeps between attempts at the file lock; the last one repeats
+    POLL_DELAYS = (0.0005, 0.001, 0.002, 0.005)
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path + "-lock"
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._loop_turns: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[asyncio.Lock, Optional[int]]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _open(self) -> Optional[int]:
+        # flock() locks belong to the open file, so each line needs its own
+        if fcntl is None:
+            return None
+        try:
+            return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _try_flock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _flock(self, fd: int, deadline: float) -> bool:
+        attempt = 0
+        while not self._try_flock(fd):
+            delay = self.POLL_DELAYS[min(attempt, len(self.POLL_DELAYS) - 1)]
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+            attempt += 1
+        return True
+
+    async def _flock_async(self, fd: int, deadline: float) -> bool:
+        attempt = 0
+        while not self._try_flock(fd):
+            delay = self.POLL_DELAYS[min(attempt, len(self.POLL_DELAYS) - 1)]
+            if time.monotonic() + delay > deadline:
+                return False
+            await asyncio.sleep(delay)
+            attempt += 1
+        return True
+
+    def enter(self, info: Dict[str, Any], is_async: bool) -> None:
+        if "write_gate" in info:
+            return
+        deadline = time.monotonic() + self.timeout
+        if not is_async:
+            if not self._lock.acquire(timeout=self.timeout):
+                return
+            if self._fd is None:
+                self._fd = self._open()
+            if self._fd is not None and not self._flock(self._fd, deadline):
+                self._lock.release()
+                return
+            info["write_gate"] = (self._lock, self._fd, None)
+            return
+
+        # Async drivers run this inside SQLAlchemy's greenlet on the loop
+        loop = asyncio.get_running_loop()
+        turn = self._loop_turns.get(loop)
+        if turn is None:
+            turn = self._loop_turns[loop] = (asyncio.Lock(), self._open())
+            if turn[1] is not None:
+                weakref.finalize(loop, os.close, turn[1])
+        lock, fd = turn
+        try:
+            await_only(asyncio.wait_for(lock.acquire(), self.timeout))
+        except asyncio.TimeoutError:
+            return
+        if fd is not None:
+            try:
+                locked = await_only(self._flock_async(fd, deadline))
+            except BaseException:
+                lock.release()
+                raise
+            if not locked:
+                lock.release()
+                return
+        info["write_gate"] = (lock, fd, loop)
+
+    @staticmethod
+    def leave(info: Dict[str, Any]) -> None:
+        held = info.pop("write_gate", None)
+        if held is None:
+            return
+        lock, fd, loop = held
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        if loop is None:
+            lock.release()
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            lock.release()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(lock.release)
+
+
+_write_gates: Dict[str, _WriteGate] = {}
+_write_gates_lock = threading.Lock()
+
+
+def _write_gate(database: str) -> _WriteGate:
+    path = os.path.abspath(database)
+    with _write_gates_lock:
+        gate = _write_gates.get(path)
+        if gate is None:
+            gate = _write_gates[path] = _WriteGate(path, settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        return gate
+
+
+def _install_transactions(sync_engine: Engine) -> None:
+    # pysqlite (and aiosqlite) run statements outside a transaction until the
+    # first INSERT/UPDATE/DELETE, then issue BEGIN with this mode. IMMEDIATE
+    # takes the write lock right there, waiting up to busy_timeout for it;
+    # the default deferred BEGIN lets a transaction read first and then fail
+    # at once with "database is locked" when it has to upgrade to a writer
+    # after another connection committed. Reads before the first write (e.g.
+    # validation) hold no lock and no snapshot.
+    @event.listens_for(sync_engine, "connect")
+    def _begin_immediate(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = "IMMEDIATE"
+
+    database = sync_engine.url.database
+    if database in (None, "", ":memory:"):
+        return
+    gate = _write_gate(database)
+    is_async = sync_engine.dialect.is_async
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _wait_for_writer_turn(conn, cursor, statement, parameters, context, executemany):
+        if _WRITE_STATEMENT.match(statement):
+            gate.enter(conn.info, is_async)
+
+    @event.listens_for(sync_engine, "commit")
+    @event.listens_for(sync_engine, "rollback")
+    def _end_writer_turn(conn):
+        gate.leave(conn.info)
+
+    # Connections returned or discarded without an explicit commit/rollback
+    @event.listens_for(sync_engine, "checkin")
+    def _end_writer_turn_on_checkin(dbapi_connection, connection_record):
+        if connection_record is not None:
+            gate.leave(connection_record.info)
+
+    @event.listens_for(sync_engine, "invalidate")
+    def _end_writer_turn_on_invalidate(dbapi_connection, connection_record, exception):
+        gate.leave(connection_record.info)
+
+
+def _install_query_timing(sync_engine: Engine) -> None:
+    # Attribute statement time to the current request (see instrumentation)
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        instrumentation.query_started(conn.info)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        instrumentation.query_finished(conn.info, statement)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _query_failed(context):
+        if context.connection is not None:
+            instrumentation.query_failed(context.connection.info)
+
+
+def make_engine(url: str, pragmas: Optional[Dict[str, Any]] = None, **kwargs) -> Engine:
+    """
+    Create an engine tuned for the backend named in url.
+
+    SQLite engines get the pragmas (default: sqlite_pragmas()) on every new
+    connection and a thread-safe connection pool; server databases (e.g.
+    postgresql://...) only get the pool settings.
+    """
+    url = make_url(url)
+    options, pragmas = _engine_options(url, pragmas)
+    options.update(kwargs)
+    new_engine = create_engine(url, **options)
+    _install_pragmas(new_engine, pragmas)
+    if url.get_backend_name() == "sqlite":
+        _install_transactions(new_engine)
+    _install_query_timing(new_engine)
+    return new_engine
+
+
+def make_async_engine(url: str, pragmas: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncEngine:
+    """
+    Async counterpart of make_engine(). A plain URL such as sqlite:///... is
+    switched to the matching async driver (sqlite+aiosqlite, ...).
+    """
+    url = make_url(url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    options, pragmas = _engine_options(url, pragmas)
+    options.update(kwargs)
+    new_engine = create_async_engine(url, **options)
+    _install_pragmas(new_engine.sync_engine, pragmas)
+    if url.get_backend_name() == "sqlite":
+        _install_transactions(new_engine.sync_engine)
+    _install_query_timing(new_engine.sync_engine)
+    return new_engine
+
+
+def upsert(db, model):
+    """
+    INSERT into `model` with the on_conflict_do_nothing()/on_conflict_do_update()
+    clauses of the session's or connection's backend (SQLite or PostgreSQL).
+    """
+    bind = db.get_bind() if hasattr(db, "get_bind") else db
+    dialect = postgresql if bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+engine = make_engine(settings.SQLITE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for the hot routers. Objects stay loaded after commit so
+# response serialization never triggers I/O outside the event loop.
+async_engine = make_async_engine(settings.SQLITE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 def get_db():
@@ -24,3 +346,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """
+    FastAPI dependency that yields an async database session.
+    """
+    db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -0,0 +1,235 @@
+# app/derivatives.py
+
+"""
+On-disk, content-addressed cache of display derivatives of stimulus images.
+
+A derivative is a source image resized to a display width and re-encoded.
+Its key is the SHA-256 of the source content and the encoding parameters, so
+the same key always names the same bytes: it doubles as a strong ETag and lets
+/images/derivatives/{name} be served as immutable. Encoding is lossless by
+default (WebP/PNG) so the stimuli shown in the quality study are unchanged
+apart from the resize; lossy output needs an explicit quality.
+
+The cache directory is bounded by settings.IMAGE_CACHE_MAX_BYTES and evicts
+the least recently used files (cache hits refresh the file's mtime).
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from PIL import Image as PILImage, UnidentifiedImageError
+
+from .config import settings
+
+# Bump when the encoding pipeline changes so old derivatives are not reused
+PIPELINE_VERSION = 2
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+# Locks serializing encodes of the same derivative (see _lock_for)
+KEY_LOCK_STRIPES = 64
+
+DERIVATIVE_NAME = re.compile(r"^[0-9a-f]{64}\.(webp|png|jpeg)$")
+
+
+class UnreadableImage(Exception):
+    """
+    The source file exists but cannot be decoded (not an image, truncated or
+    corrupt).
+    """
+
+
+@dataclass(frozen=True)
+class Derivative:
+    key: str
+    path: str
+    media_type: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+_source_hashes: Dict[str, Tuple[int, int, str]] = {}
+# Encodes of the same key are serialized by one of a fixed set of locks, so
+# the lock table does not grow with every derivative ever requested
+_key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+_cache_guard = threading.Lock()
+_cache_bytes: Optional[int] = None
+
+
+def source_path(file_name: str, file_path: Optional[str] = None) -> str:
+    """
+    Location of an Image row's source file.
+    """
+    return file_path or os.path.join(settings.IMAGE_DIR, file_name)
+
+
+def source_hash(path: str) -> str:
+    """
+    SHA-256 of a source file, memoized on (mtime, size).
+    """
+    st = os.stat(path)
+    cached = _source_hashes.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    _source_hashes[path] = (st.st_mtime_ns, st.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def derivative_key(content_hash: str, width: Optional[int], fmt: str, quality: Optional[int]) -> str:
+    params = f"v{PIPELINE_VERSION}:{content_hash}:{width or 0}:{fmt}:{quality if quality is not None else 'lossless'}"
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+def cached_path(name: str) -> Optional[str]:
+    """
+    Path of a cached derivative by file name, or None if absent/invalid.
+    """
+    if not DERIVATIVE_NAME.match(name):
+        return None
+    path = os.path.join(settings.IMAGE_CACHE_DIR, name)
+    if not os.path.isfile(path):
+        return None
+    _touch(path)
+    return path
+
+
+def get_derivative(source_path: str, width: Optional[int] = None, fmt: str = "webp",
+                   quality: Optional[int] = None) -> Derivative:
+    """
+    Return the derivative of source_path, encoding and caching it on a miss.
+
+    Raises ValueError for unsupported parameters, FileNotFoundError if the
+    source image is missing and UnreadableImage if it cannot be decoded.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {sorted(FORMATS)}.")
+    if fmt == "jpeg" and quality is None:
+        raise ValueError("JPEG is lossy; an explicit quality is required.")
+    if fmt == "png" and quality is not None:
+        raise ValueError("PNG is lossless; quality does not apply.")
+    if quality is not None and not 1 <= quality <= 100:
+        raise ValueError("quality must be between 1 and 100.")
+    if width is not None and width <= 0:
+        raise ValueError("width must be positive.")
+
+    key = derivative_key(source_hash(source_path), width, fmt, quality)
+    pil_format, media_type = FORMATS[fmt]
+    path = os.path.join(settings.IMAGE_CACHE_DIR, f"{key}.{fmt}")
+
+    with _lock_for(key):
+        if os.path.isfile(path):
+            _touch(path)
+        else:
+            _encode(source_path, path, width, pil_format, quality)
+            _account(os.path.getsize(path))
+    return Derivative(key=key, path=path, media_type=media_type, size=os.path.getsize(path))
+
+
+def _encode(source_path: str, path: str, width: Optional[int], pil_format: str, quality: Optional[int]) -> None:
+    try:
+        img = PILImage.open(source_path)
+    except FileNotFoundError:
+        raise
+    except (OSError, UnidentifiedImageError, PILImage.DecompressionBombError) as e:
+        raise _unreadable(source_path, e) from e
+    with img:
+        try:
+            img.load()
+        except (OSError, PILImage.DecompressionBombError) as e:
+            raise _unreadable(source_path, e) from e
+        if width and img.width > width:
+            # Never upscale; keep the aspect ratio
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), PILImage.Resampling.LANCZOS)
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        options = {}
+        if pil_format == "WEBP":
+            # In lossless mode quality/method only set compression effort;
+            # method 6 is ~30x slower than 4 for <1% smaller files
+            options = {"lossless": True, "quality": 80, "method": 4} if quality is None else {"quality": quality}
+        elif pil_format == "JPEG":
+            options = {"quality": quality, "subsampling": 0}
+        elif pil_format == "PNG":
+            options = {"optimize": True}
+
+        os.makedirs(settings.IMAGE_CACHE_DIR, exist_ok=True)
+        # Write to a temporary file and rename so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=settings.IMAGE_CACHE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, pil_format, **options)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _unreadable(source_path: str, error: Exception) -> UnreadableImage:
+    return UnreadableImage(f"Cannot decode {os.path.basename(source_path)}: {error}")
+
+
+def _lock_for(key: str) -> threading.Lock:
+    # Keys are hex digests: their leading digits are already uniform
+    return _key_locks[int(key[:8], 16) % KEY_LOCK_STRIPES]
+
+
+def _touch(path: str) -> None:
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _scan_cache() -> list:
+    entries = []
+    with os.scandir(settings.IMAGE_CACHE_DIR) as it:
+        for e in it:
+            if e.is_file() and DERIVATIVE_NAME.match(e.name):
+                st = e.stat()
+                entries.append((st.st_mtime_ns, st.st_size, e.path))
+    return entries
+
+
+def _account(added: int) -> None:
+    """
+    Track the cache size and evict least recently used files over the limit.
+    """
+    global _cache_bytes
+    with _cache_guard:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _scan_cache())
+        else:
+            _cache_bytes += added
+        if _cache_bytes <= settings.IMAGE_CACHE_MAX_BYTES:
+            return
+
+        # Rescan (other workers share the directory) and drop the oldest files
+        entries = sorted(_scan_cache())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:
+            if total <= settings.IMAGE_CACHE_MAX_BYTES:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        _cache_bytes = total
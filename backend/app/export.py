@@ -0,0 +1,229 @@
+# app/export.py
+
+"""
+Streaming export of ratings joined with their session image, session, subject,
+image and question.
+
+Rows are fetched in server-side batches (yield_per) and encoded batch by
+batch, so memory stays flat regardless of the number of ratings. CSV needs
+nothing extra; Parquet and Arrow IPC output need pyarrow.
+
+    python -m backend.app.export --format csv --out ratings.csv [--study s1] [--session-id 3] [--since 2025-01-01]
+"""
+
+import argparse
+import csv
+import io
+import sys
+from datetime import datetime
+from typing import Iterator, List, NamedTuple, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+
+from . import models
+from . import studies
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for parquet/arrow output
+    pa = None
+    pq = None
+
+FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+DEFAULT_BATCH_SIZE = 5000
+
+R, SI, S, SUB, IMG, Q = (
+    models.Rating, models.SessionImage, models.Session,
+    models.Subject, models.Image, models.Question,
+)
+
+# (output name, column, arrow type name)
+EXPORT_COLUMNS = [
+    ("rating_id", R.rating_id, "int64"),
+    ("rating_value", R.rating_value, "float64"),
+    ("text_answer", R.text_answer, "string"),
+    ("response_time", R.response_time, "float64"),
+    ("rated_at", R.created_at, "timestamp"),
+    ("stimulus_onset_at", R.stimulus_onset_at, "timestamp"),
+    ("responded_at", R.responded_at, "timestamp"),
+    ("clock_uncertainty_ms", R.clock_uncertainty_ms, "float64"),
+    ("session_image_id", SI.session_image_id, "int64"),
+    ("display_order", SI.display_order, "int64"),
+    ("is_training", SI.is_training, "bool"),
+    ("session_id", S.session_id, "int64"),
+    ("session_type", S.session_type, "string"),
+    ("session_start", S.start_time, "timestamp"),
+    ("subject_id", SUB.subject_id, "int64"),
+    ("subject_name", SUB.name, "string"),
+    ("subject_age", SUB.age, "int64"),
+    ("subject_gender", SUB.gender, "string"),
+    ("image_id", IMG.image_id, "int64"),
+    ("file_name", IMG.file_name, "string"),
+    ("question_id", Q.question_id, "int64"),
+    ("question_text", Q.question_text, "string"),
+    ("question_type", Q.question_type, "string"),
+]
+COLUMN_NAMES = [name for name, _, _ in EXPORT_COLUMNS]
+
+
+class ExportFilters(NamedTuple):
+    session_id: Optional[int] = None
+    subject_id: Optional[int] = None
+    question_id: Optional[int] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+
+def export_statement(filters: ExportFilters) -> Select:
+    stmt = (
+        select(*(col.label(name) for name, col, _ in EXPORT_COLUMNS))
+        .join(SI, R.session_image_id == SI.session_image_id)
+        .join(S, SI.session_id == S.session_id)
+        .join(SUB, S.subject_id == SUB.subject_id)
+        .join(IMG, SI.image_id == IMG.image_id)
+        .join(Q, R.question_id == Q.question_id)
+        .order_by(R.rating_id)
+    )
+    if filters.session_id is not None:
+        stmt = stmt.where(S.session_id == filters.session_id)
+    if filters.subject_id is not None:
+        stmt = stmt.where(SUB.subject_id == filters.subject_id)
+    if filters.question_id is not None:
+        stmt = stmt.where(R.question_id == filters.question_id)
+    if filters.since is not None:
+        stmt = stmt.where(R.created_at >= filters.since)
+    if filters.until is not None:
+        stmt = stmt.where(R.created_at < filters.until)
+    return stmt
+
+
+def iter_batches(db: Session, filters: ExportFilters, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[tuple]]:
+    result = db.execute(export_statement(filters).execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield [tuple(row) for row in partition]
+
+
+def _csv_chunks(batches: Iterator[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMN_NAMES)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _arrow_schema():
+    types = {
+        "int64": pa.int64(), "float64": pa.float64(), "string": pa.string(),
+        "bool": pa.bool_(), "timestamp": pa.timestamp("us"),
+    }
+    return pa.schema([(name, types[kind]) for name, _, kind in EXPORT_COLUMNS])
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that hands written bytes back to the generator.
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _arrow_chunks(batches: Iterator[List[tuple]], fmt: str) -> Iterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+        write = writer.write_table
+        to_arrow = pa.Table.from_pylist
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+        to_arrow = pa.RecordBatch.from_pylist
+
+    for batch in batches:
+        write(to_arrow([dict(zip(COLUMN_NAMES, row)) for row in batch], schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(fmt: str, filters: ExportFilters, batch_size: int = DEFAULT_BATCH_SIZE,
+                  study: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Encoded export in chunks; owns its database session (on the study's
+    database, default the main one) for the whole stream.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {sorted(FORMATS)}.")
+    if fmt != "csv" and pa is None:
+        raise ValueError(f"{fmt} export requires pyarrow to be installed.")
+
+    def generate() -> Iterator[bytes]:
+        with studies.session(study) as db:
+            batches = iter_batches(db, filters, batch_size)
+            yield from _csv_chunks(batches) if fmt == "csv" else _arrow_chunks(batches, fmt)
+
+    return generate()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export joined ratings.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--out", help="output file (default: stdout)")
+    parser.add_argument("--study", help="export a study's database instead of the main one")
+    parser.add_argument("--session-id", type=int)
+    parser.add_argument("--subject-id", type=int)
+    parser.add_argument("--question-id", type=int)
+    parser.add_argument("--since", type=datetime.fromisoformat, help="ratings created at or after (ISO date/time)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="ratings created before (ISO date/time)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    filters = ExportFilters(args.session_id, args.subject_id, args.question_id, args.since, args.until)
+    if args.study is not None:
+        try:
+            with studies.session(args.study):
+                pass
+        except studies.StudyNotFound:
+            parser.error(f"unknown study {args.study!r}")
+    try:
+        chunks = stream_export(args.format, filters, args.batch_size, args.study)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
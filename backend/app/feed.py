@@ -0,0 +1,188 @@
+# app/feed.py
+
+"""
+In-process publish/subscribe feed of experiment activity for the operator
+dashboard (served over WebSocket and Server-Sent Events by routers/feed.py).
+
+Routers publish after their transaction commits:
+
+    ratings.created     new ratings (create, batch and offline sync)
+    session.started     a session was created
+    session.completed   a session was completed
+    session.progress    stimuli newly rated in a session since the last event
+                        (rated_images_delta) and the furthest position rated
+
+so a dashboard loads GET /sessions/active once and then applies the events
+instead of polling. Publishing never blocks and costs nothing without
+subscribers. Each subscriber has a bounded buffer: pending session.progress
+events of one session are merged into one, and when a slow consumer's buffer
+is full its oldest events are dropped and a feed.overflow event (with the
+number dropped) tells it to reload over REST.
+
+Subscribers only see events of their own study and of the worker process
+that serves them.
+"""
+
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from . import schemas
+from .config import settings
+from .serialization import encode
+from .studies import current_study
+
+
+@dataclass
+class Event:
+    type: str
+    data: Dict[str, Any]
+    study: Optional[str] = None
+    session_id: Optional[int] = None
+    key: Optional[tuple] = None  # pending events with the same key are merged
+
+    def merge(self, newer: "Event") -> "Event":
+        data = dict(newer.data)
+        data["rated_images_delta"] += self.data["rated_images_delta"]
+        data["last_image_index"] = max(data["last_image_index"], self.data["last_image_index"])
+        return Event(newer.type, data, newer.study, newer.session_id, newer.key)
+
+    def encoded(self) -> bytes:
+        return encode({"type": self.type, **self.data})
+
+
+class Subscription:
+    def __init__(self, study: Optional[str], session_id: Optional[int], max_pending: int):
+        self.study = study
+        self.session_id = session_id
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._pending: "OrderedDict[Any, Event]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def matches(self, event: Event) -> bool:
+        return event.study == self.study and self.session_id in (None, event.session_id)
+
+    def put(self, event: Event) -> None:
+        """
+        Queue an event; called from the event loop or from worker threads.
+        """
+        with self._lock:
+            previous = self._pending.get(event.key) if event.key is not None else None
+            if previous is not None:
+                self._pending[event.key] = previous.merge(event)
+            else:
+                if len(self._pending) >= self.max_pending:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                self._pending[event.key if event.key is not None else next(self._seq)] = event
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._ready.set()
+        else:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def next_batch(self) -> List[Event]:
+        """
+        Wait for and take every pending event, oldest first.
+        """
+        while True:
+            await self._ready.wait()
+            with self._lock:
+                self._ready.clear()
+                events = list(self._pending.values())
+                self._pending.clear()
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                events.insert(0, Event("feed.overflow", {"dropped": dropped}, self.study))
+            if events:
+                return events
+
+
+class Broker:
+    def __init__(self):
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def listening(self) -> bool:
+        return bool(self._subscriptions)
+
+    def publish(self, events: Iterable[Event]) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for event in events:
+            for subscription in subscriptions:
+                if subscription.matches(event):
+                    subscription.put(event)
+
+    @contextmanager
+    def subscribe(self, study: Optional[str], session_id: Optional[int] = None) -> Iterator[Subscription]:
+        subscription = Subscription(study, session_id, settings.FEED_MAX_PENDING)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions.discard(subscription)
+
+
+broker = Broker()
+
+
+# ---------------------
+# PUBLISHERS
+# ---------------------
+def ratings_created(ratings: Iterable[Dict[str, Any]], session_ids: Dict[int, int]) -> None:
+    """
+    Publish committed ratings (RatingOut-shaped dicts), one event per session;
+    session_ids maps session_image_id -> session_id.
+    """
+    if not broker.listening():
+        return
+    study = current_study()
+    by_session: Dict[int, List[Dict[str, Any]]] = {}
+    for rating in ratings:
+        by_session.setdefault(session_ids[rating["session_image_id"]], []).append(rating)
+    broker.publish(
+        Event("ratings.created", {"session_id": session_id, "ratings": items}, study, session_id)
+        for session_id, items in by_session.items()
+    )
+
+
+def progress(newly_rated: Dict[int, int], positions: Dict[int, int]) -> None:
+    """
+    Publish progress of sessions that gained rated stimuli (session_id -> count)
+    with the furthest display_order rated (session_id -> position).
+    """
+    if not broker.listening():
+        return
+    study = current_study()
+    broker.publish(
+        Event(
+            "session.progress",
+            {"session_id": session_id, "rated_images_delta": count, "last_image_index": positions.get(session_id, 0)},
+            study, session_id, ("session.progress", session_id),
+        )
+        for session_id, count in newly_rated.items() if count
+    )
+
+
+def session_changed(event_type: str, session) -> None:
+    """
+    Publish session.started or session.completed for a committed Session.
+    """
+    if not broker.listening():
+        return
+    data = {"session": schemas.SessionOut.model_validate(session).model_dump()}
+    broker.publish([Event(event_type, data, current_study(), session.session_id)])
@@ -0,0 +1,288 @@
+# app/ingest.py
+
+"""
+Incremental ingestion of a stimulus directory tree into the images table.
+
+The tree is walked in the calling process (one stat() per file). Files whose
+(mtime, size) match their Image row are skipped without being opened; the
+rest are inspected in a process pool: SHA-256 content hash, dimensions,
+format, file size and, optionally, no-reference quality features. Results are
+written back in batches with one executemany INSERT and one executemany
+UPDATE each, committed together with a catalog version bump so every worker
+sees the new rows. Re-ingesting an unchanged dataset therefore costs a
+directory walk and a single SELECT.
+
+Rows are matched on their source path (derivatives.source_path()). Files
+named {image_id}.jpg directly in settings.IMAGE_DIR keep that image_id, as
+assign_images expects. Rows whose file has disappeared are counted but kept,
+since ratings reference them.
+
+    python -m backend.app.ingest [ROOT] [--study s1] [--workers 8] [--features] [--dry-run]
+"""
+
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image as PILImage, UnidentifiedImageError
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import catalog, models, schemas, studies
+from .config import settings
+from .derivatives import source_hash, source_path
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".gif"}
+FEATURE_SIZE = 512  # features are measured on the image downscaled to this many pixels
+DEFAULT_BATCH_SIZE = 500
+ID_FILE_NAME = re.compile(r"^(\d+)\.jpg$")
+
+METADATA_FIELDS = ("content_hash", "width", "height", "format", "file_size", "file_mtime_ns")
+FEATURE_FIELDS = ("sharpness", "colorfulness", "brightness", "contrast")
+
+
+class _File(NamedTuple):
+    rel: str  # relative to the ingested root, '/'-separated
+    path: str
+    mtime_ns: int
+    size: int
+
+
+class _Known(NamedTuple):
+    image_id: int
+    mtime_ns: Optional[int]
+    size: Optional[int]
+    content_hash: Optional[str]
+    has_features: bool
+
+
+def _walk(root: str) -> Iterator[_File]:
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                    st = entry.stat()
+                    rel = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                    yield _File(rel, os.path.normpath(entry.path), st.st_mtime_ns, st.st_size)
+
+
+def quality_features(img: PILImage.Image) -> Dict[str, Optional[float]]:
+    """
+    No-reference features of an RGB image: mean luma and RMS contrast (0..1),
+    variance of the Laplacian (sharpness) and the Hasler-Suesstrunk
+    colorfulness metric.
+    """
+    rgb = np.asarray(img, dtype=np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    luma = 0.299 * r + 0.587 * g + 0.114 * b
+    laplacian = (
+        luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:] - 4 * luma[1:-1, 1:-1]
+    )
+    rg = r - g
+    yb = 0.5 * (r + g) - b
+    colorfulness = np.hypot(rg.std(), yb.std()) + 0.3 * np.hypot(rg.mean(), yb.mean())
+    return {
+        "sharpness": float(laplacian.var()) if laplacian.size else None,
+        "colorfulness": float(colorfulness),
+        "brightness": float(luma.mean() / 255),
+        "contrast": float(luma.std() / 255),
+    }
+
+
+def _inspect(path: str, features: bool) -> Optional[Dict[str, Any]]:
+    """
+    Metadata of one file (runs in a pool worker); None if it is not a
+    readable image.
+    """
+    try:
+        st = os.stat(path)
+        with PILImage.open(path) as img:
+            values = {
+                "content_hash": source_hash(path),
+                "width": img.width,
+                "height": img.height,
+                "format": img.format,
+                "file_size": st.st_size,
+                "file_mtime_ns": st.st_mtime_ns,
+            }
+            if features:
+                # JPEG decodes straight to a reduced size
+                img.draft("RGB", (FEATURE_SIZE, FEATURE_SIZE))
+                img = img.convert("RGB")
+                img.thumbnail((FEATURE_SIZE, FEATURE_SIZE))
+                values.update(quality_features(img))
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+    return values
+
+
+def _inspect_task(task) -> Optional[Dict[str, Any]]:
+    return _inspect(*task)
+
+
+def _known_images(db: Session) -> Dict[str, _Known]:
+    """
+    Existing rows by normalized source path (lowest image_id wins).
+    """
+    known: Dict[str, _Known] = {}
+    rows = db.execute(
+        select(
+            models.Image.image_id, models.Image.file_name, models.Image.file_path,
+            models.Image.file_mtime_ns, models.Image.file_size, models.Image.content_hash,
+            models.Image.brightness.is_not(None),
+        ).order_by(models.Image.image_id.desc())
+    )
+    for image_id, file_name, file_path, mtime_ns, size, content_hash, has_features in rows:
+        path = os.path.normpath(source_path(file_name, file_path))
+        known[path] = _Known(image_id, mtime_ns, size, content_hash, has_features)
+    return known
+
+
+def _write(db: Session, new_rows: List[Dict[str, Any]], changed_rows: List[Dict[str, Any]]) -> None:
+    # executemany needs one key set per statement: explicit ids, then the rest
+    for with_id in (True, False):
+        rows = [row for row in new_rows if ("image_id" in row) == with_id]
+        if rows:
+            db.execute(insert(models.Image), rows)
+    if changed_rows:
+        table = models.Image.__table__
+        # Bind names must differ from the column names they set
+        fields = [name for name in changed_rows[0] if name != "_id"]
+        db.execute(
+            update(table)
+            .where(table.c.image_id == bindparam("_id"))
+            .values({name: bindparam(f"_{name}") for name in fields}),
+            [{"_id": row["_id"], **{f"_{name}": row[name] for name in fields}} for row in changed_rows],
+        )
+    catalog.images.invalidate(db)
+    db.commit()
+
+
+def ingest(
+    db: Session,
+    root: Optional[str] = None,
+    workers: Optional[int] = None,
+    features: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dry_run: bool = False,
+) -> schemas.ImageIngestReport:
+    """
+    Bring the Image rows of every image file under root (default
+    settings.IMAGE_DIR) up to date. workers=0 inspects files in this process.
+    """
+    root = os.path.normpath(root or settings.IMAGE_DIR)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"Not a directory: {root}")
+    in_image_dir = os.path.abspath(root) == os.path.abspath(settings.IMAGE_DIR)
+
+    report = schemas.ImageIngestReport()
+    known = _known_images(db)
+
+    todo: List[_File] = []
+    seen = set()
+    for file in _walk(root):
+        report.scanned += 1
+        seen.add(file.path)
+        entry = known.get(file.path)
+        if (
+            entry is not None
+            and (entry.mtime_ns, entry.size) == (file.mtime_ns, file.size)
+            and (entry.has_features or not features)
+        ):
+            report.unchanged += 1
+        else:
+            todo.append(file)
+    prefix = root + os.sep
+    report.missing = sum(1 for path in known if path.startswith(prefix) and path not in seen)
+
+    if not todo or dry_run:
+        # A dry run reports what would be (re)inspected as added/updated
+        for file in todo:
+            if file.path in known:
+                report.updated += 1
+            else:
+                report.added += 1
+        return report
+
+    taken_ids = set(db.scalars(select(models.Image.image_id))) if in_image_dir else set()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    fields = METADATA_FIELDS + (FEATURE_FIELDS if features else ())
+    new_rows: List[Dict[str, Any]] = []
+    changed_rows: List[Dict[str, Any]] = []
+
+    tasks = ((file.path, features) for file in todo)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 0 else None
+    try:
+        results = pool.map(_inspect_task, tasks, chunksize=32) if pool else map(_inspect_task, tasks)
+        for file, values in zip(todo, results):
+            if values is None:
+                report.failed.append(file.rel)
+                continue
+            values = {name: values.get(name) for name in fields}
+            values["ingested_at"] = now
+            entry = known.get(file.path)
+            if entry is None:
+                row = {
+                    "file_name": os.path.basename(file.path),
+                    "file_path": file.path,
+                    "description": file.rel,
+                    **values,
+                }
+                match = ID_FILE_NAME.match(file.rel) if in_image_dir else None
+                if match and int(match.group(1)) not in taken_ids:
+                    row["image_id"] = int(match.group(1))
+                    taken_ids.add(row["image_id"])
+                new_rows.append(row)
+                report.added += 1
+            else:
+                changed_rows.append({"_id": entry.image_id, **values})
+                if entry.content_hash == values["content_hash"]:
+                    report.touched += 1
+                else:
+                    report.updated += 1
+
+            if len(new_rows) + len(changed_rows) >= batch_size:
+                _write(db, new_rows, changed_rows)
+                new_rows, changed_rows = [], []
+        if new_rows or changed_rows:
+            _write(db, new_rows, changed_rows)
+    finally:
+        if pool:
+            pool.shutdown()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest a stimulus directory tree into the images table.")
+    parser.add_argument("root", nargs="?", default=settings.IMAGE_DIR)
+    parser.add_argument("--study", help="ingest into a study's database instead of the main one")
+    parser.add_argument("--workers", type=int, default=None, help="inspection processes (default: CPU count; 0: none)")
+    parser.add_argument("--features", action="store_true", help="also compute no-reference quality features")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+
+    try:
+        with studies.session(args.study) as db:
+            report = ingest(db, args.root, args.workers, args.features, args.batch_size, args.dry_run)
+    except studies.StudyNotFound:
+        parser.error(f"unknown study {args.study!r}")
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    for name, value in report.model_dump().items():
+        if name == "failed":
+            for rel in value:
+                print(f"failed: {rel}")
+            value = len(value)
+        print(f"{name:10} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# app/instrumentation.py
+
+"""
+Per-request timing and database query instrumentation.
+
+TimingMiddleware measures every request (latency histogram and counter per
+method/route/status). For a sampled fraction of requests
+(settings.METRICS_SAMPLE_RATE) it also attributes the SQL statements executed
+on the request's behalf: the engine event hooks installed by
+database.make_engine()/make_async_engine() call query_started()/
+query_finished(), which add to the RequestStats of the current request
+(found through a context variable, so it works for async endpoints and for
+sync endpoints run in the threadpool). Statements slower than
+settings.SLOW_QUERY_MS are kept as samples.
+
+Metrics are rendered in the Prometheus text format by render_metrics()
+(served at /metrics). With settings.SERVER_TIMING the response also carries a
+Server-Timing header (app and db time, query count) for sampled requests.
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .config import settings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SLOW_QUERY_SAMPLES = 100
+
+
+@dataclass
+class RequestStats:
+    scope: dict
+    queries: int = 0
+    query_seconds: float = 0.0
+
+    @property
+    def route(self) -> str:
+        # Set by the router once the request has been matched
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # labels -> [bucket counts..., count, sum]
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(labels + (('le', _number(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(labels + (('le', '+Inf'),))} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(labels)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = defaultdict(float)
+
+    def inc(self, labels: Tuple[Tuple[str, str], ...], value: float = 1) -> None:
+        self._values[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(labels)} {value}" for labels, value in sorted(self._values.items())]
+        return lines
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+_lock = threading.Lock()
+REQUESTS = Counter("http_requests_total", "HTTP requests by method, route and status.")
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.", LATENCY_BUCKETS)
+QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed per sampled request.", QUERY_COUNT_BUCKETS
+)
+QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQL statement latency (sampled requests).", LATENCY_BUCKETS)
+DB_SECONDS_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Total SQL time per sampled request.", LATENCY_BUCKETS
+)
+SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.")
+_slow_samples: Deque[dict] = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+
+# ---------------------
+# ENGINE HOOKS
+# ---------------------
+def query_started(conn_info: dict) -> None:
+    if _current.get() is not None:
+        conn_info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def query_finished(conn_info: dict, statement: str) -> None:
+    stats = _current.get()
+    starts = conn_info.get("query_start")
+    if stats is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats.queries += 1
+    stats.query_seconds += elapsed
+    route = stats.route
+    with _lock:
+        QUERY_SECONDS.observe((("route", route),), elapsed)
+        if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            SLOW_QUERIES.inc((("route", route),))
+            _slow_samples.append({
+                "route": route,
+                "duration_ms": round(elapsed * 1000, 3),
+                "statement": " ".join(statement.split())[:1000],
+                "at": datetime.now(timezone.utc).isoformat(),
+            })
+
+
+def query_failed(conn_info: dict) -> None:
+    starts = conn_info.get("query_start")
+    if starts:
+        starts.pop()
+
+
+# ---------------------
+# MIDDLEWARE
+# ---------------------
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware (does not buffer streaming responses).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stats = RequestStats(scope) if random.random() < settings.METRICS_SAMPLE_RATE else None
+        token = _current.set(stats)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if stats is not None and settings.SERVER_TIMING:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    header = (
+                        f'app;dur={elapsed_ms:.2f}, '
+                        f'db;dur={stats.query_seconds * 1000:.2f};desc="{stats.queries} queries"'
+                    )
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            labels = (("method", scope["method"]), ("route", RequestStats(scope).route))
+            with _lock:
+                REQUESTS.inc(labels + (("status", str(status[0])),))
+                REQUEST_SECONDS.observe(labels, elapsed)
+                if stats is not None:
+                    QUERIES_PER_REQUEST.observe(labels, stats.queries)
+                    DB_SECONDS_PER_REQUEST.observe(labels, stats.query_seconds)
+
+
+def render_metrics() -> str:
+    with _lock:
+        lines: List[str] = []
+        for metric in (REQUESTS, REQUEST_SECONDS, QUERIES_PER_REQUEST, DB_SECONDS_PER_REQUEST, QUERY_SECONDS, SLOW_QUERIES):
+            lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def slow_queries() -> List[dict]:
+    with _lock:
+        return list(reversed(_slow_samples))
@@ -1,22 +1,49 @@
 # app/main.py
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from .database import Base, engine
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from .config import settings
+from .database import engine
+from .instrumentation import TimingMiddleware
+from .studies import StudyMiddleware, registry as study_registry
+from . import reliability
+from .playlists import shutdown as shutdown_manifest_builds
+from .write_behind import buffer as rating_buffer
+from .migrations import check_schema, upgrade
+from .pagination import NEXT_CURSOR_HEADER
+from .serialization import FastJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import (
-    subjects, sessions, images, session_images, questions, ratings, flow
+    subjects, sessions, images, session_images, questions, ratings, flow, playlists,
+    exports, analytics, metrics, clock, studies, feed
 )
 from fastapi.staticfiles import StaticFiles
 
 
 
-# Create the tables at startup (development only)
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Migrations run once before workers start; each worker only checks the stamp
+    if settings.AUTO_MIGRATE:
+        upgrade(engine)
+    check_schema(engine)
+    if settings.WRITE_BEHIND:
+        await rating_buffer.open(ratings.apply_queued)
+    else:
+        await rating_buffer.replay(ratings.apply_queued)
+    yield
+    await rating_buffer.close()
+    reliability.shutdown()
+    shutdown_manifest_builds()
+    await study_registry.close()
 
-app = FastAPI(title="Subjective Quality Experiment (Revised Schema)")
+app = FastAPI(title="Subjective Quality Experiment (Revised Schema)", lifespan=lifespan)
 
 # Mount the 'images' folder as a static route
-app.mount("/backend/images", StaticFiles(directory="backend/images"), name="images")
+app.mount("/backend/images", StaticFiles(directory=settings.IMAGE_DIR), name="images")
 
 # Allow requests from localhost:3000
 origins = [
@@ -24,13 +51,24 @@ origins = [
     "http://127.0.0.1:5173"
 ]
 
+# Selects the study database per request (inside CORS so errors carry its headers)
+app.add_middleware(StudyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Server-Timing"],
 )
+# Added last so it is outermost and times the whole request
+app.add_middleware(TimingMiddleware)
+
+# Validation errors echo the input; encode non-finite floats (a JSON body
+# with Infinity or NaN) as null instead of failing with a 500
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request, exc: RequestValidationError):
+    return FastJSONResponse(status_code=422, content={"detail": jsonable_encoder(exc.errors())})
 
 # Include Routers
 app.include_router(subjects.router)
@@ -40,6 +78,13 @@ app.include_router(session_images.router)
 app.include_router(questions.router)
 app.include_router(ratings.router)
 app.include_router(flow.router)  # optional
+app.include_router(playlists.router)
+app.include_router(exports.router)
+app.include_router(analytics.router)
+app.include_router(metrics.router)
+app.include_router(clock.router)
+app.include_router(studies.router)
+app.include_router(feed.router)
 
 @app.get("/")
 def root():
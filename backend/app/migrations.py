@@ -0,0 +1,331 @@
+# app/migrations.py
+
+"""
+Versioned schema migrations.
+
+The schema version is stamped in the single-row schema_version table. Each
+entry in MIGRATIONS upgrades the schema by one version inside its own
+transaction. Migrations run once, before workers start:
+
+    python -m backend.app.migrations upgrade   # apply pending migrations
+    python -m backend.app.migrations current   # print the stamped version
+
+At startup the app only calls check_schema(), which reads the stamp.
+
+Steps are written to be idempotent (they skip columns/indexes that already
+exist), so databases created by create_all() before versioning existed can be
+upgraded from version 0.
+"""
+
+import argparse
+import logging
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import TIMESTAMP, Column, Integer, MetaData, Table, delete, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+
+from .analytics import rebuild_score_stats
+from .database import Base
+from .progress import rebuild_progress
+from . import models
+
+logger = logging.getLogger(__name__)
+
+_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version", _version_metadata,
+    Column("version", Integer, nullable=False),
+)
+
+
+# Duplicate ratings removed before the unique index on ratings is built are
+# kept here, with the time they were moved (see _dedupe_ratings)
+RATING_DUPLICATES = "ratings_duplicates"
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+# ---------------------
+# HELPERS
+# ---------------------
+def _create_tables(conn: Connection, *tables: Table) -> None:
+    Base.metadata.create_all(bind=conn, tables=list(tables))
+
+
+def _add_column(conn: Connection, column: Column) -> None:
+    table = column.table
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    if column.name in existing:
+        return
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    logger.info("Adding column %s.%s", table.name, column.name)
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def _create_index(conn: Connection, table: Table, name: str) -> None:
+    index = next(i for i in table.indexes if i.name == name)
+    try:
+        with conn.begin_nested():
+            index.create(bind=conn, checkfirst=True)
+    except IntegrityError as e:
+        # Fail the migration rather than stamp a schema without the index
+        raise SchemaVersionError(
+            f"Cannot create unique index {name}: {table.name} has duplicate rows. "
+            f"Remove them and run the upgrade again."
+        ) from e
+
+
+def _duplicates_table(conn: Connection, ratings: Table) -> Table:
+    # Same columns as ratings at this schema version; columns added to
+    # ratings since an earlier dedupe are added here too
+    backup = Table(
+        RATING_DUPLICATES, MetaData(),
+        *(Column(c.name, c.type) for c in ratings.columns),
+        Column("moved_at", TIMESTAMP, server_default=func.now(), nullable=False),
+    )
+    if not inspect(conn).has_table(RATING_DUPLICATES):
+        backup.create(bind=conn)
+    else:
+        for column in backup.columns:
+            if column.name != "moved_at":
+                _add_column(conn, column)
+    return backup
+
+
+def _dedupe_ratings(conn: Connection) -> int:
+    """
+    Move all but the first rating of each (session_image_id, question_id),
+    as ON CONFLICT DO NOTHING would have kept, to the ratings_duplicates
+    table, and return how many were moved.
+    """
+    # Reflected: the ratings columns of the schema version being upgraded
+    ratings = Table("ratings", MetaData(), autoload_with=conn)
+    first = (
+        select(func.min(ratings.c.rating_id))
+        .group_by(ratings.c.session_image_id, ratings.c.question_id)
+    )
+    duplicate = ratings.c.rating_id.not_in(first)
+    if not conn.scalar(select(func.count()).select_from(ratings).where(duplicate)):
+        return 0
+
+    names = [c.name for c in ratings.columns]
+    conn.execute(
+        insert(_duplicates_table(conn, ratings)).from_select(names, select(*ratings.c).where(duplicate))
+    )
+    moved = conn.execute(delete(ratings).where(duplicate)).rowcount
+    logger.warning("Moved %d duplicate ratings to %s", moved, RATING_DUPLICATES)
+    return moved
+
+
+# ---------------------
+# MIGRATIONS
+# ---------------------
+def _initial_schema(conn: Connection) -> None:
+    _create_tables(
+        conn,
+        models.Subject.__table__, models.Session.__table__, models.Image.__table__,
+        models.SessionImage.__table__, models.Question.__table__, models.Rating.__table__,
+    )
+
+
+def _flow_cursor_and_sync(conn: Connection) -> None:
+    _add_column(conn, models.Session.__table__.c.last_image_index)
+    _add_column(conn, models.Rating.__table__.c.client_key)
+    _create_index(conn, models.Rating.__table__, "ix_ratings_client_key")
+    _create_tables(conn, models.SyncCursor.__table__)
+
+
+def _lookup_indexes(conn: Connection) -> None:
+    _create_index(conn, models.Session.__table__, "ix_sessions_subject_id")
+    _create_index(conn, models.SessionImage.__table__, "ux_session_images_session_order")
+    _create_index(conn, models.SessionImage.__table__, "ix_session_images_image_id")
+    _dedupe_ratings(conn)
+    _create_index(conn, models.Rating.__table__, "ux_ratings_session_image_question")
+    _create_index(conn, models.Rating.__table__, "ix_ratings_question_id")
+
+
+def _list_filter_indexes(conn: Connection) -> None:
+    _create_index(conn, models.Session.__table__, "ix_sessions_is_completed")
+    _create_index(conn, models.Rating.__table__, "ix_ratings_created_at")
+
+
+def _score_aggregates(conn: Connection) -> None:
+    _add_column(conn, models.Image.__table__.c.reference_image_id)
+    _create_index(conn, models.Image.__table__, "ix_images_reference_image_id")
+    _create_tables(conn, models.ImageScoreStats.__table__, models.SubjectScoreStats.__table__)
+    rebuild_score_stats(conn)
+
+
+def _session_progress(conn: Connection) -> None:
+    for column in ("total_images", "rated_images", "last_activity_at", "response_time_total", "response_time_count"):
+        _add_column(conn, models.Session.__table__.c[column])
+    _add_column(conn, models.SessionImage.__table__.c.rated_at)
+    rebuild_progress(conn)
+
+
+def _catalog_versions(conn: Connection) -> None:
+    _create_tables(conn, models.CatalogVersion.__table__)
+
+
+def _rating_client_timing(conn: Connection) -> None:
+    for column in ("stimulus_onset_at", "responded_at", "clock_uncertainty_ms"):
+        _add_column(conn, models.Rating.__table__.c[column])
+
+
+def _image_metadata(conn: Connection) -> None:
+    for column in (
+        "content_hash", "width", "height", "format", "file_size", "file_mtime_ns",
+        "sharpness", "colorfulness", "brightness", "contrast", "ingested_at",
+    ):
+        _add_column(conn, models.Image.__table__.c[column])
+    _create_index(conn, models.Image.__table__, "ix_images_content_hash")
+
+
+def _studies(conn: Connection) -> None:
+    _create_tables(conn, models.Study.__table__)
+
+
+def _reliability(conn: Connection) -> None:
+    _create_tables(
+        conn,
+        models.ReliabilityJob.__table__, models.QuestionReliability.__table__, models.SubjectReliability.__table__,
+    )
+
+
+def _unique_indexes(conn: Connection) -> None:
+    # Upgrades to version 3 used to skip these on duplicate rows
+    _create_index(conn, models.SessionImage.__table__, "ux_session_images_session_order")
+    if _dedupe_ratings(conn):
+        rebuild_score_stats(conn)
+        rebuild_progress(conn)
+    _create_index(conn, models.Rating.__table__, "ux_ratings_session_image_question")
+
+
+def _latin_square_counters(conn: Connection) -> None:
+    _create_tables(conn, models.LatinSquareCounter.__table__)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial schema", _initial_schema),
+    Migration(2, "session presentation cursor and offline rating sync", _flow_cursor_and_sync),
+    Migration(3, "lookup and uniqueness indexes", _lookup_indexes),
+    Migration(4, "indexes for list endpoint filters", _list_filter_indexes),
+    Migration(5, "hidden references and incremental MOS aggregates", _score_aggregates),
+    Migration(6, "per-session progress counters", _session_progress),
+    Migration(7, "catalog cache version stamps", _catalog_versions),
+    Migration(8, "client-timed stimulus onset and response", _rating_client_timing),
+    Migration(9, "image file metadata and quality features", _image_metadata),
+    Migration(10, "study registry for per-study databases", _studies),
+    Migration(11, "inter-rater reliability jobs and results", _reliability),
+    Migration(12, "unique indexes skipped by earlier upgrades", _unique_indexes),
+    Migration(13, "Latin-square row counters", _latin_square_counters),
+]
+
+HEAD = MIGRATIONS[-1].version
+
+
+# ---------------------
+# VERSION STAMP
+# ---------------------
+def current_version(conn: Connection) -> Optional[int]:
+    """
+    Stamped schema version, or None if the database was never stamped.
+    """
+    if not inspect(conn).has_table(schema_version.name):
+        return None
+    return conn.execute(select(schema_version.c.version)).scalar()
+
+
+def _stamp(conn: Connection, version: int) -> None:
+    _version_metadata.create_all(bind=conn)
+    conn.execute(schema_version.delete())
+    conn.execute(schema_version.insert().values(version=version))
+
+
+def upgrade(engine: Engine) -> int:
+    """
+    Apply every pending migration and return the resulting version.
+    """
+    with engine.begin() as conn:
+        version = current_version(conn) or 0
+        fresh = version == 0 and not inspect(conn).get_table_names()
+        if fresh:
+            # Empty database: build the current schema directly
+            Base.metadata.create_all(bind=conn)
+            _stamp(conn, HEAD)
+            logger.info("Created schema at version %d", HEAD)
+            return HEAD
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        with engine.begin() as conn:
+            logger.info("Applying migration %d: %s", migration.version, migration.description)
+            migration.apply(conn)
+            _stamp(conn, migration.version)
+        version = migration.version
+    return version
+
+
+def check_schema(engine: Engine) -> None:
+    """
+    Fail fast if the database has not been migrated to HEAD.
+    """
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version != HEAD:
+        raise SchemaVersionError(
+            f"Database schema is at version {version}, expected {HEAD}. "
+            f"Run `python -m backend.app.migrations upgrade` before starting the app."
+        )
+
+
+def _study_engines(study: Optional[str], all_studies: bool) -> List[Tuple[str, Engine]]:
+    """
+    (label, engine) of the databases a command applies to.
+    """
+    from .database import SessionLocal, engine, make_engine
+    from .studies import default_url
+
+    if study is None and not all_studies:
+        return [("main", engine)]
+    with SessionLocal() as db:
+        query = select(models.Study.study_id, models.Study.database_url)
+        if study is not None:
+            query = query.where(models.Study.study_id == study)
+        rows = db.execute(query.order_by(models.Study.study_id)).all()
+    if study is not None and not rows:
+        raise SystemExit(f"Unknown study {study!r}")
+    return [(f"study {study_id}", make_engine(url or default_url(study_id))) for study_id, url in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the database schema version.")
+    parser.add_argument("command", choices=["upgrade", "current"])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--study", help="a study's database instead of the main one")
+    target.add_argument("--all-studies", action="store_true", help="every registered study's database")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    for label, target_engine in _study_engines(args.study, args.all_studies):
+        if args.command == "upgrade":
+            version = upgrade(target_engine)
+        else:
+            with target_engine.connect() as conn:
+                version = current_version(conn)
+        print(f"{label}: schema at version {version} (head {HEAD})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # app/models.py
 
 from sqlalchemy import (
-    Column, Integer, String, Boolean, ForeignKey, Float, Text, TIMESTAMP
+    Column, Integer, BigInteger, String, Boolean, ForeignKey, Float, Text, TIMESTAMP, Index
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -23,11 +23,19 @@ class Session(Base):
     __tablename__ = "sessions"
 
     session_id = Column(Integer, primary_key=True, index=True)
-    subject_id = Column(Integer, ForeignKey("subjects.subject_id"), nullable=False)
+    subject_id = Column(Integer, ForeignKey("subjects.subject_id"), nullable=False, index=True)
     session_type = Column(String(50), nullable=False)  # e.g., "training", "block1"
     start_time = Column(TIMESTAMP, server_default=func.now(), nullable=False)
     end_time = Column(TIMESTAMP, nullable=True)
-    is_completed = Column(Boolean, default=False, nullable=False)
+    is_completed = Column(Boolean, default=False, nullable=False, index=True)
+    # Presentation cursor: display_order of the last rated stimulus
+    last_image_index = Column(Integer, default=0, server_default="0", nullable=False)
+    # Progress counters, maintained by app.progress alongside the inserts
+    total_images = Column(Integer, default=0, server_default="0", nullable=False)
+    rated_images = Column(Integer, default=0, server_default="0", nullable=False)
+    last_activity_at = Column(TIMESTAMP, nullable=True)
+    response_time_total = Column(Float, default=0.0, server_default="0", nullable=False)
+    response_time_count = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relationship to Subject
     subject = relationship("Subject", back_populates="sessions")
@@ -42,16 +50,38 @@ class Image(Base):
     file_name = Column(String(255), nullable=False)
     file_path = Column(String(500), nullable=True)
     description = Column(Text, nullable=True)
+    # Undistorted source of this stimulus (for DMOS); NULL for references
+    reference_image_id = Column(Integer, ForeignKey("images.image_id"), nullable=True, index=True)
     created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
 
+    # File metadata, filled in by the ingestion pipeline (app/ingest.py)
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the file
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    format = Column(String(16), nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    file_mtime_ns = Column(BigInteger, nullable=True)  # change detection on re-ingest
+    # Optional no-reference quality features
+    sharpness = Column(Float, nullable=True)
+    colorfulness = Column(Float, nullable=True)
+    brightness = Column(Float, nullable=True)
+    contrast = Column(Float, nullable=True)
+    ingested_at = Column(TIMESTAMP, nullable=True)
+
 class SessionImage(Base):
     __tablename__ = "session_images"
+    __table_args__ = (
+        # Serves lookups by session_id and the ordered playlist scan
+        Index("ux_session_images_session_order", "session_id", "display_order", unique=True),
+    )
 
     session_image_id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("sessions.session_id"), nullable=False)
-    image_id = Column(Integer, ForeignKey("images.image_id"), nullable=False)
+    image_id = Column(Integer, ForeignKey("images.image_id"), nullable=False, index=True)
     display_order = Column(Integer, nullable=False)
     is_training = Column(Boolean, default=False, nullable=False)
+    # Time of the first rating (counted in sessions.rated_images)
+    rated_at = Column(TIMESTAMP, nullable=True)
 
     # Relationship to Session
     session = relationship("Session", back_populates="session_images")
@@ -72,16 +102,121 @@ class Question(Base):
 
 class Rating(Base):
     __tablename__ = "ratings"
+    __table_args__ = (
+        # One answer per question per presented stimulus; also serves lookups by session_image_id
+        Index("ux_ratings_session_image_question", "session_image_id", "question_id", unique=True),
+    )
 
     rating_id = Column(Integer, primary_key=True, index=True)
     session_image_id = Column(Integer, ForeignKey("session_images.session_image_id"), nullable=False)
-    question_id = Column(Integer, ForeignKey("questions.question_id"), nullable=False)
+    question_id = Column(Integer, ForeignKey("questions.question_id"), nullable=False, index=True)
     rating_value = Column(Float, nullable=True)
     text_answer = Column(Text, nullable=True)
     response_time = Column(Float, nullable=True)
-    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+    client_key = Column(String(64), unique=True, index=True, nullable=True)  # idempotency key for offline sync
+    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False, index=True)
+    # Client-timed stimulus onset and response, corrected to server time (app/clock.py)
+    stimulus_onset_at = Column(TIMESTAMP, nullable=True)
+    responded_at = Column(TIMESTAMP, nullable=True)
+    clock_uncertainty_ms = Column(Float, nullable=True)  # half the sync round trip
 
     # Relationship to SessionImage
     session_image = relationship("SessionImage", back_populates="ratings")
     # Relationship to Question
     question = relationship("Question", backref="ratings")
+
+class SyncCursor(Base):
+    __tablename__ = "sync_cursors"
+
+    # One row per tablet: highest client_seq the server has durably applied
+    device_id = Column(String(64), primary_key=True, index=True)
+    high_water_mark = Column(Integer, default=0, nullable=False)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+class ImageScoreStats(Base):
+    __tablename__ = "image_score_stats"
+
+    # Running sums of non-training rating values per image and question (MOS);
+    # keyed question first so one question's rows are a primary key range
+    question_id = Column(Integer, ForeignKey("questions.question_id"), primary_key=True)
+    image_id = Column(Integer, ForeignKey("images.image_id"), primary_key=True)
+    n = Column(Integer, default=0, nullable=False)
+    total = Column(Float, default=0.0, nullable=False)
+    total_sq = Column(Float, default=0.0, nullable=False)
+
+class SubjectScoreStats(Base):
+    __tablename__ = "subject_score_stats"
+
+    # Running sums of non-training rating values per subject and question (z-scores)
+    question_id = Column(Integer, ForeignKey("questions.question_id"), primary_key=True)
+    subject_id = Column(Integer, ForeignKey("subjects.subject_id"), primary_key=True)
+    n = Column(Integer, default=0, nullable=False)
+    total = Column(Float, default=0.0, nullable=False)
+    total_sq = Column(Float, default=0.0, nullable=False)
+
+class ReliabilityJob(Base):
+    __tablename__ = "reliability_jobs"
+
+    # Background inter-rater reliability computation (app/reliability.py)
+    job_id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.question_id"), nullable=True)  # NULL: every question
+    status = Column(String(20), default="queued", nullable=False)  # queued | running | done | failed
+    error = Column(Text, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+    started_at = Column(TIMESTAMP, nullable=True)
+    finished_at = Column(TIMESTAMP, nullable=True)
+
+class QuestionReliability(Base):
+    __tablename__ = "question_reliability"
+
+    # Latest agreement statistics of one question, replaced by each job
+    question_id = Column(Integer, ForeignKey("questions.question_id"), primary_key=True)
+    job_id = Column(Integer, ForeignKey("reliability_jobs.job_id"), nullable=False)
+    n_subjects = Column(Integer, nullable=False)
+    n_images = Column(Integer, nullable=False)
+    n_ratings = Column(Integer, nullable=False)
+    krippendorff_alpha = Column(Float, nullable=True)  # interval metric
+    icc = Column(Float, nullable=True)  # ICC(1,1), one-way random effects
+    mean_correlation = Column(Float, nullable=True)  # mean subject vs leave-one-out MOS
+    flagged_subjects = Column(Integer, nullable=False)
+    computed_at = Column(TIMESTAMP, nullable=False)
+
+class SubjectReliability(Base):
+    __tablename__ = "subject_reliability"
+
+    # Latest per-subject consistency of one question, replaced by each job
+    question_id = Column(Integer, ForeignKey("questions.question_id"), primary_key=True)
+    subject_id = Column(Integer, ForeignKey("subjects.subject_id"), primary_key=True)
+    job_id = Column(Integer, ForeignKey("reliability_jobs.job_id"), nullable=False)
+    n_ratings = Column(Integer, nullable=False)
+    n_images = Column(Integer, nullable=False)
+    loo_correlation = Column(Float, nullable=True)  # Pearson r against the MOS of the other subjects
+    repeated_images = Column(Integer, nullable=False)  # images this subject rated more than once
+    repeat_std = Column(Float, nullable=True)  # pooled std of those repeated ratings
+    bt500_rejected = Column(Boolean, nullable=False)
+    flagged = Column(Boolean, nullable=False)
+    reasons = Column(String(100), nullable=True)  # comma-separated
+
+class Study(Base):
+    __tablename__ = "studies"
+
+    # Registry of per-study databases (app/studies.py); used in the main database
+    study_id = Column(String(64), primary_key=True)
+    name = Column(String(255), nullable=False)
+    status = Column(String(20), default="active", server_default="active", nullable=False)  # active | archived
+    database_url = Column(String(500), nullable=True)  # set by operators; default: STUDY_DB_DIR/{study_id}.db
+    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_versions"
+
+    # Bumped whenever a cached reference table changes (see app.catalog)
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+class LatinSquareCounter(Base):
+    __tablename__ = "latin_square_counters"
+
+    # Next Latin-square row per design (app.counterbalance.design_key)
+    design = Column(String(100), primary_key=True)
+    next_row = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,134 @@
+# app/pagination.py
+
+"""
+Keyset (cursor) pagination and field projection for list endpoints.
+
+Pages are ordered by the table's integer primary key and continue with
+`?after=<last id>`, so every page is an index range scan no matter how deep
+the client pages. The body stays a JSON array; the cursor for the next page
+is returned in the X-Next-Cursor header (absent on the last page).
+
+`?fields=a,b` selects only those columns (the primary key is always
+included) and returns plain JSON objects.
+"""
+
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import Result, Select, select
+
+from .serialization import FastJSONResponse, rows_to_dicts
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """
+    FastAPI dependency collecting after/limit/fields query parameters.
+    """
+
+    def __init__(
+        self,
+        after: Optional[int] = Query(None, description="return rows with an id greater than this cursor"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        fields: Optional[str] = Query(None, description="comma-separated columns to return"),
+    ):
+        self.after = after
+        self.limit = limit
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+
+def _primary_key(model):
+    return model.__table__.primary_key.columns.values()[0]
+
+
+def _check_fields(model, page: PageParams) -> None:
+    unknown = [f for f in page.fields if f not in model.__table__.c]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown field(s): {unknown}")
+
+
+def page_statement(model, page: PageParams, *criteria, columns: Optional[Sequence[Any]] = None) -> Select:
+    """
+    SELECT for one page: filtered, after the cursor, ordered by primary key,
+    with one extra row to detect whether another page follows. Selects ORM
+    entities unless `?fields=` or `columns` name the columns to fetch.
+    """
+    pk = _primary_key(model)
+    if page.fields:
+        _check_fields(model, page)
+        columns = [model.__table__.c[f] for f in page.fields]
+        if pk.name not in page.fields:
+            columns.append(pk)
+        stmt = select(*columns)
+    elif columns:
+        stmt = select(*columns)
+    else:
+        stmt = select(model)
+
+    stmt = stmt.where(*criteria)
+    if page.after is not None:
+        stmt = stmt.where(pk > page.after)
+    return stmt.order_by(pk).limit(page.limit + 1)
+
+
+def page_response(model, page: PageParams, rows: Sequence[Any], response: Response):
+    """
+    Turn the rows of page_statement() into the endpoint's return value.
+    """
+    pk_name = _primary_key(model).name
+    headers = {}
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        headers[NEXT_CURSOR_HEADER] = str(rows[-1]._mapping[pk_name] if page.fields else getattr(rows[-1][0], pk_name))
+
+    if page.fields:
+        keep = list(dict.fromkeys(page.fields + [pk_name]))
+        content: List[dict] = [{f: row._mapping[f] for f in keep} for row in rows]
+        return JSONResponse(jsonable_encoder(content), headers=headers)
+
+    response.headers.update(headers)
+    return [row[0] for row in rows]
+
+
+def cached_page_response(model, page: PageParams, items: Sequence[BaseModel], response: Response):
+    """
+    Same as page_response() for rows served from an in-memory catalog;
+    items are up to page.limit + 1 response schemas after the cursor.
+    """
+    pk_name = _primary_key(model).name
+    if page.fields:
+        _check_fields(model, page)
+    headers = {}
+    if len(items) > page.limit:
+        items = items[:page.limit]
+        headers[NEXT_CURSOR_HEADER] = str(getattr(items[-1], pk_name))
+
+    if page.fields:
+        keep = list(dict.fromkeys(page.fields + [pk_name]))
+        content: List[dict] = [{f: getattr(item, f) for f in keep} for item in items]
+        return JSONResponse(jsonable_encoder(content), headers=headers)
+
+    response.headers.update(headers)
+    return list(items)
+
+
+def rows_page_response(model, page: PageParams, result: Result):
+    """
+    page_response() for a page_statement(..., columns=...) result: the rows
+    are encoded directly (see app.serialization), skipping schema validation.
+    """
+    pk_name = _primary_key(model).name
+    keys = list(result.keys())
+    content = rows_to_dicts(keys, result.all())
+    headers = {}
+    if len(content) > page.limit:
+        content = content[:page.limit]
+        headers[NEXT_CURSOR_HEADER] = str(content[-1][pk_name])
+    return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,232 @@
+# app/playlists.py
+
+"""
+In-memory, per-session cache of the ordered stimulus playlist served by /flow
+(and of the prefetch manifests derived from it), plus the presentation cursor
+stored on sessions.last_image_index.
+
+The playlist (SessionImage joined with its Image) is loaded with one query the
+first time a session asks for its next image and kept per worker process.
+Entries are keyed by study (see app.studies) as well as session.
+
+Each cached playlist and manifest records the session's total_images when it
+was loaded. Session images are only ever inserted, and every insert bumps
+total_images in the same transaction (see app.progress.add_stimuli), so the
+counter acts as a version stamp: lookups pass the value from the session row
+the router has already read, and an entry with another stamp is reloaded.
+That way images assigned through another worker are picked up on the next
+request. invalidate_playlist() only drops this worker's copy early.
+"""
+
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import derivatives, models, schemas
+from .studies import current_study
+
+# Upper bound on cached sessions per worker (least recently used are dropped)
+MAX_CACHED_PLAYLISTS = 1024
+# Threads encoding missing derivatives while a manifest is built
+MANIFEST_BUILD_THREADS = min(8, os.cpu_count() or 1)
+
+PlaylistKey = Tuple[Optional[str], int]
+ManifestKey = Tuple[Optional[str], int, Optional[int], str, Optional[int]]
+
+
+@dataclass(frozen=True)
+class PlaylistEntry:
+    session_image_id: int
+    display_order: int
+    is_training: bool
+    image_id: int
+    file_name: str
+    file_path: Optional[str]
+
+
+class Playlist:
+    def __init__(self, entries: List[PlaylistEntry], version: int):
+        self.entries = entries
+        # sessions.total_images when the playlist was loaded
+        self.version = version
+        self._orders = [e.display_order for e in entries]
+
+    def next_after(self, display_order: int) -> Optional[PlaylistEntry]:
+        """
+        Return the first entry whose display_order is greater than display_order.
+        """
+        idx = bisect_right(self._orders, display_order)
+        return self.entries[idx] if idx < len(self.entries) else None
+
+
+# (study_id, session_id) -> playlist
+_playlists: "OrderedDict[PlaylistKey, Playlist]" = OrderedDict()
+# (study_id, session_id, width, format, quality) -> (playlist version, prefetch manifest)
+_manifests: "OrderedDict[ManifestKey, Tuple[int, schemas.SessionManifest]]" = OrderedDict()
+_lock = threading.Lock()
+# Shared by all manifest builds, so concurrent requests share its threads
+_build_pool: Optional[ThreadPoolExecutor] = None
+
+
+def cached_playlist(session_id: int, version: int) -> Optional[Playlist]:
+    """
+    The cached playlist of a session, or None if it is missing or was loaded
+    at another version (sessions.total_images) than the one given.
+    """
+    key = (current_study(), session_id)
+    with _lock:
+        playlist = _playlists.get(key)
+        if playlist is None:
+            return None
+        if playlist.version != version:
+            del _playlists[key]
+            return None
+        _playlists.move_to_end(key)
+        return playlist
+
+
+def load_playlist(db: Session, session_id: int, version: int) -> Playlist:
+    """
+    Load a session's playlist with one query and cache it under the given
+    version (the sessions.total_images read by the caller).
+
+    Async routers call this through AsyncSession.run_sync().
+    """
+    rows = db.execute(
+        select(
+            models.SessionImage.session_image_id,
+            models.SessionImage.display_order,
+            models.SessionImage.is_training,
+            models.Image.image_id,
+            models.Image.file_name,
+            models.Image.file_path,
+        )
+        .join(models.Image, models.SessionImage.image_id == models.Image.image_id)
+        .where(models.SessionImage.session_id == session_id)
+        .order_by(models.SessionImage.display_order.asc())
+    ).all()
+    playlist = Playlist([PlaylistEntry(*row) for row in rows], version)
+
+    # An empty playlist is not cached: images may still be assigned (possibly
+    # by another worker) before the session starts.
+    if playlist.entries:
+        with _lock:
+            _playlists[(current_study(), session_id)] = playlist
+            while len(_playlists) > MAX_CACHED_PLAYLISTS:
+                _playlists.popitem(last=False)
+    return playlist
+
+
+def get_playlist(db: Session, session: models.Session) -> Playlist:
+    return (
+        cached_playlist(session.session_id, session.total_images)
+        or load_playlist(db, session.session_id, session.total_images)
+    )
+
+
+def invalidate_playlist(session_id: int) -> None:
+    study = current_study()
+    with _lock:
+        _playlists.pop((study, session_id), None)
+        for key in [k for k in _manifests if k[:2] == (study, session_id)]:
+            del _manifests[key]
+
+
+def _manifest_pool() -> ThreadPoolExecutor:
+    global _build_pool
+    with _lock:
+        if _build_pool is None:
+            _build_pool = ThreadPoolExecutor(MANIFEST_BUILD_THREADS, thread_name_prefix="manifest")
+        return _build_pool
+
+
+def shutdown() -> None:
+    """
+    Stop the manifest build threads (recreated on the next build).
+    """
+    global _build_pool
+    with _lock:
+        pool, _build_pool = _build_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_manifest(session_id: int, playlist: Playlist, width: Optional[int], fmt: str,
+                 quality: Optional[int]) -> schemas.SessionManifest:
+    """
+    Prefetch manifest of a playlist: every stimulus with the content-addressed
+    URL, key and byte size of its display derivative.
+
+    Missing derivatives are encoded in parallel on first request; the manifest
+    is then cached for the playlist's version. Blocking: call
+    from a worker thread. Raises FileNotFoundError/ValueError/UnreadableImage
+    like derivatives.get_derivative().
+    """
+    key = (current_study(), session_id, width, fmt, quality)
+    with _lock:
+        cached = _manifests.get(key)
+        if cached is not None:
+            version, manifest = cached
+            if version == playlist.version:
+                _manifests.move_to_end(key)
+                return manifest
+            del _manifests[key]
+
+    def build_item(entry: PlaylistEntry) -> schemas.ManifestItem:
+        source = derivatives.source_path(entry.file_name, entry.file_path)
+        derivative = derivatives.get_derivative(source, width, fmt, quality)
+        return schemas.ManifestItem(
+            session_image_id=entry.session_image_id,
+            display_order=entry.display_order,
+            is_training=entry.is_training,
+            image_id=entry.image_id,
+            url=f"/images/derivatives/{derivative.name}",
+            derivative_key=derivative.key,
+            source_sha256=derivatives.source_hash(source),
+            bytes=derivative.size,
+            media_type=derivative.media_type,
+        )
+
+    items = list(_manifest_pool().map(build_item, playlist.entries))
+
+    manifest = schemas.SessionManifest(
+        session_id=session_id,
+        width=width,
+        format=fmt,
+        quality=quality,
+        total_bytes=sum(item.bytes for item in items),
+        items=items,
+    )
+    if items:
+        with _lock:
+            _manifests[key] = (playlist.version, manifest)
+            while len(_manifests) > MAX_CACHED_PLAYLISTS:
+                _manifests.popitem(last=False)
+    return manifest
+
+
+def advance_cursors(db: Session, positions: Dict[int, int]) -> None:
+    """
+    Move each session's cursor forward to the given display_order.
+
+    positions maps session_id -> display_order of the rated stimulus. The
+    UPDATE only ever moves the cursor forward, so concurrent ratings cannot
+    rewind it. Runs in the caller's transaction (async routers call it through
+    AsyncSession.run_sync()).
+    """
+    for session_id, display_order in positions.items():
+        db.execute(
+            update(models.Session)
+            .where(
+                models.Session.session_id == session_id,
+                models.Session.last_image_index < display_order,
+            )
+            .values(last_image_index=display_order)
+        )
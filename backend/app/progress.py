@@ -0,0 +1,115 @@
+# app/progress.py
+
+"""
+Denormalized per-session progress counters.
+
+sessions.total_images counts the session's stimuli and sessions.rated_images
+those with at least one rating (session_images.rated_at is set by the first
+one). Last activity and response time sums are kept alongside, so progress of
+every active session is read from the sessions table alone. Both functions run
+in the caller's transaction (async routers call them through
+AsyncSession.run_sync()), next to the inserts they account for.
+"""
+
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def add_stimuli(db: Session, counts: Dict[int, int]) -> None:
+    """
+    Add newly assigned session images (session_id -> count) to total_images.
+    Cached playlists use total_images as their version (see app.playlists), so
+    every insert into session_images must go through here.
+    """
+    for session_id, count in counts.items():
+        db.execute(
+            update(models.Session)
+            .where(models.Session.session_id == session_id)
+            .values(total_images=models.Session.total_images + count)
+        )
+
+
+def record_progress(db: Session, ratings: Sequence[Tuple[int, int, Optional[float]]]) -> Dict[int, int]:
+    """
+    Account for newly inserted ratings, given as
+    (session_image_id, session_id, response_time). Returns the number of
+    stimuli rated for the first time per session.
+    """
+    times: Dict[int, List[float]] = defaultdict(lambda: [0, 0.0])
+    for _, session_id, response_time in ratings:
+        sums = times[session_id]
+        if response_time is not None:
+            sums[0] += 1
+            sums[1] += response_time
+    if not times:
+        return {}
+
+    # Mark first-rated stimuli; RETURNING tells which sessions gained one
+    newly_rated = Counter(db.scalars(
+        update(models.SessionImage)
+        .where(
+            models.SessionImage.session_image_id.in_({si_id for si_id, _, _ in ratings}),
+            models.SessionImage.rated_at.is_(None),
+        )
+        .values(rated_at=func.now())
+        .returning(models.SessionImage.session_id)
+        .execution_options(synchronize_session=False)
+    ))
+
+    table = models.Session.__table__
+    db.execute(
+        update(table)
+        .where(table.c.session_id == bindparam("sid"))
+        .values(
+            rated_images=table.c.rated_images + bindparam("rated"),
+            response_time_count=table.c.response_time_count + bindparam("rt_count"),
+            response_time_total=table.c.response_time_total + bindparam("rt_total"),
+            last_activity_at=func.now(),
+        ),
+        [
+            {"sid": session_id, "rated": newly_rated.get(session_id, 0), "rt_count": count, "rt_total": total}
+            for session_id, (count, total) in times.items()
+        ],
+    )
+    return dict(newly_rated)
+
+
+def rebuild_progress(conn: Connection) -> None:
+    """
+    Recompute every session's counters from session_images and ratings.
+    """
+    si, r, s = models.SessionImage.__table__, models.Rating.__table__, models.Session.__table__
+    conn.execute(
+        update(si).values(rated_at=(
+            select(func.min(r.c.created_at))
+            .where(r.c.session_image_id == si.c.session_image_id)
+            .scalar_subquery()
+        ))
+    )
+
+    def per_session(*columns):
+        return select(*columns).where(si.c.session_id == s.c.session_id).scalar_subquery()
+
+    def per_rating(column):
+        return (
+            select(column)
+            .select_from(r.join(si, r.c.session_image_id == si.c.session_image_id))
+            .where(si.c.session_id == s.c.session_id)
+            .scalar_subquery()
+        )
+
+    conn.execute(
+        update(s).values(
+            total_images=per_session(func.count()),
+            rated_images=per_session(func.count(si.c.rated_at)),
+            last_activity_at=per_rating(func.max(r.c.created_at)),
+            response_time_total=func.coalesce(per_rating(func.sum(r.c.response_time)), 0.0),
+            response_time_count=per_rating(func.count(r.c.response_time)),
+        )
+    )
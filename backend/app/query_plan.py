@@ -0,0 +1,250 @@
+# app/query_plan.py
+
+"""
+Audit the SQLite query plans of the queries issued by the routers.
+
+Runs EXPLAIN QUERY PLAN for each query and reports any full table scan or
+temporary B-tree sort that is not expected. Exits non-zero if one is found.
+By default the audit runs against a temporary database created at the current
+schema; --url audits an existing database, which must already be migrated
+(it is never upgraded from here). backend/tests/test_query_plans.py checks
+the statements the routers actually execute.
+
+    python -m backend.app.query_plan [--url sqlite:///./mydatabase.db]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Executable
+
+from . import catalog, models
+from .database import make_engine
+from .migrations import check_schema, upgrade
+from .pagination import DEFAULT_PAGE_SIZE, PageParams, page_statement
+from .routers.ratings import RATING_COLUMNS
+
+
+class AuditedQuery(NamedTuple):
+    name: str
+    statement: Executable
+    # Set where a scan or sort is expected (e.g. exports of a whole table)
+    allow_scan: bool = False
+
+
+SI = models.SessionImage
+
+
+def _page(after: Optional[int] = None) -> PageParams:
+    return PageParams(after=after, limit=DEFAULT_PAGE_SIZE, fields=None)
+
+
+AUDITED_QUERIES: List[AuditedQuery] = [
+    # Primary-key lookups (get_* endpoints and create_* validation)
+    AuditedQuery("subjects.get_subject", select(models.Subject).where(models.Subject.subject_id == 1)),
+    AuditedQuery("sessions.get_session", select(models.Session).where(models.Session.session_id == 1)),
+    AuditedQuery("images.get_image", select(models.Image).where(models.Image.image_id == 1)),
+    AuditedQuery("questions.get_question", select(models.Question).where(models.Question.question_id == 1)),
+    AuditedQuery("ratings.get_rating", select(models.Rating).where(models.Rating.rating_id == 1)),
+    AuditedQuery("session_images.get_session_image", select(SI).where(SI.session_image_id == 1)),
+    # session_images.get_session_images
+    AuditedQuery(
+        "session_images.get_session_images",
+        select(SI)
+        .join(models.Image, SI.image_id == models.Image.image_id)
+        .where(SI.session_id == 1)
+    ),
+    # playlists.load_playlist (flow.get_next_image)
+    AuditedQuery(
+        "flow.playlist",
+        select(SI.session_image_id, SI.display_order, SI.is_training, models.Image.image_id,
+               models.Image.file_name, models.Image.file_path)
+        .join(models.Image, SI.image_id == models.Image.image_id)
+        .where(SI.session_id == 1)
+        .order_by(SI.display_order.asc())
+    ),
+    # playlists.advance_cursors
+    AuditedQuery(
+        "flow.advance_cursor",
+        update(models.Session)
+        .where(models.Session.session_id == 1, models.Session.last_image_index < 3)
+        .values(last_image_index=3)
+    ),
+    # ratings.create_ratings_batch / sync_ratings validation
+    AuditedQuery(
+        "ratings.batch_validate_session_images",
+        select(SI.session_image_id, SI.session_id, SI.display_order, SI.image_id,
+               models.Session.subject_id, SI.is_training)
+        .join(models.Session, SI.session_id == models.Session.session_id)
+        .where(SI.session_image_id.in_([1, 2, 3]))
+    ),
+    AuditedQuery(
+        "ratings.batch_validate_questions",
+        select(models.Question.question_id).where(models.Question.question_id.in_([1, 2]))
+    ),
+    AuditedQuery(
+        "ratings.by_session_image",
+        select(models.Rating).where(models.Rating.session_image_id == 1)
+    ),
+    AuditedQuery(
+        "ratings.by_question",
+        select(models.Rating).where(models.Rating.question_id == 1)
+    ),
+    AuditedQuery(
+        "ratings.by_client_key",
+        select(models.Rating).where(models.Rating.client_key == "k")
+    ),
+    AuditedQuery(
+        "sessions.by_subject",
+        select(models.Session).where(models.Session.subject_id == 1)
+    ),
+    # analytics.mos_table / zscore_mos / rating_matrix
+    AuditedQuery(
+        "analytics.mos",
+        select(models.ImageScoreStats)
+        .where(models.ImageScoreStats.question_id == 1)
+        .order_by(models.ImageScoreStats.image_id)
+    ),
+    AuditedQuery(
+        "analytics.subject_stats",
+        select(models.SubjectScoreStats).where(models.SubjectScoreStats.question_id == 1)
+    ),
+    AuditedQuery(
+        "analytics.score_matrix",
+        select(models.Session.subject_id, SI.image_id, models.Rating.rating_value)
+        .join(SI, models.Rating.session_image_id == SI.session_image_id)
+        .join(models.Session, SI.session_id == models.Session.session_id)
+        .where(models.Rating.question_id == 1, SI.is_training == False)  # noqa: E712
+    ),
+    # sessions.list_active_sessions (operator dashboard)
+    AuditedQuery(
+        "sessions.list_active_sessions",
+        select(models.Session.session_id, models.Session.rated_images, models.Session.total_images)
+        .where(models.Session.is_completed == False)  # noqa: E712
+        .order_by(models.Session.session_id)
+    ),
+    # progress.record_progress
+    AuditedQuery(
+        "progress.mark_rated",
+        update(SI)
+        .where(SI.session_image_id.in_([1, 2]), SI.rated_at.is_(None))
+        .values(rated_at=func.now())
+    ),
+    # catalog.Catalog stamp check
+    AuditedQuery(
+        "catalog.version",
+        select(models.CatalogVersion.version).where(models.CatalogVersion.name == "questions")
+    ),
+    # Catalog snapshots hold the whole table
+    AuditedQuery(
+        "catalog.questions",
+        select(*catalog.questions.columns).order_by(models.Question.question_id),
+        allow_scan=True
+    ),
+    AuditedQuery(
+        "catalog.images",
+        select(*catalog.images.columns).order_by(models.Image.image_id),
+        allow_scan=True
+    ),
+    # Keyset-paginated, filtered list endpoints (pagination.page_statement)
+    AuditedQuery(
+        "sessions.list_sessions(subject_id, after)",
+        page_statement(models.Session, _page(10), models.Session.subject_id == 1)
+    ),
+    AuditedQuery(
+        "sessions.list_sessions(is_completed, after)",
+        page_statement(models.Session, _page(10), models.Session.is_completed == False)  # noqa: E712
+    ),
+    AuditedQuery(
+        "ratings.list_ratings(question_id, after)",
+        page_statement(models.Rating, _page(10), models.Rating.question_id == 1, columns=RATING_COLUMNS)
+    ),
+    # At most one rating per question is sorted by rating_id
+    AuditedQuery(
+        "ratings.list_ratings(session_image_id)",
+        page_statement(models.Rating, _page(), models.Rating.session_image_id == 1, columns=RATING_COLUMNS),
+        allow_scan=True
+    ),
+    # Index range on created_at; only the rows inside the window are sorted
+    AuditedQuery(
+        "ratings.list_ratings(since, until)",
+        page_statement(
+            models.Rating, _page(),
+            models.Rating.created_at >= "2025-01-01", models.Rating.created_at < "2025-02-01",
+            columns=RATING_COLUMNS,
+        ),
+        allow_scan=True
+    ),
+    # Unfiltered list endpoints: later pages are primary key range scans; the
+    # first page walks the primary key and stops at the LIMIT
+    AuditedQuery("subjects.list_subjects(after)", page_statement(models.Subject, _page(10))),
+    AuditedQuery("sessions.list_sessions(after)", page_statement(models.Session, _page(10))),
+    AuditedQuery("ratings.list_ratings(after)", page_statement(models.Rating, _page(10), columns=RATING_COLUMNS)),
+    AuditedQuery("subjects.list_subjects", page_statement(models.Subject, _page()), allow_scan=True),
+    AuditedQuery("sessions.list_sessions", page_statement(models.Session, _page()), allow_scan=True),
+    AuditedQuery(
+        "ratings.list_ratings", page_statement(models.Rating, _page(), columns=RATING_COLUMNS), allow_scan=True
+    ),
+]
+
+
+def explain(engine: Engine, statement: Executable) -> List[str]:
+    """
+    Return the detail column of EXPLAIN QUERY PLAN for a statement.
+    """
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def plan_problems(plan: List[str]) -> List[str]:
+    """
+    Plan steps that read a whole table or sort in a temporary B-tree.
+    """
+    return [
+        step for step in plan
+        if (step.startswith("SCAN ") and "USING" not in step) or "TEMP B-TREE" in step
+    ]
+
+
+def audit(engine: Engine) -> List[str]:
+    failures = []
+    for query in AUDITED_QUERIES:
+        plan = explain(engine, query.statement)
+        problems = [] if query.allow_scan else plan_problems(plan)
+        status = "FAIL" if problems else "ok"
+        print(f"{status:4}  {query.name}: {' | '.join(plan)}")
+        failures.extend(f"{query.name}: {p}" for p in problems)
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="existing, migrated database to audit (default: a temporary one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            engine = make_engine(args.url)
+            check_schema(engine)
+        else:
+            engine = make_engine(f"sqlite:///{os.path.join(tmp, 'audit.db')}")
+            upgrade(engine)
+        try:
+            failures = audit(engine)
+        finally:
+            engine.dispose()
+    if failures:
+        print(f"\n{len(failures)} query plan problem(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
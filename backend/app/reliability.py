@@ -0,0 +1,327 @@
+# app/reliability.py
+
+"""
+Inter-rater reliability and rater consistency, computed by background jobs.
+
+POST /analytics/reliability/jobs queues a job for one question or for all of
+them. Jobs run on a small thread pool (settings.RELIABILITY_WORKERS per worker
+process) against the study's database and replace the question's rows in
+question_reliability and subject_reliability, which the API serves while the
+study is still running. A job whose study cannot be opened or has been
+archived since it was queued fails with the error. Jobs still queued or
+running when their worker stops keep that status; submit them again.
+
+A question's non-training ratings are streamed in chunks of
+settings.RELIABILITY_CHUNK_ROWS into subject x image matrices of sums, sums
+of squares and counts, so repeated presentations of a stimulus stay
+separable. Everything else is vectorized over those matrices:
+
+    loo_correlation      Pearson r between a subject's scores and the mean of
+                         the other subjects on the same images (leave-one-out MOS)
+    repeat_std           pooled within-subject standard deviation over the
+                         images the subject rated more than once
+    bt500_rejected       analytics.bt500_screening()
+    krippendorff_alpha   interval alpha; images are the units and subjects'
+                         mean scores the values (missing values allowed)
+    icc                  ICC(1,1) from the one-way ANOVA of those scores by
+                         image (unbalanced)
+
+A subject is flagged when their correlation is below
+settings.RELIABILITY_MIN_CORRELATION (given settings.RELIABILITY_MIN_IMAGES
+images), their repeat_std exceeds settings.RELIABILITY_MAX_REPEAT_STD of the
+question's scale range, or BT.500 screening rejects them.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models, studies
+from .analytics import RatingMatrix, bt500_screening, scores_query, _finite
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreSums(NamedTuple):
+    subject_ids: np.ndarray
+    image_ids: np.ndarray
+    sums: np.ndarray  # subjects x images
+    sums_sq: np.ndarray
+    counts: np.ndarray
+
+    def matrix(self) -> RatingMatrix:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scores = np.where(self.counts > 0, self.sums / self.counts, np.nan)
+        return RatingMatrix(self.subject_ids, self.image_ids, scores)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ---------------------
+# STATISTICS
+# ---------------------
+def score_sums(db: Session, question_id: int, chunk_rows: Optional[int] = None) -> Optional[ScoreSums]:
+    """
+    Stream one question's scores into subject x image sums; None without any.
+    """
+    stmt = scores_query().where(models.Rating.question_id == question_id)
+    keys = stmt.subquery()
+    subject_ids = np.array(db.scalars(select(keys.c.subject_id).distinct().order_by(keys.c.subject_id)).all())
+    image_ids = np.array(db.scalars(select(keys.c.image_id).distinct().order_by(keys.c.image_id)).all())
+    if not len(subject_ids):
+        return None
+
+    shape = (len(subject_ids), len(image_ids))
+    sums, sums_sq, counts = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    result = db.execute(stmt.execution_options(yield_per=chunk_rows or settings.RELIABILITY_CHUNK_ROWS))
+    for chunk in result.partitions():
+        # image_id, subject_id, question_id, rating_value
+        rows = np.array(chunk, dtype=float).reshape(-1, 4)
+        s_idx = np.searchsorted(subject_ids, rows[:, 1])
+        i_idx = np.searchsorted(image_ids, rows[:, 0])
+        # Skip rows inserted after the id lists were read
+        known = (
+            (s_idx < shape[0]) & (i_idx < shape[1])
+            & (subject_ids[np.minimum(s_idx, shape[0] - 1)] == rows[:, 1])
+            & (image_ids[np.minimum(i_idx, shape[1] - 1)] == rows[:, 0])
+        )
+        s_idx, i_idx, values = s_idx[known], i_idx[known], rows[known, 3]
+        np.add.at(sums, (s_idx, i_idx), values)
+        np.add.at(sums_sq, (s_idx, i_idx), values * values)
+        np.add.at(counts, (s_idx, i_idx), 1)
+    return ScoreSums(subject_ids, image_ids, sums, sums_sq, counts)
+
+
+def loo_correlation(scores: np.ndarray):
+    """
+    Per subject: Pearson r of their scores against the leave-one-out MOS, and
+    the number of images it is computed over.
+    """
+    rated = ~np.isnan(scores)
+    values = np.where(rated, scores, 0.0)
+    col_sum, col_n = values.sum(axis=0), rated.sum(axis=0)
+    valid = rated & (col_n > 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        loo = np.where(valid, (col_sum - values) / (col_n - 1), 0.0)
+    a = np.where(valid, values, 0.0)
+    n = valid.sum(axis=1).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sa, sb = a.sum(axis=1), loo.sum(axis=1)
+        cov = (a * loo).sum(axis=1) - sa * sb / n
+        var_a = (a * a).sum(axis=1) - sa * sa / n
+        var_b = (loo * loo).sum(axis=1) - sb * sb / n
+        r = cov / np.sqrt(var_a * var_b)
+    r = np.where((n > 2) & (var_a > 1e-12) & (var_b > 1e-12), r, np.nan)
+    return np.clip(r, -1.0, 1.0), n.astype(int)
+
+
+def repeat_consistency(sums: ScoreSums):
+    """
+    Per subject: number of images rated more than once and the pooled
+    standard deviation of those repeated ratings.
+    """
+    repeated = sums.counts >= 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        within = np.where(repeated, sums.sums_sq - sums.sums * sums.sums / sums.counts, 0.0)
+        df = np.where(repeated, sums.counts - 1, 0.0).sum(axis=1)
+        std = np.sqrt(np.clip(within.sum(axis=1), 0.0, None) / df)
+    return repeated.sum(axis=1), np.where(df > 0, std, np.nan)
+
+
+def krippendorff_alpha(scores: np.ndarray) -> Optional[float]:
+    """
+    Krippendorff's alpha with the interval metric; columns are units.
+    """
+    rated = ~np.isnan(scores)
+    m = rated.sum(axis=0)
+    pairable = rated & (m >= 2)
+    n = pairable.sum()
+    if n < 2:
+        return None
+    values = np.where(pairable, scores, 0.0)
+    s1, s2 = values.sum(axis=0), (values * values).sum(axis=0)
+    units = m >= 2
+    # Sums of squared differences over ordered pairs of values: 2 (m S2 - S1^2)
+    observed = (2 * (m[units] * s2[units] - s1[units] ** 2) / (m[units] - 1)).sum() / n
+    expected = 2 * (n * s2.sum() - s1.sum() ** 2) / (n * (n - 1))
+    if expected <= 0:
+        return None
+    return _finite(1 - observed / expected)
+
+
+def icc_oneway(scores: np.ndarray) -> Optional[float]:
+    """
+    ICC(1,1) with columns (images) as targets and unequal rater counts.
+    """
+    rated = ~np.isnan(scores)
+    n_i = rated.sum(axis=0)
+    targets = n_i > 0
+    a, total = targets.sum(), n_i.sum()
+    if a < 2 or total <= a:
+        return None
+    values = np.where(rated, scores, 0.0)
+    means = values[:, targets].sum(axis=0) / n_i[targets]
+    grand = values.sum() / total
+    ss_between = (n_i[targets] * (means - grand) ** 2).sum()
+    ss_within = (np.where(rated[:, targets], values[:, targets] - means, 0.0) ** 2).sum()
+    ms_between, ms_within = ss_between / (a - 1), ss_within / (total - a)
+    k0 = (total - (n_i[targets] ** 2).sum() / total) / (a - 1)
+    denominator = ms_between + (k0 - 1) * ms_within
+    if denominator <= 0:
+        return None
+    return _finite((ms_between - ms_within) / denominator)
+
+
+def question_reliability(db: Session, question_id: int, job_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Compute and store one question's statistics, replacing earlier results.
+    Returns the question_reliability row (None without ratings).
+    """
+    sums = score_sums(db, question_id)
+    table_q, table_s = models.QuestionReliability.__table__, models.SubjectReliability.__table__
+    db.execute(delete(table_q).where(table_q.c.question_id == question_id))
+    db.execute(delete(table_s).where(table_s.c.question_id == question_id))
+    if sums is None:
+        db.commit()
+        return None
+
+    matrix = sums.matrix()
+    r, n_images = loo_correlation(matrix.scores)
+    repeated_images, repeat_std = repeat_consistency(sums)
+    rejected = np.array([s["rejected"] for s in bt500_screening(matrix)], dtype=bool)
+
+    question = db.get(models.Question, question_id)
+    if question.min_scale is not None and question.max_scale is not None:
+        scale_range = float(question.max_scale - question.min_scale)
+    else:
+        scale_range = float(np.nanmax(matrix.scores) - np.nanmin(matrix.scores))
+    with np.errstate(invalid="ignore"):
+        low_correlation = (n_images >= settings.RELIABILITY_MIN_IMAGES) & (r < settings.RELIABILITY_MIN_CORRELATION)
+        inconsistent = repeat_std > settings.RELIABILITY_MAX_REPEAT_STD * scale_range
+    flagged = low_correlation | inconsistent | rejected
+
+    now = _now()
+    subject_rows = []
+    for k, subject_id in enumerate(sums.subject_ids):
+        reasons = [
+            reason for reason, hit in (
+                ("low_correlation", low_correlation[k]), ("inconsistent_repeats", inconsistent[k]),
+                ("bt500", rejected[k]),
+            ) if hit
+        ]
+        subject_rows.append({
+            "question_id": question_id,
+            "subject_id": int(subject_id),
+            "job_id": job_id,
+            "n_ratings": int(sums.counts[k].sum()),
+            "n_images": int((sums.counts[k] > 0).sum()),
+            "loo_correlation": _finite(r[k]),
+            "repeated_images": int(repeated_images[k]),
+            "repeat_std": _finite(repeat_std[k]),
+            "bt500_rejected": bool(rejected[k]),
+            "flagged": bool(flagged[k]),
+            "reasons": ",".join(reasons) or None,
+        })
+    question_row = {
+        "question_id": question_id,
+        "job_id": job_id,
+        "n_subjects": len(sums.subject_ids),
+        "n_images": len(sums.image_ids),
+        "n_ratings": int(sums.counts.sum()),
+        "krippendorff_alpha": krippendorff_alpha(matrix.scores),
+        "icc": icc_oneway(matrix.scores),
+        "mean_correlation": _finite(np.nanmean(r)) if np.isfinite(r).any() else None,
+        "flagged_subjects": int(flagged.sum()),
+        "computed_at": now,
+    }
+    db.execute(insert(table_s), subject_rows)
+    db.execute(insert(table_q), [question_row])
+    db.commit()
+    return question_row
+
+
+# ---------------------
+# JOBS
+# ---------------------
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def submit(db: Session, question_id: Optional[int] = None) -> models.ReliabilityJob:
+    """
+    Queue a job for one question (None: every question) of the current study.
+    """
+    global _executor
+    job = models.ReliabilityJob(question_id=question_id, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.RELIABILITY_WORKERS, thread_name_prefix="reliability")
+    _executor.submit(run_job, studies.current_study(), job.job_id)
+    return job
+
+
+def run_job(study: Optional[str], job_id: int) -> None:
+    try:
+        with studies.session(study, writable=True) as db:
+            _run_job(db, job_id)
+    except Exception as e:
+        # The study could not be opened (unknown, archived) or the job's
+        # status not be stored: record the failure on a plain session
+        logger.exception("Reliability job %d failed", job_id)
+        _record_failure(study, job_id, e)
+
+
+def _run_job(db: Session, job_id: int) -> None:
+    job = db.get(models.ReliabilityJob, job_id)
+    job.status, job.started_at = "running", _now()
+    db.commit()
+    try:
+        if job.question_id is not None:
+            question_ids: List[int] = [job.question_id]
+        else:
+            question_ids = db.scalars(select(models.Question.question_id).order_by(models.Question.question_id)).all()
+        for question_id in question_ids:
+            question_reliability(db, question_id, job_id)
+        job.status = "done"
+    except Exception as e:
+        logger.exception("Reliability job %d failed", job_id)
+        db.rollback()
+        job.status, job.error = "failed", _error(e)
+    job.finished_at = _now()
+    db.commit()
+
+
+def _record_failure(study: Optional[str], job_id: int, error: Exception) -> None:
+    try:
+        with studies.session(study) as db:
+            db.execute(
+                update(models.ReliabilityJob)
+                .where(models.ReliabilityJob.job_id == job_id)
+                .values(status="failed", error=_error(error), finished_at=_now())
+            )
+            db.commit()
+    except Exception:
+        logger.exception("Could not record the failure of reliability job %d", job_id)
+
+
+def _error(e: Exception) -> str:
+    return f"{type(e).__name__}: {e}"
+
+
+def shutdown() -> None:
+    """
+    Stop the job threads; queued jobs are dropped.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
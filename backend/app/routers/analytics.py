@@ -0,0 +1,111 @@
+# app/routers/analytics.py
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from .. import analytics, catalog, models, reliability, schemas
+from ..pagination import PageParams, page_response, page_statement
+from ..studies import get_db
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+def _require_question(db: Session, question_id: int) -> None:
+    if not catalog.questions.get(db, question_id):
+        raise HTTPException(status_code=404, detail="Question not found.")
+
+@router.get("/mos", response_model=List[schemas.MosOut])
+def get_mos(question_id: int, image_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    MOS, standard deviation and 95% confidence interval per image, read from
+    the incrementally maintained aggregates.
+    """
+    _require_question(db, question_id)
+    return analytics.mos_table(db, question_id, image_id)
+
+@router.get("/zmos", response_model=List[schemas.ZMosOut])
+def get_zmos(question_id: int, image_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    MOS of scores z-normalized per subject.
+    """
+    _require_question(db, question_id)
+    return analytics.zscore_mos(db, question_id, image_id)
+
+@router.get("/dmos", response_model=List[schemas.DmosOut])
+def get_dmos(question_id: int, db: Session = Depends(get_db)):
+    """
+    Differential MOS of every image that has a hidden reference.
+    """
+    _require_question(db, question_id)
+    return analytics.dmos(db, question_id)
+
+@router.get("/screening", response_model=List[schemas.SubjectScreeningOut])
+def get_screening(question_id: int, db: Session = Depends(get_db)):
+    """
+    ITU-R BT.500 observer screening over the subject x image score matrix.
+    """
+    _require_question(db, question_id)
+    return analytics.bt500_screening(analytics.rating_matrix(db, question_id))
+
+# ---------------------
+# RELIABILITY JOBS
+# ---------------------
+@router.post("/reliability/jobs", response_model=schemas.ReliabilityJobOut, status_code=202)
+def create_reliability_job(question_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Queue a background job computing inter-rater reliability and rater
+    consistency for one question, or for every question without question_id.
+    Poll the job, then read /analytics/reliability/questions and /subjects.
+    """
+    if question_id is not None:
+        _require_question(db, question_id)
+    return reliability.submit(db, question_id)
+
+@router.get("/reliability/jobs", response_model=List[schemas.ReliabilityJobOut])
+def list_reliability_jobs(
+    response: Response,
+    status: Optional[str] = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db)
+):
+    criteria = []
+    if status is not None:
+        criteria.append(models.ReliabilityJob.status == status)
+    rows = db.execute(page_statement(models.ReliabilityJob, page, *criteria)).all()
+    return page_response(models.ReliabilityJob, page, rows, response)
+
+@router.get("/reliability/jobs/{job_id}", response_model=schemas.ReliabilityJobOut)
+def get_reliability_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(models.ReliabilityJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Reliability job not found.")
+    return job
+
+@router.get("/reliability/questions", response_model=List[schemas.QuestionReliabilityOut])
+def get_question_reliability(question_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Krippendorff's alpha, ICC and mean subject correlation per question, as of
+    the last finished job.
+    """
+    stmt = select(models.QuestionReliability).order_by(models.QuestionReliability.question_id)
+    if question_id is not None:
+        stmt = stmt.where(models.QuestionReliability.question_id == question_id)
+    return db.scalars(stmt).all()
+
+@router.get("/reliability/subjects", response_model=List[schemas.SubjectReliabilityOut])
+def get_subject_reliability(
+    question_id: Optional[int] = None,
+    flagged: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Per-subject correlation with the leave-one-out MOS, repeated-stimulus
+    consistency and BT.500 screening; flagged subjects carry their reasons.
+    """
+    SR = models.SubjectReliability
+    stmt = select(SR).order_by(SR.question_id, SR.subject_id)
+    if question_id is not None:
+        stmt = stmt.where(SR.question_id == question_id)
+    if flagged is not None:
+        stmt = stmt.where(SR.flagged == flagged)
+    return db.scalars(stmt).all()
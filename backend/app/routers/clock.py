@@ -0,0 +1,21 @@
+# app/routers/clock.py
+
+from fastapi import APIRouter
+from .. import schemas
+from ..clock import server_time_ms
+
+router = APIRouter(prefix="/clock", tags=["Clock"])
+
+@router.post("/sync", response_model=schemas.ClockSyncOut)
+async def clock_sync(request: schemas.ClockSyncRequest):
+    """
+    One NTP-style sample for estimating the client clock offset (see
+    app/clock.py). Async and free of I/O so it never waits for a threadpool
+    slot or the database.
+    """
+    received = server_time_ms()
+    return schemas.ClockSyncOut(
+        client_sent_ms=request.client_sent_ms,
+        server_received_ms=received,
+        server_sent_ms=server_time_ms(),
+    )
@@ -0,0 +1,35 @@
+# app/routers/exports.py
+
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+from ..export import FORMATS, ExportFilters, stream_export
+from ..studies import require_study
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+@router.get("/ratings")
+def export_ratings(
+    format: Literal["csv", "parquet", "arrow"] = "csv",
+    session_id: Optional[int] = None,
+    subject_id: Optional[int] = None,
+    question_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    study: Optional[str] = Depends(require_study),
+):
+    """
+    Stream every rating joined with its session image, session, subject, image
+    and question, fetched and encoded in batches.
+    """
+    filters = ExportFilters(session_id, subject_id, question_id, since, until)
+    try:
+        chunks = stream_export(format, filters, study=study)
+    except ValueError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="ratings.{format}"'},
+    )
@@ -0,0 +1,72 @@
+# app/routers/feed.py
+
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from .. import feed
+from ..config import settings
+from ..migrations import SchemaVersionError
+from ..studies import StudyNotFound, current_study, registry, require_study
+
+router = APIRouter(prefix="/feed", tags=["Feed"])
+
+async def _closed(websocket: WebSocket) -> None:
+    # Messages from the client are ignored; only the close matters
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+@router.websocket("/ws")
+async def feed_websocket(websocket: WebSocket, session_id: Optional[int] = None):
+    """
+    Live experiment events (see app/feed.py) as one JSON text message each,
+    for the current study, optionally only those of one session.
+    """
+    study = current_study()
+    try:
+        registry.release(await registry.acquire_async(study))
+    except (StudyNotFound, SchemaVersionError):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    with feed.broker.subscribe(study, session_id) as subscription:
+        closed = asyncio.ensure_future(_closed(websocket))
+        try:
+            while True:
+                batch = asyncio.ensure_future(subscription.next_batch())
+                await asyncio.wait({batch, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed.done():
+                    batch.cancel()
+                    return
+                for event in batch.result():
+                    await websocket.send_text(event.encoded().decode())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            closed.cancel()
+
+async def _event_stream(study: Optional[str], session_id: Optional[int]):
+    with feed.broker.subscribe(study, session_id) as subscription:
+        yield b": connected\n\n"
+        while True:
+            try:
+                events = await asyncio.wait_for(subscription.next_batch(), settings.FEED_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream
+                yield b": keep-alive\n\n"
+                continue
+            yield b"".join(
+                b"event: " + event.type.encode() + b"\ndata: " + event.encoded() + b"\n\n" for event in events
+            )
+
+@router.get("/events")
+async def feed_events(session_id: Optional[int] = None, study: Optional[str] = Depends(require_study)):
+    """
+    The same events as /feed/ws as a Server-Sent Events stream (EventSource),
+    with the event type as the SSE event name.
+    """
+    return StreamingResponse(
+        _event_stream(study, session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
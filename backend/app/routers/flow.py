@@ -1,44 +1,76 @@
 # app/routers/flow.py
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from .. import models
-from ..database import get_db
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional
+from .. import derivatives, models, schemas
+from ..studies import current_study, get_async_db
+from ..playlists import cached_playlist, get_manifest, load_playlist
+from ..write_behind import buffer
 
 router = APIRouter(prefix="/flow", tags=["Flow"])
 
 @router.get("/next_image")
-def get_next_image(session_id: int, db: Session = Depends(get_db)):
+async def get_next_image(session_id: int, db: AsyncSession = Depends(get_async_db)):
     # Check session
-    session_obj = db.query(models.Session).get(session_id)
+    session_obj = await db.get(models.Session, session_id)
     if not session_obj:
         raise HTTPException(status_code=404, detail="Session not found.")
     if session_obj.is_completed:
         return {"message": "Session is already completed."}
 
-    # Retrieve last_image_index from your session logic if you store it in the session table
-    # For now, let's assume we have session_obj.last_image_index
-    last_idx = session_obj.last_image_index or 0
-
-    next_si = (
-        db.query(models.SessionImage)
-        .filter(models.SessionImage.session_id == session_id,
-                models.SessionImage.display_order > last_idx)
-        .order_by(models.SessionImage.display_order.asc())
-        .first()
+    # The cursor is advanced when a rating is recorded (or accepted, in
+    # write-behind mode); the playlist is served from the per-session
+    # in-memory cache.
+    position = max(session_obj.last_image_index or 0, buffer.pending_position(current_study(), session_id))
+    playlist = (
+        cached_playlist(session_id, session_obj.total_images)
+        or await db.run_sync(load_playlist, session_id, session_obj.total_images)
     )
-    if not next_si:
-        # no more images
-        session_obj.is_completed = True
-        db.commit()
-        return {"message": "No more images. Session completed."}
+    next_entry = playlist.next_after(position)
+    if not next_entry:
+        # no more images; a GET never writes (retries, archived studies), the
+        # client completes the session with PATCH /sessions/{id}/complete
+        return {"message": "No more images. Complete the session."}
 
     return {
-        "session_image_id": next_si.session_image_id,
+        "session_image_id": next_entry.session_image_id,
         "image_info": {
-            "id": next_si.image.image_id,
-            "file_name": next_si.image.file_name,
-            "file_path": next_si.image.file_path
+            "id": next_entry.image_id,
+            "file_name": next_entry.file_name,
+            "file_path": next_entry.file_path
         },
-        "display_order": next_si.display_order
+        "display_order": next_entry.display_order
     }
+
+@router.get("/manifest", response_model=schemas.SessionManifest)
+async def get_session_manifest(
+    session_id: int,
+    width: Optional[int] = None,
+    format: Literal["webp", "png", "jpeg"] = "webp",
+    quality: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ordered playlist of a session with derivative URLs, keys and byte sizes, so
+    the tablet can prefetch ahead of the cursor or preload the whole block.
+    Cached per session until images are assigned to it (in any worker).
+    """
+    session_obj = await db.get(models.Session, session_id)
+    if not session_obj:
+        raise HTTPException(status_code=404, detail="Session not found.")
+
+    playlist = (
+        cached_playlist(session_id, session_obj.total_images)
+        or await db.run_sync(load_playlist, session_id, session_obj.total_images)
+    )
+    try:
+        manifest = await run_in_threadpool(get_manifest, session_id, playlist, width, format, quality)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Image file not found: {e.filename}")
+    except derivatives.UnreadableImage as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return manifest.model_copy(update={"last_image_index": session_obj.last_image_index or 0})
@@ -1,32 +1,127 @@
 # app/routers/images.py
 
-from fastapi import APIRouter, Depends, HTTPException
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas
-from ..database import get_db
+from typing import List, Literal, Optional
+from .. import catalog, derivatives, models, schemas
+from ..config import settings
+from ..studies import get_db
+from ..ingest import ingest
+from ..pagination import PageParams, cached_page_response
 
 router = APIRouter(prefix="/images", tags=["Images"])
 
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+def _file_response(request: Request, path: str, key: str, media_type: str, cache_control: str):
+    """
+    Serve a derivative with a strong ETag; answers If-None-Match with 304.
+    If-None-Match uses the weak comparison (RFC 9110 13.1.2), so validators
+    a cache or proxy marked weak (W/"...") still match. FileResponse handles
+    Range/If-Range requests.
+    """
+    headers = {"ETag": f'"{key}"', "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    if headers["ETag"] in tags or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
 @router.post("/", response_model=schemas.ImageOut)
 def create_image(image_in: schemas.ImageCreate, db: Session = Depends(get_db)):
     new_image = models.Image(
         file_name=image_in.file_name,
         file_path=image_in.file_path,
-        description=image_in.description
+        description=image_in.description,
+        reference_image_id=image_in.reference_image_id
     )
     db.add(new_image)
+    catalog.images.invalidate(db)
     db.commit()
     db.refresh(new_image)
     return new_image
 
+@router.post("/ingest", response_model=schemas.ImageIngestReport)
+def ingest_images(
+    path: Optional[str] = None,
+    features: bool = False,
+    dry_run: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Ingest the image files under `path` (relative to the image folder; default
+    the whole folder) into the images table. Unchanged files are skipped, so
+    re-running is cheap; the first run over a large tree is better done with
+    `python -m backend.app.ingest`.
+    """
+    image_dir = os.path.realpath(settings.IMAGE_DIR)
+    root = os.path.realpath(os.path.join(image_dir, path or ""))
+    if os.path.commonpath([image_dir, root]) != image_dir:
+        raise HTTPException(status_code=422, detail="path must be inside the image folder.")
+    # Keep the configured (possibly relative) prefix: file_path values are served as URLs
+    root = os.path.join(settings.IMAGE_DIR, os.path.relpath(root, image_dir))
+    try:
+        return ingest(db, root, features=features, dry_run=dry_run)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Directory not found.")
+
 @router.get("/", response_model=List[schemas.ImageOut])
-def list_images(db: Session = Depends(get_db)):
-    return db.query(models.Image).all()
+def list_images(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db)):
+    items = catalog.images.page(db, page.after, page.limit + 1)
+    return cached_page_response(models.Image, page, items, response)
+
+@router.get("/derivatives/{name}")
+def get_derivative_by_name(name: str, request: Request):
+    """
+    Serve a cached derivative by its content-addressed name ({key}.{format}).
+    The name never changes meaning, so the response is cacheable forever.
+    """
+    path = derivatives.cached_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Derivative not found.")
+    key, fmt = name.split(".")
+    return _file_response(request, path, key, derivatives.FORMATS[fmt][1], IMMUTABLE)
+
+@router.get("/{image_id}/derivative")
+def get_image_derivative(
+    image_id: int,
+    request: Request,
+    width: Optional[int] = None,
+    format: Literal["webp", "png", "jpeg"] = "webp",
+    quality: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Serve the image resized to at most `width` pixels wide (lossless WebP by
+    default; pass `quality` for lossy output). The response is revalidated via
+    its ETag; the content-addressed URL is returned in the Content-Location
+    header for immutable caching.
+    """
+    image = catalog.images.get(db, image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found.")
+    try:
+        derivative = derivatives.get_derivative(
+            derivatives.source_path(image.file_name, image.file_path), width, format, quality
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image file not found.")
+    except derivatives.UnreadableImage as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    response = _file_response(request, derivative.path, derivative.key, derivative.media_type, REVALIDATE)
+    response.headers["Content-Location"] = f"{router.prefix}/derivatives/{derivative.name}"
+    return response
 
 @router.get("/{image_id}", response_model=schemas.ImageOut)
 def get_image(image_id: int, db: Session = Depends(get_db)):
-    image = db.query(models.Image).get(image_id)
+    image = catalog.images.get(db, image_id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found.")
     return image
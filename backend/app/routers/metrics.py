@@ -0,0 +1,25 @@
+# app/routers/metrics.py
+
+from typing import List
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..instrumentation import render_metrics, slow_queries
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Request latency, per-request query counts/time and slow statement counts
+    in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/slow-queries", response_model=List[dict])
+def get_slow_queries():
+    """
+    The most recent statements slower than SLOW_QUERY_MS, newest first.
+    """
+    return slow_queries()
@@ -0,0 +1,141 @@
+# app/routers/playlists.py
+
+from collections import Counter
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List
+from .. import models, schemas
+from ..counterbalance import build_order, design_key
+from ..database import upsert
+from ..studies import get_async_db
+from ..playlists import invalidate_playlist
+from ..progress import add_stimuli
+
+router = APIRouter(prefix="/playlists", tags=["Playlists"])
+
+
+async def _latin_square_rows(
+    sessions: List[models.Session], image_ids: List[int], db: AsyncSession
+) -> Dict[int, int]:
+    """
+    Hand the next Latin-square rows of each design to the sessions, in order.
+
+    The counters live in the database, so rows keep rotating across calls and
+    workers; they are taken in the caller's transaction and roll back with it.
+    """
+    by_design: Dict[str, List[int]] = {}
+    for session in sessions:
+        by_design.setdefault(design_key(image_ids, session.session_type), []).append(session.session_id)
+
+    rows = {}
+    for design, session_ids in by_design.items():
+        count = len(session_ids)
+        stmt = upsert(db, models.LatinSquareCounter).values(design=design, next_row=count)
+        next_row = await db.scalar(
+            stmt.on_conflict_do_update(
+                index_elements=["design"],
+                set_={"next_row": models.LatinSquareCounter.next_row + count},
+            ).returning(models.LatinSquareCounter.next_row)
+        )
+        rows.update(zip(session_ids, range(next_row - count, next_row)))
+    return rows
+
+
+async def _generate(
+    session_ids: List[int], spec: schemas.PlaylistSpec, db: AsyncSession
+) -> List[schemas.PlaylistOut]:
+    """
+    Build and store the playlists of several sessions in one transaction.
+    """
+    sessions = {
+        s.session_id: s
+        for s in await db.scalars(
+            select(models.Session).where(models.Session.session_id.in_(session_ids))
+        )
+    }
+    missing_sessions = set(session_ids) - sessions.keys()
+    if missing_sessions:
+        raise HTTPException(status_code=404, detail=f"Session(s) not found: {sorted(missing_sessions)}")
+
+    image_ids = set(spec.image_ids) | set(spec.training_image_ids)
+    found_images = set(await db.scalars(
+        select(models.Image.image_id).where(models.Image.image_id.in_(image_ids))
+    ))
+    missing_images = image_ids - found_images
+    if missing_images:
+        raise HTTPException(status_code=404, detail=f"Image(s) not found: {sorted(missing_images)}")
+
+    session_ids = list(dict.fromkeys(session_ids))
+    latin_rows = (
+        await _latin_square_rows([sessions[s] for s in session_ids], spec.image_ids, db)
+        if spec.strategy == "latin_square" else {}
+    )
+
+    playlists = []
+    rows = []
+    for session_id in session_ids:
+        session = sessions[session_id]
+        try:
+            order = build_order(
+                spec.image_ids,
+                strategy=spec.strategy,
+                seed=spec.seed,
+                subject_id=session.subject_id,
+                session_type=session.session_type,
+                row=latin_rows.get(session_id, 0),
+                sources=spec.sources,
+                no_repeat_source=spec.no_repeat_source,
+                training_image_ids=spec.training_image_ids,
+                training_every=spec.training_every,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        rows.extend(
+            {
+                "session_id": session_id,
+                "image_id": image_id,
+                "display_order": position,
+                "is_training": is_training,
+            }
+            for position, (image_id, is_training) in enumerate(order, start=1)
+        )
+        playlists.append(schemas.PlaylistOut(
+            session_id=session_id,
+            subject_id=session.subject_id,
+            image_ids=[image_id for image_id, _ in order],
+            is_training=[is_training for _, is_training in order],
+        ))
+
+    try:
+        if rows:
+            await db.execute(insert(models.SessionImage), rows)
+            await db.run_sync(add_stimuli, Counter(row["session_id"] for row in rows))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Images are already assigned to one of the sessions.")
+    for playlist in playlists:
+        invalidate_playlist(playlist.session_id)
+    return playlists
+
+
+@router.post("/cohort", response_model=List[schemas.PlaylistOut])
+async def generate_cohort_playlists(request: schemas.CohortPlaylistRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Generate and assign playlists for a whole cohort of sessions in one call.
+    Latin-square rows are handed out in session order, continuing where the
+    previous playlists of the same design stopped; random seeds are derived
+    from each session's subject.
+    """
+    return await _generate(request.session_ids, request.spec, db)
+
+
+@router.post("/{session_id}", response_model=schemas.PlaylistOut)
+async def generate_session_playlist(session_id: int, spec: schemas.PlaylistSpec, db: AsyncSession = Depends(get_async_db)):
+    """
+    Generate and assign the playlist of a single session.
+    """
+    return (await _generate([session_id], spec, db))[0]
@@ -1,10 +1,11 @@
 # app/routers/questions.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List
-from .. import models, schemas
-from ..database import get_db
+from .. import catalog, models, schemas
+from ..studies import get_db
+from ..pagination import PageParams, cached_page_response
 
 router = APIRouter(prefix="/questions", tags=["Questions"])
 
@@ -12,17 +13,19 @@ router = APIRouter(prefix="/questions", tags=["Questions"])
 def create_question(question_in: schemas.QuestionCreate, db: Session = Depends(get_db)):
     new_question = models.Question(**question_in.dict())
     db.add(new_question)
+    catalog.questions.invalidate(db)
     db.commit()
     db.refresh(new_question)
     return new_question
 
 @router.get("/", response_model=List[schemas.QuestionOut])
-def list_questions(db: Session = Depends(get_db)):
-    return db.query(models.Question).all()
+def list_questions(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db)):
+    items = catalog.questions.page(db, page.after, page.limit + 1)
+    return cached_page_response(models.Question, page, items, response)
 
 @router.get("/{question_id}", response_model=schemas.QuestionOut)
 def get_question(question_id: int, db: Session = Depends(get_db)):
-    q = db.query(models.Question).get(question_id)
+    q = catalog.questions.get(db, question_id)
     if not q:
         raise HTTPException(status_code=404, detail="Question not found.")
     return q
@@ -1,38 +1,401 @@
 # app/routers/ratings.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas
-from ..database import get_db
+import zlib
+
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, NamedTuple, Optional, Union
+from .. import catalog, feed, models, schemas
+from ..analytics import record_scores
+from ..clock import CLIENT_TIMING_FIELDS, corrected_timing
+from ..database import upsert
+from ..studies import current_study, get_async_db
+from ..pagination import PageParams, page_statement, rows_page_response
+from ..playlists import advance_cursors
+from ..progress import record_progress
+from ..serialization import schema_columns
+from ..write_behind import buffer
 
 router = APIRouter(prefix="/ratings", tags=["Ratings"])
 
-@router.post("/", response_model=schemas.RatingOut)
-def create_rating(rating_in: schemas.RatingCreate, db: Session = Depends(get_db)):
+RATING_COLUMNS = schema_columns(models.Rating, schemas.RatingOut)
+
+# Queued ratings are committed in chunks of this size so a dropped upload
+# still advances the device's high-water mark for what was applied.
+SYNC_CHUNK_SIZE = 200
+
+# Largest sync batch accepted, after decompression: a few bytes of gzip can
+# inflate to gigabytes, so bodies are inflated only up to this size
+MAX_SYNC_BYTES = 16 << 20
+
+# zlib window bits of the accepted Content-Encodings
+SYNC_ENCODINGS = {"gzip": 31, "deflate": 15}
+
+class SessionImageInfo(NamedTuple):
+    session_id: int
+    display_order: int
+    image_id: int
+    subject_id: int
+    is_training: bool
+
+async def _session_image_info(db: AsyncSession, si_ids) -> Dict[int, SessionImageInfo]:
+    """
+    Map each existing session_image_id to its position, image and subject.
+    """
+    rows = await db.execute(
+        select(
+            models.SessionImage.session_image_id,
+            models.SessionImage.session_id,
+            models.SessionImage.display_order,
+            models.SessionImage.image_id,
+            models.Session.subject_id,
+            models.SessionImage.is_training,
+        )
+        .join(models.Session, models.SessionImage.session_id == models.Session.session_id)
+        .where(models.SessionImage.session_image_id.in_(si_ids))
+    )
+    return {si_id: SessionImageInfo(*info) for si_id, *info in rows}
+
+def _rating_row(rating_in: schemas.RatingCreate, exclude=frozenset()) -> dict:
+    """
+    Column values for a new rating, with client timestamps mapped to server time.
+    """
+    return {**rating_in.dict(exclude=CLIENT_TIMING_FIELDS | exclude), **corrected_timing(rating_in)}
+
+def _scores(found_si: Dict[int, SessionImageInfo], ratings) -> list:
+    """
+    (image_id, subject_id, question_id, value) of non-training ratings for the
+    MOS aggregates.
+    """
+    scores = []
+    for session_image_id, question_id, value in ratings:
+        info = found_si[session_image_id]
+        if not info.is_training:
+            scores.append((info.image_id, info.subject_id, question_id, value))
+    return scores
+
+def _rating_events(ratings, found_si: Dict[int, SessionImageInfo], newly_rated, positions) -> None:
+    """
+    Publish committed ratings (RatingOut-shaped mappings) and the progress
+    they made to the live feed.
+    """
+    if not feed.broker.listening():
+        return
+    feed.ratings_created(
+        (dict(rating) for rating in ratings),
+        {si_id: info.session_id for si_id, info in found_si.items()},
+    )
+    feed.progress(newly_rated, positions)
+
+def _furthest_positions(positions) -> Dict[int, int]:
+    """
+    Reduce (session_id, display_order) pairs to the furthest order per session.
+    """
+    furthest: Dict[int, int] = {}
+    for session_id, order in positions:
+        furthest[session_id] = max(order, furthest.get(session_id, order))
+    return furthest
+
+async def _insert_new(db: AsyncSession, found_si: Dict[int, SessionImageInfo], rows: List[dict]):
+    """
+    Insert rating rows, skipping any already answered, and account for the new
+    ones in cursors, aggregates and progress. Returns the inserted rows
+    (RATING_COLUMNS mappings), newly rated stimuli and furthest positions per
+    session for the feed; the caller commits.
+    """
+    inserted = (await db.execute(
+        upsert(db, models.Rating)
+        .on_conflict_do_nothing()
+        .returning(*RATING_COLUMNS),
+        rows
+    )).mappings().all()
+    positions = _furthest_positions(
+        (found_si[row["session_image_id"]].session_id, found_si[row["session_image_id"]].display_order)
+        for row in rows
+    )
+    await db.run_sync(advance_cursors, positions)
+    # Only newly inserted rows count towards the aggregates
+    await db.run_sync(record_scores, _scores(
+        found_si, [(r["session_image_id"], r["question_id"], r["rating_value"]) for r in inserted]
+    ))
+    newly_rated = await db.run_sync(record_progress, [
+        (r["session_image_id"], found_si[r["session_image_id"]].session_id, r["response_time"])
+        for r in inserted
+    ])
+    return inserted, newly_rated, positions
+
+async def _queue_rating(
+    rating_in: schemas.RatingCreate, si: SessionImageInfo, response: Response, db: AsyncSession
+) -> schemas.RatingQueued:
+    # Write-behind mode: durable in the local log now, stored by apply_queued()
+    study = current_study()
+    if buffer.pending(study, rating_in.session_image_id, rating_in.question_id) or await db.scalar(
+        select(models.Rating.rating_id).where(
+            models.Rating.session_image_id == rating_in.session_image_id,
+            models.Rating.question_id == rating_in.question_id,
+        )
+    ):
+        raise HTTPException(status_code=409, detail="Question already answered for this SessionImage.")
+    accepted_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    try:
+        await buffer.append(
+            {"rating": rating_in.model_dump(), "accepted_at": accepted_at.isoformat()},
+            rating_in.session_image_id, rating_in.question_id, si.session_id, si.display_order,
+        )
+    except (OSError, RuntimeError):
+        raise HTTPException(status_code=503, detail="Could not record the rating; please retry.")
+    response.status_code = 202
+    row = _rating_row(rating_in)
+    return schemas.RatingQueued(
+        **{name: row[name] for name in schemas.RatingQueued.model_fields if name in row}, accepted_at=accepted_at
+    )
+
+async def apply_queued(db: AsyncSession, payloads: List[dict]) -> None:
+    """
+    Group commit of ratings accepted in write-behind mode (app/write_behind.py),
+    with their cursors, aggregates and progress. Ratings already stored are
+    skipped, so a log can be replayed.
+    """
+    ratings_in = [schemas.RatingCreate.model_validate(p["rating"]) for p in payloads]
+    found_si = await _session_image_info(db, {r.session_image_id for r in ratings_in})
+    rows = [
+        {**_rating_row(r), "created_at": datetime.fromisoformat(p["accepted_at"])}
+        for r, p in zip(ratings_in, payloads) if r.session_image_id in found_si
+    ]
+    if not rows:
+        return
+    inserted, newly_rated, positions = await _insert_new(db, found_si, rows)
+    await db.commit()
+    _rating_events(inserted, found_si, newly_rated, positions)
+
+@router.post("/", response_model=Union[schemas.RatingOut, schemas.RatingQueued])
+async def create_rating(
+    rating_in: schemas.RatingCreate, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Record one answer. In write-behind mode (settings.WRITE_BEHIND) the rating
+    is acknowledged with 202 and a RatingQueued once it is in the local log,
+    and stored within settings.WRITE_BEHIND_INTERVAL_MS.
+    """
     # Validate session_image
-    si = db.query(models.SessionImage).get(rating_in.session_image_id)
-    if not si:
+    found_si = await _session_image_info(db, [rating_in.session_image_id])
+    if not found_si:
         raise HTTPException(status_code=404, detail="SessionImage not found.")
+    si = found_si[rating_in.session_image_id]
 
-    # Validate question
-    question = db.query(models.Question).get(rating_in.question_id)
+    # Validate question (served from the catalog cache)
+    question = await db.run_sync(catalog.questions.get, rating_in.question_id)
     if not question:
         raise HTTPException(status_code=404, detail="Question not found.")
 
-    new_rating = models.Rating(**rating_in.dict())
+    if buffer.enabled:
+        return await _queue_rating(rating_in, si, response, db)
+
+    new_rating = models.Rating(**_rating_row(rating_in))
     db.add(new_rating)
-    db.commit()
-    db.refresh(new_rating)
+    await db.run_sync(advance_cursors, {si.session_id: si.display_order})
+    try:
+        await db.flush()
+        await db.run_sync(record_scores, _scores(
+            found_si, [(rating_in.session_image_id, rating_in.question_id, rating_in.rating_value)]
+        ))
+        newly_rated = await db.run_sync(
+            record_progress, [(rating_in.session_image_id, si.session_id, new_rating.response_time)]
+        )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Question already answered for this SessionImage.")
+    await db.refresh(new_rating)
+    _rating_events(
+        [schemas.RatingOut.model_validate(new_rating).model_dump()], found_si,
+        newly_rated, {si.session_id: si.display_order},
+    )
     return new_rating
 
+@router.post("/batch", response_model=List[schemas.RatingOut])
+async def create_ratings_batch(ratings_in: List[schemas.RatingCreate], db: AsyncSession = Depends(get_async_db)):
+    """
+    Record every answer of one or more session images in a single transaction.
+    Session images are validated with one IN (...) query and questions against
+    the catalog cache; the rows are inserted with a single executemany
+    INSERT ... RETURNING.
+    """
+    if not ratings_in:
+        return []
+
+    # Validate session_images
+    si_ids = {r.session_image_id for r in ratings_in}
+    found_si = await _session_image_info(db, si_ids)
+    missing_si = si_ids - found_si.keys()
+    if missing_si:
+        raise HTTPException(
+            status_code=404,
+            detail=f"SessionImage(s) not found: {sorted(missing_si)}"
+        )
+
+    # Validate questions
+    q_ids = {r.question_id for r in ratings_in}
+    found_q = await db.run_sync(catalog.questions.get_many, q_ids)
+    missing_q = q_ids - found_q.keys()
+    if missing_q:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Question(s) not found: {sorted(missing_q)}"
+        )
+
+    try:
+        new_ratings = (await db.scalars(
+            insert(models.Rating).returning(models.Rating, sort_by_parameter_order=True),
+            [_rating_row(r) for r in ratings_in]
+        )).all()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Batch contains a question already answered for its SessionImage."
+        )
+    positions = _furthest_positions((info.session_id, info.display_order) for info in found_si.values())
+    await db.run_sync(advance_cursors, positions)
+    await db.run_sync(record_scores, _scores(
+        found_si, [(r.session_image_id, r.question_id, r.rating_value) for r in new_ratings]
+    ))
+    newly_rated = await db.run_sync(record_progress, [
+        (r.session_image_id, found_si[r.session_image_id].session_id, r.response_time) for r in new_ratings
+    ])
+    await db.commit()
+    _rating_events(
+        (schemas.RatingOut.model_validate(r).model_dump() for r in new_ratings), found_si,
+        newly_rated, positions,
+    )
+    return new_ratings
+
+async def _decode_sync_batch(request: Request) -> schemas.RatingSyncBatch:
+    """
+    Read a (optionally gzip/deflate compressed) sync batch from the request body.
+    """
+    raw = await request.body()
+    encoding = request.headers.get("content-encoding", "").lower()
+    if encoding in SYNC_ENCODINGS:
+        decompressor = zlib.decompressobj(SYNC_ENCODINGS[encoding])
+        try:
+            raw = decompressor.decompress(raw, MAX_SYNC_BYTES + 1)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail=f"Invalid {encoding} request body.")
+        if decompressor.unconsumed_tail or len(raw) > MAX_SYNC_BYTES:
+            raise HTTPException(status_code=413, detail=f"Sync batch larger than {MAX_SYNC_BYTES} bytes.")
+        if not decompressor.eof:
+            raise HTTPException(status_code=400, detail=f"Truncated {encoding} request body.")
+    elif len(raw) > MAX_SYNC_BYTES:
+        raise HTTPException(status_code=413, detail=f"Sync batch larger than {MAX_SYNC_BYTES} bytes.")
+    try:
+        return schemas.RatingSyncBatch.model_validate_json(raw)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+async def _get_sync_cursor(db: AsyncSession, device_id: str) -> models.SyncCursor:
+    cursor = await db.get(models.SyncCursor, device_id)
+    if not cursor:
+        cursor = models.SyncCursor(device_id=device_id, high_water_mark=0)
+        db.add(cursor)
+    return cursor
+
+@router.post("/sync", response_model=schemas.RatingSyncResult)
+async def sync_ratings(
+    batch: schemas.RatingSyncBatch = Depends(_decode_sync_batch),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Apply a batch of ratings queued offline by a tablet.
+
+    Items are applied in client_seq order and deduplicated on client_key (and
+    on the session_image/question pair), so a batch can safely be resent. Each
+    chunk is committed together with the device's high-water mark; the client
+    drops every queued item whose client_seq is at or below the returned value.
+    The body is a schemas.RatingSyncBatch, optionally sent with
+    Content-Encoding: gzip.
+    """
+    cursor = await _get_sync_cursor(db, batch.device_id)
+    result = schemas.RatingSyncResult(
+        device_id=batch.device_id, high_water_mark=cursor.high_water_mark or 0
+    )
+
+    # Anything at or below the high-water mark was acknowledged in an earlier upload
+    pending = sorted(
+        (r for r in batch.ratings if r.client_seq > result.high_water_mark),
+        key=lambda r: r.client_seq
+    )
+    if not pending:
+        await db.commit()
+        return result
+
+    # Validate session_images and questions for the whole batch up front
+    found_si = await _session_image_info(db, {r.session_image_id for r in pending})
+    found_q = await db.run_sync(catalog.questions.get_many, {r.question_id for r in pending})
+
+    for start in range(0, len(pending), SYNC_CHUNK_SIZE):
+        chunk = pending[start:start + SYNC_CHUNK_SIZE]
+        rows = []
+        for r in chunk:
+            if r.session_image_id in found_si and r.question_id in found_q:
+                rows.append(_rating_row(r, exclude={"client_seq"}))
+            else:
+                # Rejected items are still acknowledged so they cannot jam the queue
+                result.rejected.append(r.client_key)
+
+        if rows:
+            inserted, newly_rated, positions = await _insert_new(db, found_si, rows)
+            result.applied += len(inserted)
+            result.duplicates += len(rows) - len(inserted)
+
+        result.high_water_mark = chunk[-1].client_seq
+        cursor.high_water_mark = result.high_water_mark
+        await db.commit()
+        if rows:
+            _rating_events(inserted, found_si, newly_rated, positions)
+
+    return result
+
+@router.get("/sync/{device_id}", response_model=schemas.RatingSyncResult)
+async def get_sync_state(device_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Return the device's high-water mark so the client only resends unseen items.
+    """
+    cursor = await db.get(models.SyncCursor, device_id)
+    return schemas.RatingSyncResult(
+        device_id=device_id,
+        high_water_mark=cursor.high_water_mark if cursor else 0
+    )
+
 @router.get("/", response_model=List[schemas.RatingOut])
-def list_ratings(db: Session = Depends(get_db)):
-    return db.query(models.Rating).all()
+async def list_ratings(
+    session_image_id: Optional[int] = None,
+    question_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
+    criteria = []
+    if session_image_id is not None:
+        criteria.append(models.Rating.session_image_id == session_image_id)
+    if question_id is not None:
+        criteria.append(models.Rating.question_id == question_id)
+    if since is not None:
+        criteria.append(models.Rating.created_at >= since)
+    if until is not None:
+        criteria.append(models.Rating.created_at < until)
+    result = await db.execute(page_statement(models.Rating, page, *criteria, columns=RATING_COLUMNS))
+    return rows_page_response(models.Rating, page, result)
 
 @router.get("/{rating_id}", response_model=schemas.RatingOut)
-def get_rating(rating_id: int, db: Session = Depends(get_db)):
-    rating = db.query(models.Rating).get(rating_id)
+async def get_rating(rating_id: int, db: AsyncSession = Depends(get_async_db)):
+    rating = await db.get(models.Rating, rating_id)
     if not rating:
         raise HTTPException(status_code=404, detail="Rating not found.")
     return rating
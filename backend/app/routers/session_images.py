@@ -1,127 +1,194 @@
 # app/routers/session_images.py
 
+import os
+
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas
-from ..database import get_db
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import Dict, List, Set, Tuple
+from .. import catalog, models, schemas
+from ..config import settings
+from ..database import upsert
+from ..studies import get_async_db
+from ..playlists import invalidate_playlist
+from ..progress import add_stimuli
+from ..serialization import FastJSONResponse, schema_columns
 
 # router = APIRouter(prefix="/session-images", tags=["SessionImages"])
 
 router = APIRouter(prefix="/session-images", tags=["Sessions Images"])
 
+# Base path for your static image folder
+STATIC_IMAGE_FOLDER = settings.IMAGE_DIR
+
+# folder -> (directory mtime, file names)
+_folder_listings: Dict[str, Tuple[int, Set[str]]] = {}
+
+# Columns of SessionImageOut and its nested ImageOut, for the fast JSON path
+SI_COLUMNS = schema_columns(models.SessionImage, schemas.SessionImageOut)
+IMAGE_COLUMNS = schema_columns(models.Image, schemas.ImageOut)
+SI_KEYS = [c.name for c in SI_COLUMNS]
+IMAGE_KEYS = [c.name for c in IMAGE_COLUMNS]
+
+
+def _session_image_dict(si_row, image: dict) -> dict:
+    item = dict(zip(SI_KEYS, si_row))
+    item["image"] = image
+    return item
+
 
 @router.post("/", response_model=schemas.SessionImageOut)
-def create_session_image(si_in: schemas.SessionImageCreate, db: Session = Depends(get_db)):
+async def create_session_image(si_in: schemas.SessionImageCreate, db: AsyncSession = Depends(get_async_db)):
     # Validate session and image exist
-    session_obj = db.query(models.Session).get(si_in.session_id)
+    session_obj = await db.get(models.Session, si_in.session_id)
     if not session_obj:
         raise HTTPException(status_code=404, detail="Session not found.")
 
-    image_obj = db.query(models.Image).get(si_in.image_id)
-    if not image_obj:
+    image = await db.run_sync(catalog.images.get, si_in.image_id)
+    if not image:
         raise HTTPException(status_code=404, detail="Image not found.")
 
     new_si = models.SessionImage(**si_in.dict())
     db.add(new_si)
-    db.commit()
-    db.refresh(new_si)
-    return new_si
+    await db.run_sync(add_stimuli, {si_in.session_id: 1})
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="display_order already used in this session.")
+    invalidate_playlist(si_in.session_id)
+    return schemas.SessionImageOut(
+        session_image_id=new_si.session_image_id,
+        session_id=new_si.session_id,
+        image_id=new_si.image_id,
+        display_order=new_si.display_order,
+        is_training=new_si.is_training,
+        image=image,
+    )
 
 @router.get("/{session_image_id}", response_model=schemas.SessionImageOut)
-def get_session_image(session_image_id: int, db: Session = Depends(get_db)):
-    si = db.query(models.SessionImage).get(session_image_id)
+async def get_session_image(session_image_id: int, db: AsyncSession = Depends(get_async_db)):
+    si = await db.get(
+        models.SessionImage, session_image_id,
+        options=[joinedload(models.SessionImage.image)]
+    )
     if not si:
         raise HTTPException(status_code=404, detail="SessionImage not found.")
     return si
 
 # app/routers/session_images.py
 @router.get("/", response_model=List[schemas.SessionImageOut])
-def get_session_images(session_id: int, db: Session = Depends(get_db)):
+async def get_session_images(session_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Retrieve all images assigned to a session.
     """
-    session_images = (
-        db.query(models.SessionImage)
-        .filter(models.SessionImage.session_id == session_id)
+    rows = (await db.execute(
+        select(*SI_COLUMNS, *IMAGE_COLUMNS)
         .join(models.Image, models.SessionImage.image_id == models.Image.image_id)
-        .all()
-    )
+        .where(models.SessionImage.session_id == session_id)
+    )).all()
 
-    if not session_images:
+    if not rows:
         raise HTTPException(status_code=404, detail="No images found for the session")
 
-    return session_images
+    n = len(SI_COLUMNS)
+    return FastJSONResponse([
+        _session_image_dict(row[:n], dict(zip(IMAGE_KEYS, row[n:]))) for row in rows
+    ])
 
 
-@router.post("/{session_id}/assign_images", response_model=List[schemas.SessionImageOut])
-def assign_images_to_session(session_id: int, image_ids: List[int], db: Session = Depends(get_db)):
+def _image_folder_listing(folder: str) -> Set[str]:
     """
-    Assign a list of images to a session. Dynamically populate the Image table if needed.
+    File names in folder, re-listed only when the directory's mtime changes.
     """
-    import os
+    try:
+        mtime = os.stat(folder).st_mtime_ns
+    except FileNotFoundError:
+        return set()
+    cached = _folder_listings.get(folder)
+    if cached is None or cached[0] != mtime:
+        with os.scandir(folder) as entries:
+            cached = (mtime, {e.name for e in entries if e.is_file()})
+        _folder_listings[folder] = cached
+    return cached[1]
 
-    # Base path for your static image folder
-    static_image_folder = "backend/images"
 
+@router.post("/{session_id}/assign_images", response_model=List[schemas.SessionImageOut])
+async def assign_images_to_session(session_id: int, image_ids: List[int], db: AsyncSession = Depends(get_async_db)):
+    """
+    Assign a list of images to a session. Dynamically populate the Image table if needed.
+
+    Files are checked against a cached listing of the image folder, existing
+    images are looked up in the catalog cache, and the missing Image rows and
+    all SessionImage rows are written with one bulk INSERT each.
+    """
     # Fetch the session from the database
-    session = db.query(models.Session).filter(models.Session.session_id == session_id).first()
+    session = await db.get(models.Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    session_images = []
-    for order, image_id in enumerate(image_ids, start=1):
-        # Construct the file name and path
-        file_name = f"{image_id}.jpg"  # Assuming files are named as `1.jpg`, `2.jpg`, etc.
-        file_path = os.path.join(static_image_folder, file_name)
-
-        # Check if the file exists locally
-        if not os.path.isfile(file_path):
-            raise HTTPException(status_code=404, detail=f"File {file_path} not found")
-
-        # Check if the image exists in the database; if not, create it
-        image = db.query(models.Image).filter(models.Image.image_id == image_id).first()
-        if not image:
-            # Dynamically create a new image entry
-            image = models.Image(
-                image_id=image_id,
-                file_name=file_name,
-                file_path=file_path,
-                description=f"Image {image_id}",
-                
-            )
-            db.add(image)
-
-        # Create a new session image
-        session_image = models.SessionImage(
-            session_id=session_id,
-            image_id=image.image_id,
-            display_order=order,
-            is_training=(session.session_type.lower() == "training"),
-        )
-        db.add(session_image)
-        session_images.append(session_image)
-
-    # Commit all changes
-    db.commit()
-    # return session_images
-    # Serialize the response to ensure datetime fields are strings
-    response = [
-        schemas.SessionImageOut(
-            session_image_id=si.session_image_id,
-            session_id=si.session_id,
-            image_id=si.image_id,
-            display_order=si.display_order,
-            is_training=si.is_training,
-            image={
-                "image_id": si.image.image_id,
-                "file_name": si.image.file_name,
-                "file_path": si.image.file_path,
-                "description": si.image.description,
-                "created_at": si.image.created_at.isoformat() if si.image.created_at else None,
-            } if si.image else None,
-        )
-        for si in session_images
+    # Files are named after the image id: `1.jpg`, `2.jpg`, etc.
+    file_names = {image_id: f"{image_id}.jpg" for image_id in image_ids}
+    available = _image_folder_listing(STATIC_IMAGE_FOLDER)
+    missing_files = [
+        os.path.join(STATIC_IMAGE_FOLDER, name)
+        for name in dict.fromkeys(file_names.values()) if name not in available
     ]
-    return response
-
+    if missing_files:
+        raise HTTPException(status_code=404, detail=f"File(s) not found: {missing_files}")
+
+    # Check which images exist (catalog cache); create the rest in one INSERT
+    images = {
+        image_id: image.model_dump()
+        for image_id, image in (await db.run_sync(catalog.images.get_many, file_names.keys())).items()
+    }
+    new_images = [
+        {
+            "image_id": image_id,
+            "file_name": file_name,
+            "file_path": os.path.join(STATIC_IMAGE_FOLDER, file_name),
+            "description": f"Image {image_id}",
+        }
+        for image_id, file_name in file_names.items() if image_id not in images
+    ]
+    if new_images:
+        # Another request may be creating the same images concurrently
+        for row in await db.execute(
+            upsert(db, models.Image).on_conflict_do_nothing().returning(*IMAGE_COLUMNS), new_images
+        ):
+            image = dict(zip(IMAGE_KEYS, row))
+            images[image["image_id"]] = image
+        raced = [image["image_id"] for image in new_images if image["image_id"] not in images]
+        if raced:
+            for row in await db.execute(select(*IMAGE_COLUMNS).where(models.Image.image_id.in_(raced))):
+                images[row.image_id] = dict(zip(IMAGE_KEYS, row))
+        await db.run_sync(catalog.images.invalidate)
+
+    is_training = session.session_type.lower() == "training"
+    try:
+        session_images = (await db.execute(
+            insert(models.SessionImage).returning(*SI_COLUMNS, sort_by_parameter_order=True),
+            [
+                {
+                    "session_id": session_id,
+                    "image_id": image_id,
+                    "display_order": order,
+                    "is_training": is_training,
+                }
+                for order, image_id in enumerate(image_ids, start=1)
+            ]
+        )).all() if image_ids else []
+        await db.run_sync(add_stimuli, {session_id: len(session_images)})
+        # Commit all changes
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Images are already assigned to this session.")
+    invalidate_playlist(session_id)
+
+    # Build the response from the rows already in hand (no relationship loads)
+    return FastJSONResponse([
+        _session_image_dict(si, images[si.image_id]) for si in session_images
+    ])
@@ -1,13 +1,24 @@
 # app/routers/sessions.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas
-from ..database import get_db
+from typing import List, Optional
+from .. import feed, models, schemas
+from ..studies import current_study, get_db
+from ..pagination import PageParams, page_response, page_statement
+from ..playlists import invalidate_playlist
+from ..write_behind import buffer
 
 router = APIRouter(prefix="/sessions", tags=["Sessions"])
 
+S = models.Session
+PROGRESS_COLUMNS = (
+    S.session_id, S.subject_id, S.session_type, S.is_completed,
+    S.total_images, S.rated_images, S.last_image_index, S.start_time, S.last_activity_at,
+    (S.response_time_total / func.nullif(S.response_time_count, 0)).label("avg_response_time"),
+)
+
 @router.post("/", response_model=schemas.SessionOut)
 def create_session(session_in: schemas.SessionCreate, db: Session = Depends(get_db)):
     # Ensure subject exists
@@ -22,8 +33,23 @@ def create_session(session_in: schemas.SessionCreate, db: Session = Depends(get_
     db.add(new_session)
     db.commit()
     db.refresh(new_session)
+    feed.session_changed("session.started", new_session)
     return new_session
 
+@router.get("/active", response_model=List[schemas.SessionProgress])
+def list_active_sessions(db: Session = Depends(get_db)):
+    """
+    Live progress of every session not yet completed, for the operator
+    dashboard. Reads only the denormalized counters on the sessions table,
+    through the is_completed index.
+    """
+    rows = db.execute(
+        select(*PROGRESS_COLUMNS)
+        .where(S.is_completed == False)  # noqa: E712
+        .order_by(S.session_id)
+    ).all()
+    return [dict(row._mapping) for row in rows]
+
 @router.get("/{session_id}", response_model=schemas.SessionOut)
 def get_session(session_id: int, db: Session = Depends(get_db)):
     session_obj = db.query(models.Session).get(session_id)
@@ -32,15 +58,66 @@ def get_session(session_id: int, db: Session = Depends(get_db)):
     return session_obj
 
 @router.get("/", response_model=List[schemas.SessionOut])
-def list_sessions(db: Session = Depends(get_db)):
-    return db.query(models.Session).all()
+def list_sessions(
+    response: Response,
+    subject_id: Optional[int] = None,
+    is_completed: Optional[bool] = None,
+    session_type: Optional[str] = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db)
+):
+    criteria = []
+    if subject_id is not None:
+        criteria.append(models.Session.subject_id == subject_id)
+    if is_completed is not None:
+        criteria.append(models.Session.is_completed == is_completed)
+    if session_type is not None:
+        criteria.append(models.Session.session_type == session_type)
+    rows = db.execute(page_statement(models.Session, page, *criteria)).all()
+    return page_response(models.Session, page, rows, response)
+
+@router.get("/{session_id}/progress", response_model=schemas.SessionProgress)
+def get_session_progress(session_id: int, db: Session = Depends(get_db)):
+    row = db.execute(select(*PROGRESS_COLUMNS).where(S.session_id == session_id)).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    return dict(row._mapping)
 
 @router.patch("/{session_id}/complete", response_model=schemas.SessionOut)
-def complete_session(session_id: int, db: Session = Depends(get_db)):
+def complete_session(session_id: int, force: bool = False, db: Session = Depends(get_db)):
+    """
+    Mark the session completed once every stimulus has been rated
+    (force=true completes it regardless, e.g. for an aborted session).
+    """
     session_obj = db.query(models.Session).get(session_id)
     if not session_obj:
         raise HTTPException(status_code=404, detail="Session not found.")
+    if session_obj.is_completed:
+        return session_obj
+    if not force:
+        if not session_obj.total_images:
+            raise HTTPException(status_code=409, detail="Session has no stimuli assigned.")
+        unrated = session_obj.total_images - session_obj.rated_images
+        queued = buffer.pending_stimuli(current_study(), session_id)
+        if unrated > 0 and queued:
+            # Rated in write-behind mode but not yet stored
+            unrated -= db.scalar(
+                select(func.count())
+                .select_from(models.SessionImage)
+                .where(
+                    models.SessionImage.session_image_id.in_(queued),
+                    models.SessionImage.rated_at.is_(None),
+                )
+            )
+        if unrated > 0:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Session has {unrated} of {session_obj.total_images} stimuli not yet rated."
+            )
     session_obj.is_completed = True
+    session_obj.end_time = func.now()
     db.commit()
     db.refresh(session_obj)
+    invalidate_playlist(session_id)
+    feed.session_changed("session.completed", session_obj)
     return session_obj
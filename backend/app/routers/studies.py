@@ -0,0 +1,53 @@
+# app/routers/studies.py
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import List
+from .. import models, schemas, studies
+from ..database import get_db  # the registry lives in the main database
+
+router = APIRouter(prefix="/studies", tags=["Studies"])
+
+@router.post("/", response_model=schemas.StudyOut)
+def create_study(study_in: schemas.StudyCreate, db: Session = Depends(get_db)):
+    """
+    Register a study and create its database, STUDY_DB_DIR/{study_id}.db
+    (migrated to the current schema).
+    """
+    if db.get(models.Study, study_in.study_id):
+        raise HTTPException(status_code=409, detail="Study already exists.")
+    studies.create_database(studies.default_url(study_in.study_id))
+    new_study = models.Study(**study_in.dict())
+    db.add(new_study)
+    db.commit()
+    db.refresh(new_study)
+    return new_study
+
+@router.get("/", response_model=List[schemas.StudyOut])
+def list_studies(db: Session = Depends(get_db)):
+    return db.scalars(select(models.Study).order_by(models.Study.study_id)).all()
+
+@router.get("/{study_id}", response_model=schemas.StudyOut)
+def get_study(study_id: str, db: Session = Depends(get_db)):
+    study = db.get(models.Study, study_id)
+    if not study:
+        raise HTTPException(status_code=404, detail="Study not found.")
+    return study
+
+@router.patch("/{study_id}", response_model=schemas.StudyOut)
+def update_study(study_id: str, study_in: schemas.StudyUpdate, db: Session = Depends(get_db)):
+    """
+    Rename or archive/reactivate a study. Archived studies are read-only;
+    their engines are closed once idle.
+    """
+    study = db.get(models.Study, study_id)
+    if not study:
+        raise HTTPException(status_code=404, detail="Study not found.")
+    changes = study_in.dict(exclude_unset=True)
+    for key, value in changes.items():
+        setattr(study, key, value)
+    db.commit()
+    db.refresh(study)
+    studies.registry.invalidate(study_id)
+    return study
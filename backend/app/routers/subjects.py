@@ -1,10 +1,11 @@
 # app/routers/subjects.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List
 from .. import models, schemas
-from ..database import get_db
+from ..studies import get_db
+from ..pagination import PageParams, page_response, page_statement
 
 router = APIRouter(prefix="/subjects", tags=["Subjects"])
 
@@ -24,5 +25,6 @@ def get_subject(subject_id: int, db: Session = Depends(get_db)):
     return subject
 
 @router.get("/", response_model=List[schemas.SubjectOut])
-def list_subjects(db: Session = Depends(get_db)):
-    return db.query(models.Subject).all()
+def list_subjects(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db)):
+    rows = db.execute(page_statement(models.Subject, page)).all()
+    return page_response(models.Subject, page, rows, response)
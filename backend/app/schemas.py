@@ -1,7 +1,7 @@
 # app/schemas.py
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Dict, List, Literal, Optional
 
 # Helper so we don't repeat from_attributes each time
 class ConfigMixin:
@@ -37,10 +37,24 @@ class SessionOut(SessionBase, ConfigMixin):
     session_id: int
     subject_id: int
     is_completed: bool
+    last_image_index: int = 0
+    total_images: int = 0
+    rated_images: int = 0
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
-    
-    
+
+class SessionProgress(BaseModel, ConfigMixin):
+    session_id: int
+    subject_id: int
+    session_type: str
+    is_completed: bool
+    total_images: int
+    rated_images: int
+    last_image_index: int
+    start_time: Optional[datetime] = None
+    last_activity_at: Optional[datetime] = None
+    avg_response_time: Optional[float] = None
+
 
 # ---------------------
 # IMAGE
@@ -49,6 +63,7 @@ class ImageBase(BaseModel):
     file_name: str
     file_path: Optional[str] = None
     description: Optional[str] = None
+    reference_image_id: Optional[int] = None
 
 class ImageCreate(ImageBase):
     pass
@@ -56,6 +71,24 @@ class ImageCreate(ImageBase):
 class ImageOut(ImageBase, ConfigMixin):
     image_id: int
     created_at: Optional[datetime] = None  # Expecting string for `created_at`
+    content_hash: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    format: Optional[str] = None
+    file_size: Optional[int] = None
+    sharpness: Optional[float] = None
+    colorfulness: Optional[float] = None
+    brightness: Optional[float] = None
+    contrast: Optional[float] = None
+
+class ImageIngestReport(BaseModel):
+    scanned: int = 0
+    unchanged: int = 0
+    added: int = 0
+    updated: int = 0  # content changed
+    touched: int = 0  # mtime changed, same content
+    missing: int = 0  # rows whose file is gone (kept: ratings reference them)
+    failed: List[str] = []  # unreadable files
 
 
 
@@ -85,6 +118,54 @@ class SessionImageOut(SessionImageBase, ConfigMixin):
     }
 
 
+# ---------------------
+# PREFETCH MANIFEST
+# ---------------------
+class ManifestItem(BaseModel):
+    session_image_id: int
+    display_order: int
+    is_training: bool
+    image_id: int
+    url: str  # content-addressed derivative URL, cacheable forever
+    derivative_key: str  # also the derivative's ETag
+    source_sha256: str
+    bytes: int
+    media_type: str
+
+class SessionManifest(BaseModel):
+    session_id: int
+    width: Optional[int] = None
+    format: str
+    quality: Optional[int] = None
+    total_bytes: int
+    items: List[ManifestItem]
+    last_image_index: int = 0  # current cursor; prefetch from the next item
+
+
+# ---------------------
+# PLAYLIST GENERATION
+# ---------------------
+class PlaylistSpec(BaseModel):
+    image_ids: List[int]
+    strategy: Literal["fixed", "random", "latin_square"] = "random"
+    seed: int = 0
+    # image_id -> source content key; images without an entry are their own source
+    sources: Dict[int, str] = {}
+    no_repeat_source: bool = True  # not applied to latin_square (keeps its balance)
+    training_image_ids: List[int] = []
+    training_every: Optional[int] = None  # None: training items first
+
+class CohortPlaylistRequest(BaseModel):
+    session_ids: List[int]
+    spec: PlaylistSpec
+
+class PlaylistOut(BaseModel):
+    session_id: int
+    subject_id: int
+    image_ids: List[int]
+    is_training: List[bool]
+
+
 # ---------------------
 # QUESTION
 # ---------------------
@@ -109,12 +190,167 @@ class RatingBase(BaseModel):
     text_answer: Optional[str] = None
     response_time: Optional[float] = None
 
+# Client clock readings are ms since the Unix epoch; up to this one (year 2286)
+# a timestamp plus an offset always converts to a datetime
+MAX_CLIENT_MS = 1e13
+
 class RatingCreate(RatingBase):
     session_image_id: int
     question_id: int
+    # Client high-resolution clock (performance.timeOrigin + performance.now()), ms
+    stimulus_onset_client_ms: Optional[float] = Field(None, ge=0, le=MAX_CLIENT_MS, allow_inf_nan=False)
+    response_client_ms: Optional[float] = Field(None, ge=0, le=MAX_CLIENT_MS, allow_inf_nan=False)
+    # Best POST /clock/sync estimate when the stimulus was shown (see app/clock.py)
+    clock_offset_ms: Optional[float] = Field(None, ge=-MAX_CLIENT_MS, le=MAX_CLIENT_MS, allow_inf_nan=False)
+    clock_rtt_ms: Optional[float] = Field(None, ge=0, le=MAX_CLIENT_MS, allow_inf_nan=False)
+
+    @model_validator(mode="after")
+    def _check_client_timing(self):
+        has_timestamps = self.stimulus_onset_client_ms is not None or self.response_client_ms is not None
+        if has_timestamps and self.clock_offset_ms is None:
+            raise ValueError("clock_offset_ms is required with client timestamps")
+        if (
+            self.stimulus_onset_client_ms is not None and self.response_client_ms is not None
+            and self.response_client_ms < self.stimulus_onset_client_ms
+        ):
+            raise ValueError("response_client_ms is before stimulus_onset_client_ms")
+        return self
 
 class RatingOut(RatingBase, ConfigMixin):
     rating_id: int
     session_image_id: int
     question_id: int
+    client_key: Optional[str] = None
     created_at: Optional[datetime] = None
+    # Client timestamps corrected to server time; offset error bound in ms
+    stimulus_onset_at: Optional[datetime] = None
+    responded_at: Optional[datetime] = None
+    clock_uncertainty_ms: Optional[float] = None
+
+# Accepted in write-behind mode (202): logged, stored within WRITE_BEHIND_INTERVAL_MS
+class RatingQueued(RatingBase):
+    session_image_id: int
+    question_id: int
+    accepted_at: datetime
+
+# ---------------------
+# RATING SYNC (offline queue)
+# ---------------------
+class RatingSyncItem(RatingCreate):
+    client_key: str  # client-generated idempotency key
+    client_seq: int  # monotonically increasing per device
+
+class RatingSyncBatch(BaseModel):
+    device_id: str
+    ratings: List[RatingSyncItem]
+
+class RatingSyncResult(BaseModel):
+    device_id: str
+    high_water_mark: int
+    applied: int = 0
+    duplicates: int = 0
+    rejected: List[str] = []  # client_keys referencing unknown session images/questions
+
+# ---------------------
+# STUDY
+# ---------------------
+class StudyCreate(BaseModel):
+    study_id: str = Field(pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    name: str
+
+class StudyUpdate(BaseModel):
+    name: Optional[str] = None
+    status: Optional[Literal["active", "archived"]] = None
+
+class StudyOut(ConfigMixin, BaseModel):
+    study_id: str
+    name: str
+    status: str
+    created_at: Optional[datetime] = None
+
+# ---------------------
+# CLOCK SYNC
+# ---------------------
+class ClockSyncRequest(BaseModel):
+    client_sent_ms: float = Field(ge=0, le=MAX_CLIENT_MS, allow_inf_nan=False)  # t0, client clock
+
+class ClockSyncOut(BaseModel):
+    client_sent_ms: float  # t0 echoed back
+    server_received_ms: float  # t1, server clock (Unix epoch ms)
+    server_sent_ms: float  # t2
+
+# ---------------------
+# ANALYTICS
+# ---------------------
+class MosOut(BaseModel):
+    image_id: int
+    question_id: int
+    n: int
+    mos: Optional[float] = None
+    std: Optional[float] = None  # None with fewer than two ratings
+    ci95: Optional[float] = None
+
+class ZMosOut(BaseModel):
+    image_id: int
+    question_id: int
+    n: int
+    z_mos: Optional[float] = None
+    z_mos_rescaled: Optional[float] = None  # (z + 3) * 100 / 6
+
+class DmosOut(BaseModel):
+    image_id: int
+    reference_image_id: int
+    question_id: int
+    n: int  # subjects who rated both the image and its reference
+    dmos: Optional[float] = None
+    std: Optional[float] = None
+    ci95: Optional[float] = None
+
+class SubjectScreeningOut(BaseModel):
+    subject_id: int
+    n: int
+    p: int  # scores above the per-image upper threshold
+    q: int  # scores below the per-image lower threshold
+    rejected: bool
+
+class ReliabilityJobOut(BaseModel, ConfigMixin):
+    job_id: int
+    question_id: Optional[int] = None  # None: every question
+    status: str  # queued | running | done | failed
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class QuestionReliabilityOut(BaseModel, ConfigMixin):
+    question_id: int
+    job_id: int
+    n_subjects: int
+    n_images: int
+    n_ratings: int
+    krippendorff_alpha: Optional[float] = None  # interval metric
+    icc: Optional[float] = None  # ICC(1,1)
+    mean_correlation: Optional[float] = None
+    flagged_subjects: int
+    computed_at: datetime
+
+class SubjectReliabilityOut(BaseModel, ConfigMixin):
+    question_id: int
+    subject_id: int
+    job_id: int
+    n_ratings: int
+    n_images: int
+    loo_correlation: Optional[float] = None  # Pearson r vs. the leave-one-out MOS
+    repeated_images: int
+    repeat_std: Optional[float] = None
+    bt500_rejected: bool
+    flagged: bool
+    reasons: List[str] = []  # low_correlation, inconsistent_repeats, bt500
+
+    @field_validator("reasons", mode="before")
+    @classmethod
+    def split_reasons(cls, value):
+        # Stored comma-separated
+        if value is None:
+            return []
+        return value.split(",") if isinstance(value, str) else value
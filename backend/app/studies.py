@@ -0,0 +1,418 @@
+# app/studies.py
+
+"""
+Per-study databases.
+
+Each study (experiment) has its own SQLite file, so a long export or
+analytics query in one study never holds the write lock that another study's
+tablets are waiting for, and an archived study's file can be moved off the
+hot path. The studies table in the main database (settings.SQLITE_URL) lists
+them; a study's database is {settings.STUDY_DB_DIR}/{study_id}.db unless an
+operator set its database_url there after moving the file (the API never
+takes a location from clients).
+
+Requests name their study in the X-Study-Id header (or the ?study= query
+parameter, for URLs used in <img> tags); requests without one use the main
+database as before. StudyMiddleware puts the id in a context variable, the
+get_db()/get_async_db() dependencies below open a session on that study's
+database, and the in-process caches (catalog, playlists) key on it.
+
+Engines are opened lazily in each worker and kept in an LRU: engines with no
+open session are disposed beyond settings.STUDY_MAX_OPEN, or after
+settings.STUDY_IDLE_SECONDS unused. A study's status and location are re-read
+from the main database at most every settings.STUDY_CHECK_SECONDS. Archived
+studies are read-only.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal, SessionLocal, async_engine, engine, make_async_engine, make_engine
+from .migrations import SchemaVersionError, check_schema, upgrade
+
+STUDY_HEADER = "X-Study-Id"
+STUDY_QUERY_PARAM = "study"
+STUDY_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_study_id = re.compile(STUDY_ID_PATTERN)
+_current: ContextVar[Optional[str]] = ContextVar("study_id", default=None)
+
+
+class StudyNotFound(LookupError):
+    pass
+
+
+class StudyArchived(RuntimeError):
+    pass
+
+
+def current_study() -> Optional[str]:
+    """
+    Study of the current request; None for the main database.
+    """
+    return _current.get()
+
+
+def default_url(study_id: str) -> str:
+    return f"sqlite:///{os.path.join(settings.STUDY_DB_DIR, study_id + '.db')}"
+
+
+def create_database(url: str) -> None:
+    """
+    Create (or migrate) a study database at url.
+    """
+    new_engine = make_engine(url)
+    if new_engine.url.get_backend_name() == "sqlite" and new_engine.url.database:
+        os.makedirs(os.path.dirname(os.path.abspath(new_engine.url.database)), exist_ok=True)
+    try:
+        upgrade(new_engine)
+    finally:
+        new_engine.dispose()
+
+
+def _lookup(study_id: str) -> Tuple[str, str]:
+    """
+    (database url, status) of a registered study.
+    """
+    with SessionLocal() as db:
+        row = db.execute(
+            select(models.Study.database_url, models.Study.status).where(models.Study.study_id == study_id)
+        ).first()
+    if row is None:
+        raise StudyNotFound(study_id)
+    return row.database_url or default_url(study_id), row.status
+
+
+@dataclass(eq=False)
+class StudyDatabase:
+    study_id: Optional[str]
+    url: str
+    status: str
+    engine: Engine
+    session_factory: sessionmaker
+    async_engine: AsyncEngine
+    async_session_factory: async_sessionmaker
+    active: int = 0  # open sessions; engines in use are never evicted
+    last_used: float = field(default_factory=time.monotonic)
+    checked_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def archived(self) -> bool:
+        return self.status == "archived"
+
+
+def _open_database(study_id: str, url: str, status: str) -> StudyDatabase:
+    study_engine = make_engine(url)
+    try:
+        if settings.AUTO_MIGRATE:
+            upgrade(study_engine)
+        check_schema(study_engine)
+    except Exception:
+        study_engine.dispose()
+        raise
+    study_async_engine = make_async_engine(url)
+    return StudyDatabase(
+        study_id, url, status,
+        study_engine, sessionmaker(autocommit=False, autoflush=False, bind=study_engine),
+        study_async_engine, async_sessionmaker(study_async_engine, autoflush=False, expire_on_commit=False),
+    )
+
+
+MAIN_DATABASE = StudyDatabase(
+    None, settings.SQLITE_URL, "active", engine, SessionLocal, async_engine, AsyncSessionLocal
+)
+
+
+class StudyRegistry:
+    """
+    Per-worker LRU of open study databases.
+    """
+
+    def __init__(self):
+        self._open: "OrderedDict[str, StudyDatabase]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Async engines are disposed from async code: close_pending()
+        self._closing: List[StudyDatabase] = []
+
+    def acquire(self, study_id: Optional[str]) -> StudyDatabase:
+        """
+        Open database of a study, counted as in use until release(). Raises
+        StudyNotFound or SchemaVersionError.
+        """
+        entry = self._acquire_fresh(study_id)
+        if entry is not None:
+            return entry
+
+        # Looking the study up and opening its engine do I/O: not under the lock
+        now = time.monotonic()
+        url, status = _lookup(study_id)
+        with self._lock:
+            entry = self._open.get(study_id)
+            if entry is not None and entry.url == url:
+                entry.status, entry.checked_at = status, now
+                return self._checkout(entry, now)
+
+        new_entry = _open_database(study_id, url, status)
+        retired = []
+        with self._lock:
+            entry = self._open.get(study_id)
+            if entry is not None and entry.url == url:
+                # Opened concurrently by another request
+                retired.append(new_entry)
+            else:
+                if entry is not None:
+                    # The study was moved
+                    retired.append(self._open.pop(study_id))
+                entry = self._open[study_id] = new_entry
+            self._checkout(entry, now)
+            retired += self._evict(now)
+        self._dispose(retired)
+        return entry
+
+    async def acquire_async(self, study_id: Optional[str]) -> StudyDatabase:
+        """
+        acquire() for async code: unless the study is open and recently
+        checked, the lookup and engine opening run in a worker thread.
+        """
+        entry = self._acquire_fresh(study_id)
+        if entry is None:
+            entry = await run_in_threadpool(self.acquire, study_id)
+        return entry
+
+    def _acquire_fresh(self, study_id: Optional[str]) -> Optional[StudyDatabase]:
+        # Open entry that needs no I/O, or None
+        if study_id is None:
+            return MAIN_DATABASE
+        now = time.monotonic()
+        with self._lock:
+            entry = self._open.get(study_id)
+            if entry is not None and now - entry.checked_at < settings.STUDY_CHECK_SECONDS:
+                return self._checkout(entry, now)
+        return None
+
+    def release(self, entry: StudyDatabase) -> None:
+        if entry is MAIN_DATABASE:
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry.active -= 1
+            entry.last_used = now
+            evicted = self._evict(now)
+        self._dispose(evicted)
+
+    def invalidate(self, study_id: str) -> None:
+        """
+        Re-read a study's status and location on its next use, and close its
+        engines now if idle (after it was archived or moved).
+        """
+        retired = []
+        with self._lock:
+            entry = self._open.get(study_id)
+            if entry is not None:
+                entry.checked_at = float("-inf")
+                if not entry.active:
+                    retired.append(self._open.pop(study_id))
+        self._dispose(retired)
+
+    async def close_pending(self) -> None:
+        with self._lock:
+            closing, self._closing = self._closing, []
+        for entry in closing:
+            await entry.async_engine.dispose()
+
+    async def close(self) -> None:
+        with self._lock:
+            entries = list(self._open.values())
+            self._open.clear()
+        self._dispose(entries)
+        await self.close_pending()
+
+    def _checkout(self, entry: StudyDatabase, now: float) -> StudyDatabase:
+        entry.active += 1
+        entry.last_used = now
+        self._open.move_to_end(entry.study_id)
+        return entry
+
+    def _evict(self, now: float) -> List[StudyDatabase]:
+        # Oldest first; called with the lock held
+        evicted = []
+        for study_id, entry in list(self._open.items()):
+            if entry.active:
+                continue
+            if len(self._open) > settings.STUDY_MAX_OPEN or now - entry.last_used > settings.STUDY_IDLE_SECONDS:
+                evicted.append(self._open.pop(study_id))
+        return evicted
+
+    def _dispose(self, entries: List[StudyDatabase]) -> None:
+        # Called without the lock held
+        if not entries:
+            return
+        for entry in entries:
+            entry.engine.dispose()
+        with self._lock:
+            self._closing.extend(entries)
+
+
+registry = StudyRegistry()
+
+
+@contextmanager
+def session(study_id: Optional[str] = None, writable: bool = False) -> Iterator[Session]:
+    """
+    Session on a study's database outside a request (exports, CLIs, jobs).
+    With writable=True, raises StudyArchived for archived studies.
+    """
+    entry = registry.acquire(study_id)
+    if writable and entry.archived:
+        registry.release(entry)
+        raise StudyArchived(study_id)
+    db = entry.session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+        registry.release(entry)
+
+
+@asynccontextmanager
+async def async_session(study_id: Optional[str] = None, writable: bool = False) -> AsyncIterator[AsyncSession]:
+    """
+    Async session on a study's database outside a request (background
+    tasks), with the study made current for the caches and the feed.
+    With writable=True, raises StudyArchived for archived studies.
+    """
+    entry = await registry.acquire_async(study_id)
+    if writable and entry.archived:
+        registry.release(entry)
+        raise StudyArchived(study_id)
+    token = _current.set(study_id)
+    db = entry.async_session_factory()
+    try:
+        yield db
+    finally:
+        await db.close()
+        _current.reset(token)
+        registry.release(entry)
+        await registry.close_pending()
+
+
+# ---------------------
+# REQUESTS
+# ---------------------
+class StudyMiddleware:
+    """
+    Pure ASGI middleware: sets the current study from the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        study_id = (
+            Headers(scope=scope).get(STUDY_HEADER)
+            or QueryParams(scope.get("query_string", b"")).get(STUDY_QUERY_PARAM)
+            or None
+        )
+        if study_id is not None and not _study_id.match(study_id):
+            if scope["type"] == "http":
+                await JSONResponse({"detail": "Invalid study id."}, status_code=400)(scope, receive, send)
+            else:
+                await send({"type": "websocket.close", "code": 1008})
+            return
+
+        token = _current.set(study_id)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+
+
+@contextmanager
+def _http_errors(study_id: Optional[str]) -> Iterator[None]:
+    try:
+        yield
+    except StudyNotFound:
+        raise HTTPException(status_code=404, detail=f"Study {study_id!r} not found.")
+    except SchemaVersionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _writable(request: Request, entry: StudyDatabase) -> StudyDatabase:
+    if entry.archived and request.method not in READ_METHODS:
+        registry.release(entry)
+        raise HTTPException(status_code=409, detail=f"Study {entry.study_id!r} is archived (read-only).")
+    return entry
+
+
+def _acquire(request: Request) -> StudyDatabase:
+    study_id = current_study()
+    with _http_errors(study_id):
+        entry = registry.acquire(study_id)
+    return _writable(request, entry)
+
+
+async def _acquire_async(request: Request) -> StudyDatabase:
+    study_id = current_study()
+    with _http_errors(study_id):
+        entry = await registry.acquire_async(study_id)
+    return _writable(request, entry)
+
+
+def require_study(request: Request) -> Optional[str]:
+    """
+    FastAPI dependency that validates the current study and returns its id,
+    for endpoints that open their own sessions (streaming exports).
+    """
+    registry.release(_acquire(request))
+    return current_study()
+
+
+def get_db(request: Request):
+    """
+    FastAPI dependency that yields a session on the current study's database.
+    """
+    entry = _acquire(request)
+    db = entry.session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+        registry.release(entry)
+
+
+async def get_async_db(request: Request):
+    """
+    FastAPI dependency that yields an async session on the current study's
+    database.
+    """
+    entry = await _acquire_async(request)
+    await registry.close_pending()
+    db = entry.async_session_factory()
+    try:
+        yield db
+    finally:
+        await db.close()
+        registry.release(entry)
@@ -0,0 +1,389 @@
+# app/write_behind.py
+
+"""
+Write-behind buffer for single ratings (optional: settings.WRITE_BEHIND).
+
+Every POST /ratings/ otherwise commits its own SQLite transaction, paying an
+fsync and a turn at the database write lock. With write-behind the router
+validates the rating, appends it to a local append-only log and acknowledges
+it (202) as soon as the log is fsynced; concurrent appends share one fsync.
+A background task then inserts the logged ratings and their side effects
+(cursors, score aggregates, progress, feed events) into each study's database
+in one transaction per study, every settings.WRITE_BEHIND_INTERVAL_MS or as
+soon as settings.WRITE_BEHIND_MAX_ROWS are waiting.
+
+The log lives in settings.WRITE_BEHIND_DIR as segments named
+ratings-{pid}-{token}-{n}.log (token: random per process, since pids are
+reused), one JSON object per line, each locked (flock) by the worker process
+writing it. A segment is created and locked under a temporary name and only
+then renamed into place, so a replaying worker never sees it unlocked. A segment is truncated once everything in it has
+been applied, or replaced by a new one beyond settings.WRITE_BEHIND_SEGMENT_BYTES
+and deleted once applied. On startup a worker replays and deletes every
+segment not locked by a live process, i.e. those of crashed workers, even
+when write-behind has since been turned off; a torn last line (never
+acknowledged) is skipped. Applying is idempotent - inserts
+ignore ratings already present for their session image and question - so a
+crash between the database commit and the log truncation only replays
+duplicates.
+
+Ratings of a study that was archived (read-only) or removed before they
+could be applied were still acknowledged, so they are not dropped: they are
+moved to a dead-letter log, ratings-deadletter-{pid}-{token}.log, which is
+never replayed automatically. Once the study is writable again, renaming the
+file to drop "deadletter-" replays it on the next start.
+
+Write-behind needs flock(), i.e. a POSIX system; elsewhere open() refuses to
+start it.
+
+Until its group commit a rating is visible only to the worker that accepted
+it: that worker rejects a duplicate answer and /flow/next_image moves past
+the stimulus, while reads elsewhere (rating lists, progress, exports) lag by
+at most one commit interval.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import secrets
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import studies
+from .config import settings
+from .serialization import encode
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: write-behind is unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOG_NAME = "ratings"
+DEAD_LETTER_NAME = f"{LOG_NAME}-deadletter"
+
+# Applies the payloads of one study's logged ratings in the given session,
+# committing them: routers/ratings.py apply_queued()
+ApplyFunc = Callable[[AsyncSession, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class _Segment:
+    def __init__(self, path: str):
+        self.path = path
+        # Locked before it appears under its name: replay() takes unlocked
+        # segments for those of dead workers
+        tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+        self.fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(tmp_path, path)
+        except BaseException:
+            os.close(self.fd)
+            os.unlink(tmp_path)
+            raise
+        self.size = 0
+        self.written = 0  # records appended
+        self.applied = 0  # records committed to their database
+
+
+class _Record:
+    __slots__ = ("study", "payload", "key", "segment")
+
+    def __init__(self, study: Optional[str], payload: Dict[str, Any], key: tuple, segment: _Segment):
+        self.study = study
+        self.payload = payload
+        self.key = key
+        self.segment = segment
+
+
+def _fsync_dir(path: str) -> None:
+    # Makes a new segment's directory entry durable
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class RatingBuffer:
+    """
+    Per-worker log and group committer of accepted ratings.
+    """
+
+    def __init__(self):
+        self._apply: Optional[ApplyFunc] = None
+        self._segment: Optional[_Segment] = None
+        self._sealed: List[_Segment] = []
+        self._counter = 0
+        self._token = secrets.token_hex(4)
+        self._closing = False
+        self._unsynced: List[_Record] = []
+        self._durable: Deque[_Record] = deque()
+        self._tasks: List[asyncio.Task] = []
+        # Not yet applied: (study, session_image_id, question_id), and per
+        # (study, session_id) the furthest display_order and the session images.
+        # Values are replaced, never mutated: sync routers read them from threads.
+        self._keys: Set[tuple] = set()
+        self._positions: Dict[Tuple[Optional[str], int], int] = {}
+        self._stimuli: Dict[Tuple[Optional[str], int], FrozenSet[int]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._segment is not None and not self._closing
+
+    async def open(self, apply: ApplyFunc) -> None:
+        """
+        Replay the logs of dead workers, then start accepting ratings.
+        Raises RuntimeError where flock() is unavailable.
+        """
+        if fcntl is None:
+            raise RuntimeError("Write-behind needs flock() (POSIX); set WRITE_BEHIND=false.")
+        os.makedirs(settings.WRITE_BEHIND_DIR, exist_ok=True)
+        await self.replay(apply)
+        self._segment = self._new_segment()
+        self._closing = False
+        self._synced = asyncio.get_running_loop().create_future()  # resolved by the next fsync
+        self._dirty = asyncio.Event()  # appended, not yet fsynced
+        self._ready = asyncio.Event()  # durable, not yet applied
+        self._full = asyncio.Event()  # WRITE_BEHIND_MAX_ROWS waiting
+        self._tasks = [asyncio.create_task(self._sync_loop()), asyncio.create_task(self._apply_loop())]
+
+    async def close(self) -> None:
+        """
+        Apply everything accepted so far and remove the log; whatever cannot be
+        applied now stays in the log for the next start.
+        """
+        if not self.enabled:
+            return
+        self._closing = True
+        self._dirty.set()
+        self._ready.set()
+        self._full.set()
+        # The sync loop returns once every accepted rating is durable
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        try:
+            while self._durable:
+                await self._apply_batch()
+        except Exception:
+            logger.exception("Could not apply buffered ratings; they will be replayed on the next start")
+        for segment in self._sealed + [self._segment]:
+            os.close(segment.fd)
+            if segment.applied == segment.written:
+                os.unlink(segment.path)
+        self._sealed = []
+        self._segment = None
+
+    def pending(self, study: Optional[str], session_image_id: int, question_id: int) -> bool:
+        """
+        Whether an answer to question_id for session_image_id is waiting to be applied.
+        """
+        return (study, session_image_id, question_id) in self._keys
+
+    def pending_position(self, study: Optional[str], session_id: int) -> int:
+        """
+        Furthest display_order rated in a session but not yet applied (0 if none).
+        """
+        return self._positions.get((study, session_id), 0)
+
+    def pending_stimuli(self, study: Optional[str], session_id: int) -> FrozenSet[int]:
+        """
+        Session images of a session with ratings not yet applied.
+        """
+        return self._stimuli.get((study, session_id), frozenset())
+
+    async def append(self, payload: Dict[str, Any], session_image_id: int, question_id: int,
+                     session_id: int, display_order: int) -> None:
+        """
+        Log a validated rating of the current study; returns once it is durable.
+        Raises RuntimeError once the buffer is closing.
+        """
+        if not self.enabled:
+            raise RuntimeError("The rating buffer is closed.")
+        study = studies.current_study()
+        segment = self._segment
+        line = encode({"study": study, **payload}) + b"\n"
+        try:
+            os.write(segment.fd, line)
+        except OSError:
+            # Keep the log free of a partial line (e.g. disk full)
+            os.ftruncate(segment.fd, segment.size)
+            raise
+        segment.size += len(line)
+        segment.written += 1
+        record = _Record(study, payload, (study, session_image_id, question_id), segment)
+        self._unsynced.append(record)
+        self._keys.add(record.key)
+        session = (study, session_id)
+        self._positions[session] = max(self._positions.get(session, 0), display_order)
+        self._stimuli[session] = self._stimuli.get(session, frozenset()) | {session_image_id}
+        self._dirty.set()
+        # Shared by every append of this round; a cancelled request must not cancel it
+        await asyncio.shield(self._synced)
+
+    # ---------------------
+    # BACKGROUND
+    # ---------------------
+    def _new_segment(self) -> _Segment:
+        self._counter += 1
+        path = os.path.join(
+            settings.WRITE_BEHIND_DIR, f"{LOG_NAME}-{os.getpid()}-{self._token}-{self._counter}.log"
+        )
+        segment = _Segment(path)
+        _fsync_dir(settings.WRITE_BEHIND_DIR)
+        return segment
+
+    async def _sync(self, segment: _Segment) -> None:
+        records, self._unsynced = self._unsynced, []
+        synced, self._synced = self._synced, asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.to_thread(os.fsync, segment.fd)
+        except OSError as e:
+            # Not acknowledged: the clients retry, and a replayed copy is a duplicate
+            for record in records:
+                record.segment.applied += 1
+                self._keys.discard(record.key)
+            synced.set_exception(e)
+            synced.exception()  # retrieved, even if every waiter is gone
+            return
+        self._durable.extend(records)
+        synced.set_result(None)
+        self._ready.set()
+        if len(self._durable) >= settings.WRITE_BEHIND_MAX_ROWS:
+            self._full.set()
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            if self._unsynced:
+                segment = self._segment
+                if segment.size >= settings.WRITE_BEHIND_SEGMENT_BYTES and not self._closing:
+                    # Later appends go to a new segment; this sync covers the old one
+                    self._sealed.append(segment)
+                    self._segment = self._new_segment()
+                await self._sync(segment)
+            if self._closing and not self._unsynced:
+                return
+
+    async def _apply_loop(self) -> None:
+        while not self._closing:  # close() applies the rest
+            await self._ready.wait()
+            if self._closing:
+                return
+            if len(self._durable) < settings.WRITE_BEHIND_MAX_ROWS:
+                try:
+                    await asyncio.wait_for(self._full.wait(), settings.WRITE_BEHIND_INTERVAL_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self._apply_batch()
+            except Exception:
+                logger.exception("Applying buffered ratings failed; retrying")
+                await asyncio.sleep(1.0)
+
+    async def _apply_batch(self) -> None:
+        batch = [self._durable.popleft() for _ in range(min(len(self._durable), settings.WRITE_BEHIND_MAX_ROWS))]
+        if not self._durable:
+            self._ready.clear()
+        self._full.clear()
+        try:
+            await self._apply_records([(record.study, record.payload) for record in batch])
+        except BaseException:
+            self._durable.extendleft(reversed(batch))
+            self._ready.set()
+            raise
+        for record in batch:
+            record.segment.applied += 1
+            self._keys.discard(record.key)
+        if not self._keys:
+            self._positions = {}
+            self._stimuli = {}
+        self._release_segments()
+
+    async def _apply_records(self, records: List[Tuple[Optional[str], Dict[str, Any]]]) -> None:
+        by_study: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for study, payload in records:
+            by_study.setdefault(study, []).append(payload)
+        for study, payloads in by_study.items():
+            try:
+                async with studies.async_session(study, writable=True) as db:
+                    await self._apply(db, payloads)
+            except studies.StudyNotFound:
+                path = self._dead_letter(study, payloads)
+                logger.error("Study %r not found: moved %d buffered ratings to %s", study, len(payloads), path)
+            except studies.StudyArchived:
+                path = self._dead_letter(study, payloads)
+                logger.error("Study %r is archived: moved %d buffered ratings to %s", study, len(payloads), path)
+
+    def _dead_letter(self, study: Optional[str], payloads: List[Dict[str, Any]]) -> str:
+        """
+        Append ratings that cannot be applied to this process's dead-letter
+        log, durably: they count as applied once this returns.
+        """
+        path = os.path.join(settings.WRITE_BEHIND_DIR, f"{DEAD_LETTER_NAME}-{os.getpid()}-{self._token}.log")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, b"".join(encode({"study": study, **payload}) + b"\n" for payload in payloads))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        _fsync_dir(settings.WRITE_BEHIND_DIR)
+        return path
+
+    def _release_segments(self) -> None:
+        for segment in [s for s in self._sealed if s.applied == s.written]:
+            self._sealed.remove(segment)
+            os.close(segment.fd)
+            os.unlink(segment.path)
+        segment = self._segment
+        if segment is not None and segment.size and segment.applied == segment.written:
+            # Appends are O_APPEND, so they continue at the new end
+            os.ftruncate(segment.fd, 0)
+            segment.size = segment.written = segment.applied = 0
+
+    async def replay(self, apply: ApplyFunc) -> None:
+        """
+        Apply and delete the segments of dead workers. Run at every start,
+        whether or not this worker buffers ratings itself, so ratings logged
+        before write-behind was turned off are not stranded.
+        """
+        self._apply = apply
+        for path in sorted(glob.glob(os.path.join(settings.WRITE_BEHIND_DIR, f"{LOG_NAME}-*.log"))):
+            if os.path.basename(path).startswith(DEAD_LETTER_NAME + "-"):
+                continue
+            fd = os.open(path, os.O_RDWR)
+            try:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # a live worker's
+                with os.fdopen(os.dup(fd), "rb") as f:
+                    lines = f.read().split(b"\n")
+                records = []
+                for number, line in enumerate(lines, 1):
+                    if not line:
+                        continue
+                    try:
+                        payload = json.loads(line)
+                    except ValueError:
+                        logger.warning("Skipping torn record at %s:%d", path, number)
+                        continue
+                    records.append((payload.pop("study"), payload))
+                try:
+                    for start in range(0, len(records), settings.WRITE_BEHIND_MAX_ROWS):
+                        await self._apply_records(records[start:start + settings.WRITE_BEHIND_MAX_ROWS])
+                except Exception:
+                    logger.exception("Could not replay %s; keeping it for the next start", path)
+                    continue
+                logger.info("Replayed %d buffered ratings from %s", len(records), path)
+                os.unlink(path)
+            finally:
+                os.close(fd)
+
+
+buffer = RatingBuffer()
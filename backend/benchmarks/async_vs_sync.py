@@ -0,0 +1,197 @@
+# benchmarks/async_vs_sync.py
+
+"""
+Requests/second and latency of sync (threadpool) vs async database endpoints.
+
+Builds a small FastAPI app on a temporary SQLite database that exposes the
+same two operations twice -- once as a sync `def` on SessionLocal-style
+sessions and once as an `async def` on the async engine:
+
+    GET  /{mode}/next    session lookup + playlist query (like /flow/next_image)
+    POST /{mode}/rating  rating insert + commit (like POST /ratings/)
+
+and drives each with N concurrent in-process clients (httpx ASGITransport).
+
+    python -m backend.benchmarks.async_vs_sync [--concurrency 64] [--seconds 5] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from backend.app import models
+from backend.app.database import make_async_engine, make_engine
+from backend.app.migrations import upgrade
+
+N_SESSIONS = 20
+IMAGES_PER_SESSION = 200
+N_QUESTIONS = 5
+
+
+def _seed(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(models.Subject), [{"name": f"s{i}"} for i in range(N_SESSIONS)])
+        conn.execute(insert(models.Session), [
+            {"subject_id": i + 1, "session_type": "block1", "is_completed": False}
+            for i in range(N_SESSIONS)
+        ])
+        conn.execute(insert(models.Image), [
+            {"image_id": i, "file_name": f"{i}.jpg"} for i in range(1, IMAGES_PER_SESSION + 1)
+        ])
+        conn.execute(insert(models.SessionImage), [
+            {"session_id": s, "image_id": i, "display_order": i, "is_training": False}
+            for s in range(1, N_SESSIONS + 1)
+            for i in range(1, IMAGES_PER_SESSION + 1)
+        ])
+        conn.execute(insert(models.Question), [
+            {"question_text": f"q{i}", "question_type": "likert"} for i in range(N_QUESTIONS)
+        ])
+
+
+def _playlist_query(session_id: int):
+    return (
+        select(models.SessionImage.session_image_id, models.Image.file_name)
+        .join(models.Image, models.SessionImage.image_id == models.Image.image_id)
+        .where(models.SessionImage.session_id == session_id)
+        .order_by(models.SessionImage.display_order)
+    )
+
+
+def build_app(db_url: str) -> FastAPI:
+    sync_factory = sessionmaker(bind=make_engine(db_url), autoflush=False)
+    async_factory = async_sessionmaker(make_async_engine(db_url), autoflush=False, expire_on_commit=False)
+
+    def get_sync_db():
+        db = sync_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db():
+        db = async_factory()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app = FastAPI()
+
+    @app.get("/sync/next")
+    def sync_next(session_id: int, db: Session = Depends(get_sync_db)):
+        db.get(models.Session, session_id)
+        return {"n": len(db.execute(_playlist_query(session_id)).all())}
+
+    @app.get("/async/next")
+    async def async_next(session_id: int, db: AsyncSession = Depends(get_async_db)):
+        await db.get(models.Session, session_id)
+        return {"n": len((await db.execute(_playlist_query(session_id))).all())}
+
+    @app.post("/sync/rating")
+    def sync_rating(session_image_id: int, question_id: int, db: Session = Depends(get_sync_db)):
+        db.add(models.Rating(session_image_id=session_image_id, question_id=question_id, rating_value=3))
+        db.commit()
+        return {"ok": True}
+
+    @app.post("/async/rating")
+    async def async_rating(session_image_id: int, question_id: int, db: AsyncSession = Depends(get_async_db)):
+        db.add(models.Rating(session_image_id=session_image_id, question_id=question_id, rating_value=3))
+        await db.commit()
+        return {"ok": True}
+
+    return app
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _drive(client: httpx.AsyncClient, make_request, concurrency: int, seconds: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await make_request(client)
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / seconds, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "errors": errors,
+    }
+
+
+async def run(concurrency: int, seconds: float) -> List[Dict[str, Any]]:
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = make_engine(db_url)
+        upgrade(engine)
+        _seed(engine)
+        engine.dispose()
+
+        app = build_app(db_url)
+        # Every (session_image, question) pair can be answered once
+        pairs = itertools.product(range(1, N_SESSIONS * IMAGES_PER_SESSION + 1), range(1, N_QUESTIONS + 1))
+        sessions = itertools.cycle(range(1, N_SESSIONS + 1))
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for mode in ("sync", "async"):
+                def next_image(c, mode=mode):
+                    return c.get(f"/{mode}/next", params={"session_id": next(sessions)})
+
+                def rating(c, mode=mode):
+                    si_id, q_id = next(pairs)
+                    return c.post(f"/{mode}/rating", params={"session_image_id": si_id, "question_id": q_id})
+
+                for name, make_request in (("next", next_image), ("rating", rating)):
+                    stats = await _drive(client, make_request, concurrency, seconds)
+                    report.append({"mode": mode, "endpoint": name, **stats})
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync vs async endpoint benchmark.")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--json", help="write the machine-readable report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.concurrency, args.seconds))
+    for entry in report:
+        print(
+            f"{entry['mode']:6} {entry['endpoint']:7} {entry['rps']:>9} req/s  "
+            f"p50 {entry['p50_ms']:>8} ms  p99 {entry['p99_ms']:>8} ms  errors {entry['errors']}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# benchmarks/db_concurrency.py
+
+"""
+Concurrent writer/reader load benchmark for the database engine configuration.
+
+Writer threads record ratings one transaction at a time the way POST
+/ratings/ does - look up the session image and the catalog stamp, then insert
+the rating and advance the session cursor - while reader threads load session
+playlists (like /flow/next_image). The run is repeated against a fresh
+temporary SQLite database for each profile:
+
+    default  SQLite defaults (rollback journal, synchronous=FULL)
+    tuned    the pragmas from app.config (WAL, synchronous=NORMAL, ...)
+
+Lock errors count writes that failed with "database is locked", e.g. a
+transaction that read before writing and could not become a writer (see
+database._install_transactions()).
+
+    python -m backend.benchmarks.db_concurrency [--writers 8] [--readers 8] [--seconds 5] [--json out.json]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import models
+from backend.app.database import make_engine
+from backend.app.migrations import upgrade
+
+PROFILES: Dict[str, Optional[Dict[str, Any]]] = {
+    "default": {},
+    "tuned": None,  # make_engine() falls back to sqlite_pragmas()
+}
+
+N_SESSIONS = 20
+IMAGES_PER_SESSION = 500
+N_QUESTIONS = 5
+
+
+def _seed(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(models.Subject), [{"name": f"s{i}"} for i in range(N_SESSIONS)])
+        conn.execute(insert(models.Session), [
+            {"subject_id": i + 1, "session_type": "block1", "is_completed": False}
+            for i in range(N_SESSIONS)
+        ])
+        conn.execute(insert(models.Image), [
+            {"image_id": i, "file_name": f"{i}.jpg"} for i in range(1, IMAGES_PER_SESSION + 1)
+        ])
+        conn.execute(insert(models.SessionImage), [
+            {"session_id": s, "image_id": i, "display_order": i, "is_training": False}
+            for s in range(1, N_SESSIONS + 1)
+            for i in range(1, IMAGES_PER_SESSION + 1)
+        ])
+        conn.execute(insert(models.Question), [
+            {"question_text": f"q{i}", "question_type": "likert"} for i in range(N_QUESTIONS)
+        ])
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _summary(latencies: List[float], errors: int, seconds: float) -> Dict[str, float]:
+    return {
+        "ops": len(latencies),
+        "ops_per_sec": round(len(latencies) / seconds, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "lock_errors": errors,
+    }
+
+
+def run_profile(name: str, writers: int, readers: int, seconds: float) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(
+            f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            pragmas=PROFILES[name],
+            pool_size=writers + readers,
+        )
+        upgrade(engine)
+        _seed(engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        # Every (session_image, question) pair can be answered once
+        pairs = itertools.product(range(1, N_SESSIONS * IMAGES_PER_SESSION + 1), range(1, N_QUESTIONS + 1))
+        pairs_lock = threading.Lock()
+        stop = threading.Event()
+        results = {"write": ([], [0]), "read": ([], [0])}
+
+        def writer():
+            latencies, errors = results["write"]
+            while not stop.is_set():
+                with pairs_lock:
+                    si_id, q_id = next(pairs)
+                started = time.perf_counter()
+                with Session() as db:
+                    try:
+                        session_id, display_order = db.execute(
+                            select(models.SessionImage.session_id, models.SessionImage.display_order)
+                            .join(models.Session, models.SessionImage.session_id == models.Session.session_id)
+                            .where(models.SessionImage.session_image_id == si_id)
+                        ).one()
+                        db.scalar(
+                            select(models.CatalogVersion.version).where(models.CatalogVersion.name == "questions")
+                        )
+                        db.add(models.Rating(session_image_id=si_id, question_id=q_id, rating_value=3))
+                        db.execute(
+                            update(models.Session)
+                            .where(models.Session.session_id == session_id, models.Session.last_image_index < display_order)
+                            .values(last_image_index=display_order)
+                        )
+                        db.commit()
+                        latencies.append(time.perf_counter() - started)
+                    except OperationalError:
+                        db.rollback()
+                        errors[0] += 1
+
+        def reader():
+            latencies, errors = results["read"]
+            rng = random.Random()
+            while not stop.is_set():
+                session_id = rng.randint(1, N_SESSIONS)
+                started = time.perf_counter()
+                with Session() as db:
+                    try:
+                        db.execute(
+                            select(models.SessionImage.session_image_id, models.Image.file_name)
+                            .join(models.Image, models.SessionImage.image_id == models.Image.image_id)
+                            .where(models.SessionImage.session_id == session_id)
+                            .order_by(models.SessionImage.display_order)
+                        ).all()
+                        latencies.append(time.perf_counter() - started)
+                    except OperationalError:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        engine.dispose()
+
+    return {
+        "profile": name,
+        "write": _summary(results["write"][0], results["write"][1][0], seconds),
+        "read": _summary(results["read"][0], results["read"][1][0], seconds),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SQLite concurrent writer/reader benchmark.")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--json", help="write the machine-readable report to this file")
+    args = parser.parse_args()
+
+    report = [run_profile(name, args.writers, args.readers, args.seconds) for name in PROFILES]
+    for entry in report:
+        for kind in ("write", "read"):
+            stats = entry[kind]
+            print(
+                f"{entry['profile']:8} {kind:5} {stats['ops_per_sec']:>9} ops/s  "
+                f"p50 {stats['p50_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  "
+                f"lock errors {stats['lock_errors']}"
+            )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
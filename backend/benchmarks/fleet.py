@@ -0,0 +1,410 @@
+# benchmarks/fleet.py
+
+"""
+End-to-end load test simulating a fleet of tablets running the real flow.
+
+Each simulated subject, concurrently with the others:
+
+    POST  /clock/sync (CLOCK_SYNC_SAMPLES times)
+    POST  /subjects/
+    POST  /sessions/
+    POST  /session-images/{session_id}/assign_images
+    loop: GET /flow/next_image  ->  POST /ratings/batch (or one POST /ratings/ per question)
+    PATCH /sessions/{session_id}/complete
+
+The app runs against a temporary SQLite database and image folder, either
+in-process (httpx ASGITransport) or under uvicorn with several workers. The
+report has throughput, p50/p95/p99 latency per endpoint and, in-process, the
+time SQLite write statements took (which includes waiting for the database
+write lock) plus the number of "database is locked" errors. Clients share the
+server's clock, so the clock offsets they estimate measure the sync error.
+
+    python -m backend.benchmarks.fleet [--subjects 32] [--images 60] [--questions 3]
+        [--mode inprocess|uvicorn] [--workers 4] [--rating-mode batch|single]
+        [--think-ms 0] [--write-behind] [--json report.json] [--baseline old.json --max-regression 0.25]
+
+With --baseline, p95 latencies and throughput are compared with an earlier
+report and the command exits with status 1 on a regression.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import httpx
+
+# App modules read their settings at import time; they are imported in
+# _configure() after the environment points at the temporary database.
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+CLOCK_SYNC_SAMPLES = 5
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(_percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(_percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(_percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples, default=0.0) * 1000, 2),
+    }
+
+
+class Recorder:
+    """
+    Per-endpoint latencies and error counts of the simulated clients.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.clock_offsets: List[float] = []
+        self.clock_rtts: List[float] = []
+
+    async def call(self, name: str, request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await request
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        else:
+            self.latencies[name].append(elapsed)
+        return response
+
+    async def clock_sync(self, client: httpx.AsyncClient) -> float:
+        """
+        Estimate the client clock offset like a tablet does; returns it in ms.
+        """
+        from backend.app.clock import estimate_offset
+
+        samples = []
+        for _ in range(CLOCK_SYNC_SAMPLES):
+            t0 = time.time() * 1000
+            response = await self.call("POST /clock/sync", client.post("/clock/sync", json={"client_sent_ms": t0}))
+            t3 = time.time() * 1000
+            body = response.json()
+            samples.append((t0, body["server_received_ms"], body["server_sent_ms"], t3))
+        offset, rtt = estimate_offset(samples)
+        self.clock_offsets.append(offset)
+        self.clock_rtts.append(rtt)
+        return offset
+
+    def clock_summary(self) -> Dict[str, Any]:
+        errors = [abs(offset) for offset in self.clock_offsets]
+        return {
+            "syncs": len(errors),
+            "p50_abs_offset_ms": round(_percentile(errors, 50), 3),
+            "max_abs_offset_ms": round(max(errors, default=0.0), 3),
+            "p50_rtt_ms": round(_percentile(self.clock_rtts, 50), 3),
+        }
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"count": len(self.latencies[name]), "errors": self.errors[name], **_latency_summary(self.latencies[name])}
+            for name in sorted(set(self.latencies) | set(self.errors))
+        }
+
+
+class SqliteProbe:
+    """
+    Times write statements on the app's engines and counts lock errors.
+
+    With WAL a transaction takes the write lock at its first INSERT/UPDATE/
+    DELETE, so the time of write statements includes any wait on busy_timeout.
+    """
+
+    def __init__(self):
+        self.write_times: List[float] = []
+        self.lock_errors = 0
+        self._lock = threading.Lock()
+
+    def attach(self, engine) -> None:
+        from sqlalchemy import event
+
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+        event.listen(engine, "handle_error", self._error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["fleet_started"] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("fleet_started", None)
+        if started is not None and statement.lstrip().upper().startswith(WRITE_PREFIXES):
+            with self._lock:
+                self.write_times.append(time.perf_counter() - started)
+
+    def _error(self, context):
+        if "database is locked" in str(context.original_exception):
+            with self._lock:
+                self.lock_errors += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "write_statements": len(self.write_times),
+            **_latency_summary(self.write_times),
+            "lock_errors": self.lock_errors,
+        }
+
+
+def _configure(tmp: str, n_images: int, write_behind: bool = False) -> Dict[str, str]:
+    """
+    Point the app at a fresh database and image folder, migrate it and
+    return the environment for the app process.
+    """
+    from PIL import Image as PILImage
+
+    image_dir = os.path.join(tmp, "images")
+    os.makedirs(image_dir)
+    for image_id in range(1, n_images + 1):
+        PILImage.new("RGB", (64, 48), (image_id % 256, 80, 160)).save(os.path.join(image_dir, f"{image_id}.jpg"))
+
+    env = {
+        "SQLITE_URL": f"sqlite:///{os.path.join(tmp, 'fleet.db')}",
+        "IMAGE_DIR": image_dir,
+        "IMAGE_CACHE_DIR": os.path.join(tmp, "cache"),
+        "AUTO_MIGRATE": "false",
+        "WRITE_BEHIND": "true" if write_behind else "false",
+        "WRITE_BEHIND_DIR": os.path.join(tmp, "wal"),
+    }
+    os.environ.update(env)
+
+    from backend.app.database import make_engine
+    from backend.app.migrations import upgrade
+
+    engine = make_engine(env["SQLITE_URL"])
+    upgrade(engine)
+    engine.dispose()
+    return env
+
+
+async def _subject(client: httpx.AsyncClient, rec: Recorder, index: int, args, question_ids: List[int]) -> int:
+    """
+    Run one subject through the whole flow; returns the number of ratings sent.
+    """
+    rng = random.Random(index)
+    think = args.think_ms / 1000
+    offset = await rec.clock_sync(client)
+
+    subject = (await rec.call("POST /subjects/", client.post("/subjects/", json={"name": f"fleet-{index}"}))).json()
+    session = (await rec.call("POST /sessions/", client.post(
+        "/sessions/", json={"subject_id": subject["subject_id"], "session_type": "block1"}
+    ))).json()
+    session_id = session["session_id"]
+
+    image_ids = list(range(1, args.images + 1))
+    rng.shuffle(image_ids)
+    await rec.call("POST /session-images/{id}/assign_images", client.post(
+        f"/session-images/{session_id}/assign_images", json=image_ids
+    ))
+
+    sent = 0
+    while True:
+        item = (await rec.call("GET /flow/next_image", client.get(
+            "/flow/next_image", params={"session_id": session_id}
+        ))).json()
+        if "session_image_id" not in item:
+            break
+        onset = time.time() * 1000
+        if think:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * think)
+        answers = [
+            {
+                "session_image_id": item["session_image_id"],
+                "question_id": question_id,
+                "rating_value": rng.randint(1, 5),
+                "stimulus_onset_client_ms": onset,
+                "response_client_ms": time.time() * 1000,
+                "clock_offset_ms": offset,
+            }
+            for question_id in question_ids
+        ]
+        if args.rating_mode == "batch":
+            await rec.call("POST /ratings/batch", client.post("/ratings/batch", json=answers))
+        else:
+            for answer in answers:
+                await rec.call("POST /ratings/", client.post("/ratings/", json=answer))
+        sent += len(answers)
+
+    await rec.call("PATCH /sessions/{id}/complete", client.patch(f"/sessions/{session_id}/complete"))
+    return sent
+
+
+async def _run_fleet(client: httpx.AsyncClient, args) -> Dict[str, Any]:
+    rec = Recorder()
+    question_ids = [
+        (await client.post("/questions/", json={"question_text": f"q{i}", "min_scale": 1, "max_scale": 5})).json()["question_id"]
+        for i in range(args.questions)
+    ]
+
+    started = time.perf_counter()
+    ratings = await asyncio.gather(*(
+        _subject(client, rec, index, args, question_ids) for index in range(args.subjects)
+    ))
+    elapsed = time.perf_counter() - started
+
+    endpoints = rec.summary()
+    requests = sum(e["count"] + e["errors"] for e in endpoints.values())
+    return {
+        "duration_s": round(elapsed, 3),
+        "throughput": {
+            "requests_per_s": round(requests / elapsed, 1),
+            "ratings_per_s": round(sum(ratings) / elapsed, 1),
+            "sessions_per_s": round(args.subjects / elapsed, 2),
+        },
+        "endpoints": endpoints,
+        "clock": rec.clock_summary(),
+    }
+
+
+async def run_inprocess(args) -> Dict[str, Any]:
+    from backend.app.database import async_engine, engine
+    from backend.app.main import app
+
+    probe = SqliteProbe()
+    probe.attach(engine)
+    probe.attach(async_engine.sync_engine)
+
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not run the lifespan (which opens the write-behind buffer)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://fleet", timeout=60) as client:
+            report = await _run_fleet(client, args)
+    report["sqlite"] = probe.summary()
+    return report
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_uvicorn(args, env: Dict[str, str]) -> Dict[str, Any]:
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, **env},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        limits = httpx.Limits(max_connections=args.subjects, max_keepalive_connections=args.subjects)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    (await client.get("/")).raise_for_status()
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline or server.poll() is not None:
+                        raise RuntimeError("uvicorn did not start")
+                    await asyncio.sleep(0.2)
+            report = await _run_fleet(client, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    # Statement timings live in the worker processes; only HTTP-level data here
+    report["sqlite"] = None
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    Regressions of p95 latency per endpoint and of overall throughput.
+    """
+    problems = []
+    for name, stats in report["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        if old and old["p95_ms"] > 0 and stats["p95_ms"] > old["p95_ms"] * (1 + max_regression):
+            problems.append(f"{name}: p95 {stats['p95_ms']} ms vs {old['p95_ms']} ms")
+    for key in ("requests_per_s", "ratings_per_s"):
+        old = baseline.get("throughput", {}).get(key)
+        new = report["throughput"][key]
+        if old and new < old * (1 - max_regression):
+            problems.append(f"{key}: {new} vs {old}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tablet fleet load test.")
+    parser.add_argument("--subjects", type=int, default=32, help="concurrent simulated subjects")
+    parser.add_argument("--images", type=int, default=60, help="stimuli per session")
+    parser.add_argument("--questions", type=int, default=3, help="questions answered per stimulus")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--rating-mode", choices=["batch", "single"], default="batch")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause before answering")
+    parser.add_argument("--write-behind", action="store_true", help="run the app with WRITE_BEHIND enabled")
+    parser.add_argument("--json", help="write the machine-readable report to this file")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _configure(tmp, args.images, args.write_behind)
+        if args.mode == "inprocess":
+            report = asyncio.run(run_inprocess(args))
+        else:
+            report = asyncio.run(run_uvicorn(args, env))
+
+    report["config"] = {
+        key: getattr(args, key)
+        for key in ("mode", "subjects", "images", "questions", "rating_mode", "think_ms", "workers", "write_behind")
+    }
+
+    print(f"{args.subjects} subjects x {args.images} images x {args.questions} questions "
+          f"({args.mode}, {args.rating_mode}{', write-behind' if args.write_behind else ''}) in {report['duration_s']} s")
+    for key, value in report["throughput"].items():
+        print(f"  {key:16} {value}")
+    for name, stats in report["endpoints"].items():
+        print(
+            f"  {name:40} n={stats['count']:<6} err={stats['errors']:<4} p50 {stats['p50_ms']:>8} ms  "
+            f"p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms"
+        )
+    c = report["clock"]
+    print(
+        f"  clock sync n={c['syncs']} |offset| p50 {c['p50_abs_offset_ms']} ms  "
+        f"max {c['max_abs_offset_ms']} ms  rtt p50 {c['p50_rtt_ms']} ms"
+    )
+    if report["sqlite"]:
+        s = report["sqlite"]
+        print(
+            f"  sqlite writes n={s['write_statements']} p50 {s['p50_ms']} ms  p95 {s['p95_ms']} ms  "
+            f"p99 {s['p99_ms']} ms  max {s['max_ms']} ms  lock errors {s['lock_errors']}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print(f"note: baseline was run with {baseline.get('config')}")
+        problems = compare(report, baseline, args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# benchmarks/serialization.py
+
+"""
+Fast JSON path (Core rows -> dicts -> one encode call) vs the ORM path
+(ORM entities -> response_model validation with from_attributes ->
+jsonable JSONResponse) on 10k-row payloads.
+
+Seeds a temporary SQLite database with one session of ROWS session images and
+ROWS ratings, mounts the real session_images and ratings routers next to
+copies of their previous ORM-based list handlers, and times:
+
+    session-images   GET /session-images/?session_id=1 (ROWS rows, nested image)
+    ratings          GET /ratings/ paged with ?after= until all ROWS rows are read
+
+Both paths must return identical JSON; the benchmark checks this first.
+
+    python -m backend.benchmarks.serialization [--rows 10000] [--repeat 20] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Response
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import contains_eager
+
+from backend.app import models, schemas
+from backend.app.database import make_async_engine, make_engine
+from backend.app.migrations import upgrade
+from backend.app.pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, PageParams, page_response, page_statement
+from backend.app.routers import ratings, session_images
+from backend.app.studies import get_async_db
+
+DEFAULT_ROWS = 10_000
+
+
+def _seed(engine, rows: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(models.Subject), [{"name": "s"}])
+        conn.execute(insert(models.Session), [{"subject_id": 1, "session_type": "block1", "is_completed": False}])
+        conn.execute(insert(models.Image), [
+            {"image_id": i, "file_name": f"{i}.jpg", "file_path": f"backend/images/{i}.jpg", "description": f"Image {i}"}
+            for i in range(1, rows + 1)
+        ])
+        conn.execute(insert(models.SessionImage), [
+            {"session_id": 1, "image_id": i, "display_order": i, "is_training": False}
+            for i in range(1, rows + 1)
+        ])
+        conn.execute(insert(models.Question), [{"question_text": "q", "question_type": "likert"}])
+        conn.execute(insert(models.Rating), [
+            {"session_image_id": i, "question_id": 1, "rating_value": i % 5 + 1, "response_time": 1.5}
+            for i in range(1, rows + 1)
+        ])
+
+
+def build_app(db_url: str) -> FastAPI:
+    factory = async_sessionmaker(make_async_engine(db_url), autoflush=False, expire_on_commit=False)
+
+    async def get_bench_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app = FastAPI()
+    app.include_router(session_images.router)
+    app.include_router(ratings.router)
+    app.dependency_overrides[get_async_db] = get_bench_db
+
+    # The ORM-based handlers the fast path replaced
+    @app.get("/orm/session-images/", response_model=List[schemas.SessionImageOut])
+    async def orm_session_images(session_id: int, db: AsyncSession = Depends(get_bench_db)):
+        rows = (await db.scalars(
+            select(models.SessionImage)
+            .join(models.Image, models.SessionImage.image_id == models.Image.image_id)
+            .where(models.SessionImage.session_id == session_id)
+            .options(contains_eager(models.SessionImage.image))
+        )).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="No images found for the session")
+        return rows
+
+    @app.get("/orm/ratings/", response_model=List[schemas.RatingOut])
+    async def orm_ratings(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_bench_db)):
+        rows = (await db.execute(page_statement(models.Rating, page))).all()
+        return page_response(models.Rating, page, rows, response)
+
+    return app
+
+
+async def _fetch_session_images(client: httpx.AsyncClient, prefix: str) -> list:
+    response = await client.get(f"{prefix}/session-images/", params={"session_id": 1})
+    response.raise_for_status()
+    return [response.content]
+
+
+async def _fetch_ratings(client: httpx.AsyncClient, prefix: str) -> list:
+    bodies = []
+    params: Dict[str, Any] = {"limit": MAX_PAGE_SIZE}
+    while True:
+        response = await client.get(f"{prefix}/ratings/", params=params)
+        response.raise_for_status()
+        bodies.append(response.content)
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return bodies
+        params["after"] = cursor
+
+
+async def run(rows: int, repeat: int) -> List[Dict[str, Any]]:
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = make_engine(db_url)
+        upgrade(engine)
+        _seed(engine, rows)
+        engine.dispose()
+
+        transport = httpx.ASGITransport(app=build_app(db_url))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, fetch in (("session-images", _fetch_session_images), ("ratings", _fetch_ratings)):
+                fast_bodies = await fetch(client, "")
+                orm_bodies = await fetch(client, "/orm")
+                decoded = [sum((json.loads(b) for b in bodies), []) for bodies in (fast_bodies, orm_bodies)]
+                if decoded[0] != decoded[1]:
+                    raise AssertionError(f"{name}: fast and ORM paths returned different JSON")
+
+                for path, prefix in (("fast", ""), ("orm", "/orm")):
+                    timings = []
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        await fetch(client, prefix)
+                        timings.append(time.perf_counter() - started)
+                    report.append({
+                        "endpoint": name,
+                        "path": path,
+                        "rows": len(decoded[0]),
+                        "bytes": sum(len(b) for b in fast_bodies),
+                        "median_ms": round(statistics.median(timings) * 1000, 2),
+                        "min_ms": round(min(timings) * 1000, 2),
+                    })
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fast JSON path vs ORM serialization benchmark.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write the machine-readable report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.rows, args.repeat))
+    for entry in report:
+        print(
+            f"{entry['endpoint']:15} {entry['path']:5} {entry['rows']:>7} rows  "
+            f"median {entry['median_ms']:>9} ms  min {entry['min_ms']:>9} ms"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# tests/conftest.py
+
+"""
+The app reads its settings and creates its engines at import time, so the
+environment is pointed at a temporary directory before anything under
+backend.app is imported. All tests share one main database; each test creates
+the subjects, sessions and questions it needs.
+
+    python -m pytest backend/tests
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+_root = tempfile.mkdtemp(prefix="backend-tests-")
+atexit.register(shutil.rmtree, _root, ignore_errors=True)
+
+os.environ.update(
+    SQLITE_URL=f"sqlite:///{os.path.join(_root, 'main.db')}",
+    AUTO_MIGRATE="true",
+    IMAGE_DIR=os.path.join(os.path.dirname(os.path.dirname(__file__)), "images"),
+    IMAGE_CACHE_DIR=os.path.join(_root, "derivatives"),
+    STUDY_DB_DIR=os.path.join(_root, "studies"),
+    WRITE_BEHIND="false",
+    WRITE_BEHIND_DIR=os.path.join(_root, "wal"),
+    STUDY_CHECK_SECONDS="0",
+    CATALOG_CHECK_SECONDS="0",
+)
+
+import itertools  # noqa: E402
+from typing import Dict, List  # noqa: E402
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.app.main import app  # noqa: E402
+
+_names = itertools.count(1)
+
+
+def _ok(response) -> dict:
+    assert response.status_code < 300, (response.status_code, response.text)
+    return response.json()
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def experiment(client) -> Dict:
+    """
+    A new subject with one block1 session of images 1-3 and two questions.
+    """
+    n = next(_names)
+    subject = _ok(client.post("/subjects/", json={"name": f"subject {n}"}))
+    session = _ok(client.post("/sessions/", json={"subject_id": subject["subject_id"], "session_type": "block1"}))
+    session_images: List[dict] = _ok(
+        client.post(f"/session-images/{session['session_id']}/assign_images", json=[1, 2, 3])
+    )
+    questions = [
+        _ok(client.post("/questions/", json={"question_text": f"q{n}.{i}", "min_scale": 1, "max_scale": 5}))
+        for i in (1, 2)
+    ]
+    return {"subject": subject, "session": session, "session_images": session_images, "questions": questions}
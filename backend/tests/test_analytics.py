@@ -0,0 +1,127 @@
+# tests/test_analytics.py
+
+import numpy as np
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from backend.app import models
+from backend.app.analytics import Z_95, RatingMatrix, bt500_screening
+from backend.app.database import engine
+
+# subjects x (reference, distorted, distorted)
+SCORES = np.array([
+    [5, 3, 2],
+    [4, 3, 1],
+    [5, 2, 2],
+    [4, 4, 1],
+    [3, 2, 1],
+], dtype=float)
+
+
+def _ok(response):
+    assert response.status_code < 300, (response.status_code, response.text)
+    return response.json()
+
+
+@pytest.fixture
+def panel(client):
+    """
+    Fresh images (a reference and two distortions of it), a question and one
+    session per row of SCORES, rated through the batch endpoint.
+    """
+    # Register the image folder first: its files are named after image ids
+    # that new rows would otherwise take
+    subject = _ok(client.post("/subjects/", json={"name": "panel folder"}))
+    session = _ok(client.post("/sessions/", json={"subject_id": subject["subject_id"], "session_type": "block1"}))
+    _ok(client.post(f"/session-images/{session['session_id']}/assign_images", json=list(range(1, 11))))
+
+    reference = _ok(client.post("/images/", json={"file_name": "panel-ref.png"}))
+    images = [reference] + [
+        _ok(client.post("/images/", json={
+            "file_name": f"panel-dist-{k}.png", "reference_image_id": reference["image_id"],
+        }))
+        for k in (1, 2)
+    ]
+    image_ids = [image["image_id"] for image in images]
+    question = _ok(client.post("/questions/", json={"question_text": "panel", "min_scale": 1, "max_scale": 5}))
+    subject_ids = []
+    for k, row in enumerate(SCORES):
+        subject = _ok(client.post("/subjects/", json={"name": f"panel subject {k}"}))
+        session = _ok(client.post("/sessions/", json={"subject_id": subject["subject_id"], "session_type": "block1"}))
+        session_images = [
+            _ok(client.post("/session-images/", json={
+                "session_id": session["session_id"], "image_id": image_id, "display_order": order,
+            }))
+            for order, image_id in enumerate(image_ids, start=1)
+        ]
+        _ok(client.post("/ratings/batch", json=[
+            {"session_image_id": si["session_image_id"], "question_id": question["question_id"], "rating_value": value}
+            for si, value in zip(session_images, row)
+        ]))
+        subject_ids.append(subject["subject_id"])
+    return {"image_ids": image_ids, "subject_ids": subject_ids, "question_id": question["question_id"]}
+
+
+def test_mos_from_running_sums_matches_raw_ratings(client, panel):
+    rows = _ok(client.get("/analytics/mos", params={"question_id": panel["question_id"]}))
+    assert [row["image_id"] for row in rows] == panel["image_ids"]
+    for row, column in zip(rows, SCORES.T):
+        std = np.std(column, ddof=1)
+        assert row["n"] == len(column)
+        assert row["mos"] == pytest.approx(np.mean(column))
+        assert row["std"] == pytest.approx(std)
+        assert row["ci95"] == pytest.approx(Z_95 * std / np.sqrt(len(column)))
+
+
+def test_zscore_mos_matches_raw_ratings(client, panel):
+    z = (SCORES - SCORES.mean(axis=1, keepdims=True)) / SCORES.std(axis=1, ddof=1, keepdims=True)
+    rows = _ok(client.get("/analytics/zmos", params={"question_id": panel["question_id"]}))
+    assert [row["image_id"] for row in rows] == panel["image_ids"]
+    for row, expected in zip(rows, z.mean(axis=0)):
+        assert row["z_mos"] == pytest.approx(expected)
+        assert row["z_mos_rescaled"] == pytest.approx((expected + 3) * 100 / 6)
+
+
+def test_zscore_mos_without_subject_stats_is_empty(client, panel):
+    with Session(engine) as db:
+        db.execute(delete(models.SubjectScoreStats).where(
+            models.SubjectScoreStats.question_id == panel["question_id"]
+        ))
+        db.commit()
+    response = client.get("/analytics/zmos", params={"question_id": panel["question_id"]})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_dmos_matches_raw_ratings(client, panel):
+    rows = _ok(client.get("/analytics/dmos", params={"question_id": panel["question_id"]}))
+    reference_id = panel["image_ids"][0]
+    assert [(row["image_id"], row["reference_image_id"]) for row in rows] == [
+        (image_id, reference_id) for image_id in panel["image_ids"][1:]
+    ]
+    for row, k in zip(rows, (1, 2)):
+        diff = SCORES[:, 0] - SCORES[:, k]
+        assert row["n"] == len(diff)
+        assert row["dmos"] == pytest.approx(diff.mean())
+        assert row["std"] == pytest.approx(np.std(diff, ddof=1))
+
+
+def test_bt500_rejects_an_observer_scattered_on_both_sides():
+    rng = np.random.default_rng(7)
+    scores = np.clip(np.round(rng.normal(3, 0.5, size=(12, 20))), 1, 5)
+    scores[0] = np.where(np.arange(20) % 2, 5.0, 1.0)
+    matrix = RatingMatrix(np.arange(1, 13), np.arange(1, 21), scores)
+
+    screening = bt500_screening(matrix)
+    assert [row["subject_id"] for row in screening if row["rejected"]] == [1]
+    assert screening[0]["p"] > 0 and screening[0]["q"] > 0
+
+
+def test_bt500_keeps_an_observer_biased_to_one_side():
+    rng = np.random.default_rng(7)
+    scores = np.clip(np.round(rng.normal(3, 0.5, size=(12, 20))), 1, 5)
+    scores[0] = 5.0
+    matrix = RatingMatrix(np.arange(1, 13), np.arange(1, 21), scores)
+
+    assert not bt500_screening(matrix)[0]["rejected"]
@@ -0,0 +1,39 @@
+# tests/test_catalog.py
+
+import asyncio
+import threading
+
+from backend.app import catalog
+from backend.app.database import AsyncSessionLocal, SessionLocal
+
+
+def test_async_reload_builds_off_the_loop(client, experiment, monkeypatch):
+    question_id = experiment["questions"][0]["question_id"]
+    fetches, builders = [], []
+    fetch, build = catalog.questions._fetch, catalog.questions._build
+    monkeypatch.setattr(catalog.questions, "_fetch", lambda db: fetches.append(1) or fetch(db))
+    monkeypatch.setattr(catalog.questions, "_build", lambda rows: builders.append(threading.get_ident()) or build(rows))
+
+    async def lookups():
+        with SessionLocal() as db:
+            catalog.questions.invalidate(db)
+            db.commit()
+        sessions = [AsyncSessionLocal() for _ in range(4)]
+        try:
+            found = await asyncio.gather(*(db.run_sync(catalog.questions.get, question_id) for db in sessions))
+        finally:
+            for db in sessions:
+                await db.close()
+        return threading.get_ident(), found
+
+    loop_thread, found = client.portal.call(lookups)
+    assert [q.question_text for q in found] == [experiment["questions"][0]["question_text"]] * 4
+    # One reload shared by the concurrent lookups, built in a worker thread
+    assert len(fetches) == len(builders) == 1
+    assert builders[0] != loop_thread
+
+
+def test_sync_lookups_see_new_rows(client, experiment):
+    with SessionLocal() as db:
+        assert catalog.questions.page(db, None, 10**6)[-1].question_id == experiment["questions"][-1]["question_id"]
+        assert catalog.images.get_many(db, [1, 2, 3, 10**6]).keys() == {1, 2, 3}
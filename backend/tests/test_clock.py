@@ -0,0 +1,89 @@
+# tests/test_clock.py
+
+from datetime import datetime
+
+import pytest
+
+from backend.app.clock import corrected_timing, estimate_offset
+from backend.app.schemas import RatingCreate
+
+# 2026-01-01T00:00:00Z in ms
+EPOCH_2026 = 1767225600000.0
+
+
+def _timed_rating(**timing):
+    return RatingCreate(session_image_id=1, question_id=1, rating_value=3, **timing)
+
+
+def test_estimate_offset_uses_the_shortest_round_trip():
+    samples = [
+        # t0, t1, t2, t3: server 500 ms ahead, 40 ms each way, 2 ms handling
+        (1000.0, 1540.0, 1542.0, 1082.0),
+        # Queued on the way back: the offset estimate is skewed by 200 ms
+        (2000.0, 2540.0, 2542.0, 2482.0),
+        # Fastest sample, but asymmetric by 2 ms
+        (3000.0, 3512.0, 3513.0, 3021.0),
+    ]
+    offset, rtt = estimate_offset(samples)
+    assert rtt == 20.0
+    assert offset == 502.0
+    assert abs(offset - 500.0) <= rtt / 2
+
+
+def test_estimate_offset_needs_samples():
+    with pytest.raises(ValueError):
+        estimate_offset([])
+
+
+def test_corrected_timing_maps_client_times_to_server_time():
+    rating = _timed_rating(
+        stimulus_onset_client_ms=EPOCH_2026 - 2000, response_client_ms=EPOCH_2026 + 1250,
+        clock_offset_ms=2000, clock_rtt_ms=30,
+    )
+    assert corrected_timing(rating) == {
+        "stimulus_onset_at": datetime(2026, 1, 1),
+        "responded_at": datetime(2026, 1, 1, 0, 0, 3, 250000),
+        "clock_uncertainty_ms": 15.0,
+        "response_time": 3.25,
+    }
+
+
+def test_corrected_timing_keeps_the_clients_response_time():
+    rating = _timed_rating(
+        stimulus_onset_client_ms=EPOCH_2026, response_client_ms=EPOCH_2026 + 1000,
+        clock_offset_ms=0, response_time=0.9,
+    )
+    values = corrected_timing(rating)
+    assert "response_time" not in values
+    assert values["clock_uncertainty_ms"] is None
+
+
+def test_corrected_timing_without_client_times():
+    assert corrected_timing(_timed_rating()) == {
+        "stimulus_onset_at": None, "responded_at": None, "clock_uncertainty_ms": None,
+    }
+
+
+@pytest.mark.parametrize("timing", [
+    {"stimulus_onset_client_ms": 1e20, "clock_offset_ms": 0},
+    {"response_client_ms": EPOCH_2026, "clock_offset_ms": -1e20},
+    {"response_client_ms": EPOCH_2026, "clock_offset_ms": 0, "clock_rtt_ms": -1},
+])
+def test_out_of_range_client_times_are_rejected(client, experiment, timing):
+    rating = {
+        "session_image_id": experiment["session_images"][0]["session_image_id"],
+        "question_id": experiment["questions"][0]["question_id"],
+        "rating_value": 3, **timing,
+    }
+    assert client.post("/ratings/", json=rating).status_code == 422
+
+
+def test_non_finite_client_times_are_rejected(client, experiment):
+    body = (
+        '{"session_image_id": %d, "question_id": %d, "rating_value": 3,'
+        ' "response_client_ms": Infinity, "clock_offset_ms": 0}'
+    ) % (experiment["session_images"][0]["session_image_id"], experiment["questions"][0]["question_id"])
+    response = client.post("/ratings/", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    sync = client.post("/clock/sync", content='{"client_sent_ms": NaN}', headers={"Content-Type": "application/json"})
+    assert sync.status_code == 422
@@ -0,0 +1,104 @@
+# tests/test_counterbalance.py
+
+from collections import Counter
+
+import pytest
+
+from backend.app.counterbalance import build_order, interleave_training, separate_sources, williams_row
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 5, 6])
+def test_williams_square_is_balanced(n):
+    rows = [williams_row(n, row) for row in range(n if n % 2 == 0 else 2 * n)]
+    for position in range(n):
+        assert Counter(order[position] for order in rows) == {c: len(rows) // n for c in range(n)}
+    # Every condition follows every other one equally often
+    pairs = Counter((a, b) for order in rows for a, b in zip(order, order[1:]))
+    assert set(pairs.values()) == {len(rows) // n}
+    assert len(pairs) == n * (n - 1)
+
+
+def test_separate_sources_avoids_back_to_back_repeats():
+    sources = {1: "a", 2: "a", 3: "b", 4: "b", 5: "c"}
+    order = separate_sources([1, 2, 3, 4, 5], sources.get)
+    assert sorted(order) == [1, 2, 3, 4, 5]
+    assert all(sources[x] != sources[y] for x, y in zip(order, order[1:]))
+    with pytest.raises(ValueError):
+        separate_sources([1, 2, 3], lambda image_id: "same source")
+
+
+def test_interleave_training():
+    assert interleave_training([1, 2], [9, 8], None) == [(9, True), (8, True), (1, False), (2, False)]
+    assert interleave_training([1, 2, 3], [9, 8], 2) == [(1, False), (2, False), (9, True), (3, False), (8, True)]
+
+
+def test_build_order_is_reproducible():
+    kwargs = dict(strategy="random", seed=7, session_type="block1", no_repeat_source=False)
+    first = build_order(list(range(1, 11)), subject_id=3, **kwargs)
+    assert build_order(list(range(1, 11)), subject_id=3, **kwargs) == first
+    assert build_order(list(range(1, 11)), subject_id=4, **kwargs) != first
+    assert sorted(image_id for image_id, _ in first) == list(range(1, 11))
+
+    training = build_order([1, 2], strategy="fixed", seed=0, subject_id=1, session_type="training",
+                           training_image_ids=[9])
+    assert training == [(9, True), (1, True), (2, True)]
+    with pytest.raises(ValueError):
+        build_order([1], strategy="nope", seed=0, subject_id=1, session_type="block1")
+
+
+def test_cohort_playlists(client, experiment):
+    # experiment registered images 1-3
+    subject = experiment["subject"]
+    session_ids = [
+        client.post("/sessions/", json={"subject_id": subject["subject_id"], "session_type": "block1"}).json()["session_id"]
+        for _ in range(2)
+    ]
+    spec = {"image_ids": [1, 2, 3], "strategy": "latin_square", "no_repeat_source": False}
+    response = client.post("/playlists/cohort", json={"session_ids": session_ids, "spec": spec})
+    assert response.status_code == 200
+    playlists = response.json()
+    assert [p["session_id"] for p in playlists] == session_ids
+    for playlist in playlists:
+        stored = client.get("/session-images/", params={"session_id": playlist["session_id"]}).json()
+        assert [si["image_id"] for si in sorted(stored, key=lambda si: si["display_order"])] == playlist["image_ids"]
+
+    again = client.post("/playlists/cohort", json={"session_ids": session_ids[:1], "spec": spec})
+    assert again.status_code == 409
+
+
+def test_latin_square_rows_rotate_across_calls(client, experiment):
+    # One subject for every session: rows must not depend on subject ids
+    subject_id = experiment["subject"]["subject_id"]
+    session_ids = [
+        client.post("/sessions/", json={"subject_id": subject_id, "session_type": "latin-rotation"}).json()["session_id"]
+        for _ in range(6)
+    ]
+    spec = {"image_ids": [1, 2, 3], "strategy": "latin_square", "no_repeat_source": False}
+    first = client.post("/playlists/cohort", json={"session_ids": session_ids[:4], "spec": spec})
+    second = client.post("/playlists/cohort", json={"session_ids": session_ids[4:], "spec": spec})
+    orders = [tuple(p["image_ids"]) for p in first.json() + second.json()]
+    # Three images need the 6 rows of a Williams square, each used once
+    assert orders == [tuple(c + 1 for c in williams_row(3, row)) for row in range(6)]
+
+
+def test_latin_square_rows_are_not_reordered_for_sources():
+    image_ids = [10, 11, 12, 13]
+    for row in range(4):
+        order = build_order(image_ids, strategy="latin_square", seed=0, subject_id=1,
+                            session_type="block1", row=row)
+        assert [image_id for image_id, _ in order] == [image_ids[c] for c in williams_row(4, row)]
+
+    sources = {10: "a", 11: "a", 12: "b", 13: "b"}
+    with pytest.raises(ValueError):
+        build_order(image_ids, strategy="latin_square", seed=0, subject_id=1, session_type="block1",
+                    sources=sources)
+    kept = build_order(image_ids, strategy="latin_square", seed=0, subject_id=1, session_type="block1",
+                       sources=sources, no_repeat_source=False)
+    assert [image_id for image_id, _ in kept] == [image_ids[c] for c in williams_row(4, 0)]
+
+
+def test_cohort_latin_square_with_sources_is_rejected(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    spec = {"image_ids": [1, 2, 3], "strategy": "latin_square", "sources": {"1": "a", "2": "a"}}
+    response = client.post("/playlists/cohort", json={"session_ids": [session_id], "spec": spec})
+    assert response.status_code == 422
@@ -0,0 +1,109 @@
+# tests/test_database.py
+
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.util import greenlet_spawn
+
+from backend.app import database
+from backend.app.database import make_engine
+
+fcntl = pytest.importorskip("fcntl")
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    new_engine = make_engine(f"sqlite:///{tmp_path / 'writes.db'}")
+    with new_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE counters (id INTEGER PRIMARY KEY, n INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO counters VALUES (1, 0)"))
+    yield new_engine
+    new_engine.dispose()
+
+
+@pytest.fixture
+def held_file_lock(tmp_path):
+    # Another process (a migration, an export) holding the gate's file lock
+    path = str(tmp_path / "held.db")
+    fd = os.open(path + "-lock", os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    yield path
+    os.close(fd)
+
+
+def test_gate_gives_up_after_timeout(held_file_lock):
+    gate = database._WriteGate(held_file_lock, 0.2)
+    info = {}
+    started = time.monotonic()
+    gate.enter(info, is_async=False)
+    assert 0.15 <= time.monotonic() - started < 1.0
+    assert "write_gate" not in info
+    # The turn was handed on to the next writer of this process
+    assert gate._lock.acquire(blocking=False)
+    gate._lock.release()
+
+
+def test_async_gate_gives_up_without_blocking_the_loop(held_file_lock):
+    gate = database._WriteGate(held_file_lock, 0.2)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        info = {}
+        await greenlet_spawn(gate.enter, info, True)
+        task.cancel()
+        return info, ticks
+
+    info, ticks = asyncio.run(scenario())
+    assert "write_gate" not in info
+    assert ticks >= 5
+
+
+def test_read_then_write_waits_for_the_lock(db_engine):
+    # A transaction that reads before writing must queue for the lock, not
+    # fail with "database is locked" because another writer got in between
+    holder = db_engine.connect()
+    holder.execute(text("UPDATE counters SET n = n + 1"))
+    threading.Timer(0.2, holder.commit).start()
+
+    started = time.monotonic()
+    with db_engine.begin() as conn:
+        conn.execute(text("SELECT n FROM counters")).scalar()
+        conn.execute(text("UPDATE counters SET n = n + 10"))
+    assert time.monotonic() - started >= 0.15
+    holder.close()
+    with db_engine.connect() as conn:
+        assert conn.execute(text("SELECT n FROM counters")).scalar() == 11
+
+
+def test_concurrent_writers_get_no_lock_errors(db_engine):
+    errors = []
+
+    def writer():
+        try:
+            for _ in range(25):
+                with db_engine.begin() as conn:
+                    conn.execute(text("UPDATE counters SET n = n + 1"))
+                    conn.execute(text("SELECT n FROM counters")).scalar()
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with db_engine.connect() as conn:
+        assert conn.execute(text("SELECT n FROM counters")).scalar() == 200
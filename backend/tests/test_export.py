@@ -0,0 +1,64 @@
+# tests/test_export.py
+
+import csv
+import io
+
+import pytest
+
+from backend.app.export import COLUMN_NAMES, ExportFilters, stream_export
+
+
+@pytest.fixture
+def rated(client, experiment):
+    question_id = experiment["questions"][0]["question_id"]
+    response = client.post("/ratings/batch", json=[
+        {"session_image_id": si["session_image_id"], "question_id": question_id, "rating_value": value}
+        for si, value in zip(experiment["session_images"], (2, 4, 5))
+    ])
+    assert response.status_code == 200
+    return experiment
+
+
+def test_csv_export(client, rated):
+    session_id = rated["session"]["session_id"]
+    response = client.get("/export/ratings", params={"session_id": session_id})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert list(rows[0]) == COLUMN_NAMES
+    assert [(int(r["image_id"]), float(r["rating_value"])) for r in rows] == [(1, 2.0), (2, 4.0), (3, 5.0)]
+    assert {r["subject_name"] for r in rows} == {rated["subject"]["name"]}
+
+
+def test_csv_export_is_encoded_batch_by_batch(rated):
+    filters = ExportFilters(session_id=rated["session"]["session_id"])
+    chunks = list(stream_export("csv", filters, batch_size=1))
+    # The header goes out with the first batch, then one chunk per row
+    assert len(chunks) == 3
+    assert chunks[0].decode().splitlines()[0] == ",".join(COLUMN_NAMES)
+    assert all(len(chunk.decode().splitlines()) == 1 for chunk in chunks[1:])
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_arrow_exports(client, rated, fmt):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    response = client.get("/export/ratings", params={"format": fmt, "session_id": rated["session"]["session_id"]})
+    assert response.status_code == 200
+    data = pa.BufferReader(response.content)
+    table = pq.read_table(data) if fmt == "parquet" else pa.ipc.open_stream(data).read_all()
+    assert table.column_names == COLUMN_NAMES
+    assert table.column("rating_value").to_pylist() == [2.0, 4.0, 5.0]
+    assert table.schema.field("rated_at").type == pa.timestamp("us")
+
+
+def test_arrow_export_is_encoded_batch_by_batch(rated):
+    pytest.importorskip("pyarrow")
+    filters = ExportFilters(session_id=rated["session"]["session_id"])
+    assert len(list(stream_export("arrow", filters, batch_size=1))) > 3
+
+
+def test_unknown_format_is_refused():
+    with pytest.raises(ValueError):
+        stream_export("xlsx", ExportFilters())
@@ -0,0 +1,61 @@
+# tests/test_feed.py
+
+import asyncio
+import json
+
+from backend.app import feed
+
+
+def test_websocket_receives_ratings_and_progress(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    si, question = experiment["session_images"][0], experiment["questions"][0]
+    with client.websocket_connect(f"/feed/ws?session_id={session_id}") as websocket:
+        response = client.post("/ratings/", json={
+            "session_image_id": si["session_image_id"], "question_id": question["question_id"], "rating_value": 2,
+        })
+        assert response.status_code == 200
+        events = {}
+        while len(events) < 2:
+            event = json.loads(websocket.receive_text())
+            events[event["type"]] = event
+
+        assert [r["rating_id"] for r in events["ratings.created"]["ratings"]] == [response.json()["rating_id"]]
+        assert events["session.progress"]["rated_images_delta"] == 1
+        assert events["session.progress"]["last_image_index"] == si["display_order"]
+
+        assert client.patch(f"/sessions/{session_id}/complete", params={"force": True}).status_code == 200
+        completed = json.loads(websocket.receive_text())
+        assert completed["type"] == "session.completed"
+        assert completed["session"]["is_completed"] is True
+
+
+def test_feed_of_unknown_study_is_refused(client):
+    rejected = client.get("/feed/events", headers={"X-Study-Id": "no-such-study"})
+    assert rejected.status_code == 404
+
+
+def test_progress_is_merged_and_overflow_reported(monkeypatch):
+    monkeypatch.setattr(feed.settings, "FEED_MAX_PENDING", 3)
+
+    async def scenario():
+        with feed.broker.subscribe(None) as subscription:
+            for position in range(1, 6):
+                feed.progress({7: 1}, {7: position})
+            for i in range(4):
+                feed.broker.publish([feed.Event("test", {"i": i})])
+            return await subscription.next_batch()
+
+    events = asyncio.run(scenario())
+    assert [(e.type, e.data) for e in events] == [
+        ("feed.overflow", {"dropped": 2}),
+        ("test", {"i": 1}), ("test", {"i": 2}), ("test", {"i": 3}),
+    ]
+
+
+def test_subscriptions_only_see_their_study():
+    async def scenario():
+        with feed.broker.subscribe("a") as subscription:
+            feed.broker.publish([feed.Event("test", {"study": "b"}, "b"), feed.Event("test", {"study": "a"}, "a")])
+            return await subscription.next_batch()
+
+    assert [e.data for e in asyncio.run(scenario())] == [{"study": "a"}]
@@ -0,0 +1,32 @@
+# tests/test_images.py
+
+import pytest
+
+
+@pytest.fixture
+def broken_image(client, tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+    response = client.post("/images/", json={"file_name": "broken.jpg", "file_path": str(path)})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_derivative_etag_revalidation(client):
+    response = client.get("/images/1/derivative", params={"width": 64})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert client.get(f"{response.headers['content-location']}").content == response.content
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", W/{etag}', "*"):
+        revalidated = client.get("/images/1/derivative", params={"width": 64}, headers={"If-None-Match": if_none_match})
+        assert revalidated.status_code == 304, if_none_match
+    assert client.get(
+        "/images/1/derivative", params={"width": 64}, headers={"If-None-Match": 'W/"other"'}
+    ).status_code == 200
+
+
+def test_undecodable_source_is_rejected(client, broken_image):
+    response = client.get(f"/images/{broken_image['image_id']}/derivative")
+    assert response.status_code == 422
+    assert "broken.jpg" in response.json()["detail"]
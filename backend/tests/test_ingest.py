@@ -0,0 +1,117 @@
+# tests/test_ingest.py
+
+import itertools
+import os
+
+import pytest
+from PIL import Image as PILImage
+from sqlalchemy import select
+
+from backend.app import ingest as ingest_module, models, studies
+from backend.app.ingest import ingest
+
+_ids = itertools.count(1)
+
+
+def _image(path, color, size=(8, 6)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    PILImage.new("RGB", size, color).save(path)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "stimuli"
+    _image(str(root / "a.png"), "red")
+    _image(str(root / "sub" / "b.jpg"), "blue", size=(4, 4))
+    (root / "notes.txt").write_text("not an image")
+    (root / "broken.png").write_bytes(b"not a png")
+    return root
+
+
+@pytest.fixture
+def study_db(client):
+    study = f"ingest-{next(_ids)}"
+    assert client.post("/studies/", json={"study_id": study, "name": study}).status_code == 200
+    with studies.session(study) as db:
+        yield db
+
+
+@pytest.fixture
+def inspected(monkeypatch):
+    # Paths opened by the inspection step (workers=0 runs it in this process)
+    paths = []
+    inspect = ingest_module._inspect_task
+
+    def recording(task):
+        paths.append(os.path.basename(task[0]))
+        return inspect(task)
+
+    monkeypatch.setattr(ingest_module, "_inspect_task", recording)
+    return paths
+
+
+def _rows(db):
+    return {image.file_name: image for image in db.scalars(select(models.Image))}
+
+
+def test_unchanged_files_are_not_opened(study_db, tree, inspected):
+    first = ingest(study_db, str(tree), workers=0)
+    assert (first.scanned, first.added, first.failed) == (3, 2, ["broken.png"])
+    rows = _rows(study_db)
+    assert (rows["a.png"].width, rows["a.png"].height, rows["b.jpg"].format) == (8, 6, "JPEG")
+    assert rows["b.jpg"].description == "sub/b.jpg"
+
+    inspected.clear()
+    again = ingest(study_db, str(tree), workers=0)
+    assert (again.unchanged, again.added, again.updated, again.touched) == (2, 0, 0, 0)
+    # Only the unreadable file, which has no row, is tried again
+    assert inspected == ["broken.png"]
+
+
+def test_touched_and_changed_files(study_db, tree):
+    ingest(study_db, str(tree), workers=0)
+    before = _rows(study_db)
+    hashes = {name: row.content_hash for name, row in before.items()}
+
+    st = os.stat(tree / "a.png")
+    os.utime(tree / "a.png", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    _image(str(tree / "sub" / "b.jpg"), "green", size=(5, 5))
+
+    report = ingest(study_db, str(tree), workers=0)
+    assert (report.unchanged, report.touched, report.updated, report.added) == (0, 1, 1, 0)
+    study_db.expire_all()
+    after = _rows(study_db)
+    assert after["a.png"].content_hash == hashes["a.png"]
+    assert after["b.jpg"].content_hash != hashes["b.jpg"]
+    assert after["b.jpg"].width == 5
+    assert {row.image_id for row in after.values()} == {row.image_id for row in before.values()}
+
+
+def test_features_reinspect_files_without_them(study_db, tree, inspected):
+    ingest(study_db, str(tree), workers=0)
+    inspected.clear()
+    report = ingest(study_db, str(tree), workers=0, features=True)
+    assert report.touched == 2
+    assert sorted(inspected) == ["a.png", "b.jpg", "broken.png"]
+    study_db.expire_all()
+    assert _rows(study_db)["a.png"].brightness is not None
+
+    inspected.clear()
+    assert ingest(study_db, str(tree), workers=0, features=True).unchanged == 2
+    assert inspected == ["broken.png"]
+
+
+def test_missing_files_keep_their_rows(study_db, tree):
+    ingest(study_db, str(tree), workers=0)
+    os.remove(tree / "a.png")
+    report = ingest(study_db, str(tree), workers=0)
+    assert (report.scanned, report.missing) == (2, 1)
+    assert "a.png" in _rows(study_db)
+
+
+def test_dry_run_writes_nothing(study_db, tree, inspected):
+    report = ingest(study_db, str(tree), workers=0, dry_run=True)
+    # Nothing is opened, so the unreadable file counts as one to add
+    assert (report.added, report.failed) == (3, [])
+    assert inspected == []
+    assert _rows(study_db) == {}
@@ -0,0 +1,121 @@
+# tests/test_migrations.py
+
+import pytest
+from sqlalchemy import inspect, text
+
+from backend.app import migrations
+from backend.app.database import Base, make_engine
+
+# Before migration 12, which repairs unique indexes skipped by older upgrades
+BEFORE_REPAIR = 11
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    new_engine = make_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield new_engine
+    new_engine.dispose()
+
+
+def _version(db_engine):
+    with db_engine.connect() as conn:
+        return migrations.current_version(conn)
+
+
+def _indexes(db_engine, table):
+    return {index["name"] for index in inspect(db_engine).get_indexes(table)}
+
+
+def _seed_session(conn):
+    conn.execute(text("INSERT INTO subjects (subject_id, name) VALUES (1, 'a')"))
+    conn.execute(text(
+        "INSERT INTO sessions (session_id, subject_id, session_type, is_completed, last_image_index,"
+        " total_images, rated_images, response_time_total, response_time_count)"
+        " VALUES (1, 1, 'block1', 0, 0, 1, 0, 0, 0)"
+    ))
+    conn.execute(text("INSERT INTO images (image_id, file_name, file_path) VALUES (1, '1.jpg', '1.jpg')"))
+    conn.execute(text(
+        "INSERT INTO session_images (session_image_id, session_id, image_id, display_order, is_training)"
+        " VALUES (1, 1, 1, 1, 0)"
+    ))
+    conn.execute(text("INSERT INTO questions (question_id, question_text, question_type) VALUES (1, 'q', 'likert')"))
+
+
+def test_fresh_database_is_created_at_head(db_engine):
+    assert migrations.upgrade(db_engine) == migrations.HEAD
+    migrations.check_schema(db_engine)
+    assert migrations.upgrade(db_engine) == migrations.HEAD
+
+
+def test_unstamped_database_runs_every_migration(db_engine):
+    # A database from create_all() before versioning: every step must skip what exists
+    with db_engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+    assert _version(db_engine) is None
+    with pytest.raises(migrations.SchemaVersionError):
+        migrations.check_schema(db_engine)
+
+    assert migrations.upgrade(db_engine) == migrations.HEAD
+    migrations.check_schema(db_engine)
+
+
+def test_duplicate_ratings_are_moved_aside_before_the_unique_index(db_engine):
+    migrations.upgrade(db_engine)
+    with db_engine.begin() as conn:
+        conn.execute(text("DROP INDEX ux_ratings_session_image_question"))
+        _seed_session(conn)
+        for value in (3, 4, 5):
+            conn.execute(text(
+                f"INSERT INTO ratings (session_image_id, question_id, rating_value) VALUES (1, 1, {value})"
+            ))
+        conn.execute(text(f"UPDATE schema_version SET version = {BEFORE_REPAIR}"))
+
+    assert migrations.upgrade(db_engine) == migrations.HEAD
+    assert "ux_ratings_session_image_question" in _indexes(db_engine, "ratings")
+    with db_engine.connect() as conn:
+        # The first answer is kept and the aggregates only count it
+        assert conn.execute(text("SELECT rating_value FROM ratings")).scalars().all() == [3]
+        assert conn.execute(text("SELECT n, total FROM image_score_stats")).all() == [(1, 3)]
+        assert conn.execute(text("SELECT rated_images FROM sessions")).scalar() == 1
+        # The others are kept aside, not lost
+        moved = conn.execute(text(f"SELECT rating_value, moved_at FROM {migrations.RATING_DUPLICATES}")).all()
+        assert sorted(value for value, _ in moved) == [4, 5]
+        assert all(moved_at is not None for _, moved_at in moved)
+
+
+def test_unresolvable_duplicates_fail_without_stamping(db_engine):
+    migrations.upgrade(db_engine)
+    with db_engine.begin() as conn:
+        conn.execute(text("DROP INDEX ux_session_images_session_order"))
+        _seed_session(conn)
+        conn.execute(text(
+            "INSERT INTO session_images (session_image_id, session_id, image_id, display_order, is_training)"
+            " VALUES (2, 1, 1, 1, 0)"
+        ))
+        conn.execute(text(f"UPDATE schema_version SET version = {BEFORE_REPAIR}"))
+
+    with pytest.raises(migrations.SchemaVersionError, match="ux_session_images_session_order"):
+        migrations.upgrade(db_engine)
+    assert _version(db_engine) == BEFORE_REPAIR
+    assert "ux_session_images_session_order" not in _indexes(db_engine, "session_images")
+
+
+def test_duplicates_table_gains_newer_rating_columns(db_engine):
+    migrations.upgrade(db_engine)
+    with db_engine.begin() as conn:
+        conn.execute(text("DROP INDEX ux_ratings_session_image_question"))
+        _seed_session(conn)
+        for value in (1, 2):
+            conn.execute(text(f"INSERT INTO ratings (session_image_id, question_id, rating_value) VALUES (1, 1, {value})"))
+        # As left by a dedupe at version 3, before the client timing columns
+        conn.execute(text(
+            f"CREATE TABLE {migrations.RATING_DUPLICATES} (rating_id INTEGER, session_image_id INTEGER,"
+            " question_id INTEGER, rating_value FLOAT, moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL)"
+        ))
+        conn.execute(text(f"UPDATE schema_version SET version = {BEFORE_REPAIR}"))
+
+    assert migrations.upgrade(db_engine) == migrations.HEAD
+    columns = {c["name"] for c in inspect(db_engine).get_columns(migrations.RATING_DUPLICATES)}
+    assert {"client_key", "stimulus_onset_at", "responded_at"} <= columns
+    with db_engine.connect() as conn:
+        assert conn.execute(text(f"SELECT rating_value FROM {migrations.RATING_DUPLICATES}")).scalars().all() == [2]
@@ -0,0 +1,85 @@
+# tests/test_pagination.py
+
+import pytest
+
+from backend.app.pagination import NEXT_CURSOR_HEADER
+
+
+def _walk(client, path, params, limit):
+    """
+    Follow X-Next-Cursor to the last page; (pages of ids, cursors sent back).
+    """
+    pages, cursors, after = [], [], params.pop("after")
+    while True:
+        response = client.get(path, params={**params, "after": after, "limit": limit})
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        after = response.headers.get(NEXT_CURSOR_HEADER)
+        if after is None:
+            return pages, cursors
+        cursors.append(int(after))
+
+
+def _new_questions(client, n):
+    return [
+        client.post("/questions/", json={"question_text": f"paged {k}"}).json()["question_id"]
+        for k in range(n)
+    ]
+
+
+def _new_subjects(client, n):
+    return [client.post("/subjects/", json={"name": f"paged {k}"}).json()["subject_id"] for k in range(n)]
+
+
+@pytest.mark.parametrize("path, key, create", [
+    ("/subjects/", "subject_id", _new_subjects),  # ORM rows
+    ("/questions/", "question_id", _new_questions),  # catalog cache
+])
+def test_keyset_pages_follow_the_cursor(client, path, key, create):
+    ids = create(client, 5)
+    pages, cursors = _walk(client, path, {"after": ids[0] - 1}, limit=2)
+    assert [[row[key] for row in page] for page in pages] == [ids[:2], ids[2:4], ids[4:]]
+    assert cursors == [ids[1], ids[3]]
+
+
+def test_rating_pages_follow_the_cursor(client, experiment):
+    question_id = experiment["questions"][0]["question_id"]
+    ratings = client.post("/ratings/batch", json=[
+        {"session_image_id": si["session_image_id"], "question_id": question_id, "rating_value": 3}
+        for si in experiment["session_images"]
+    ]).json()
+    pages, cursors = _walk(client, "/ratings/", {"after": 0, "question_id": question_id}, limit=2)
+    rating_ids = [r["rating_id"] for r in ratings]
+    assert [[row["rating_id"] for row in page] for page in pages] == [rating_ids[:2], rating_ids[2:]]
+    assert cursors == [rating_ids[1]]
+
+
+def test_full_last_page_has_no_cursor(client):
+    ids = _new_subjects(client, 2)
+    response = client.get("/subjects/", params={"after": ids[0] - 1, "limit": 2})
+    assert len(response.json()) == 2
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/subjects/", {"fields": "name"}),
+    ("/questions/", {"fields": "question_text, min_scale"}),
+    ("/ratings/", {"fields": "rating_value"}),
+])
+def test_fields_projection_adds_only_the_primary_key(client, experiment, path, params):
+    si_id, question_id = experiment["session_images"][0]["session_image_id"], experiment["questions"][0]["question_id"]
+    client.post("/ratings/", json={"session_image_id": si_id, "question_id": question_id, "rating_value": 3})
+    response = client.get(path, params={**params, "limit": 1})
+    assert response.status_code == 200
+    [row] = response.json()
+    fields = [f.strip() for f in params["fields"].split(",")]
+    key = {"/subjects/": "subject_id", "/questions/": "question_id", "/ratings/": "rating_id"}[path]
+    assert list(row) == fields + [key]
+    assert response.headers[NEXT_CURSOR_HEADER] == str(row[key])
+
+
+@pytest.mark.parametrize("path", ["/subjects/", "/questions/", "/ratings/"])
+def test_unknown_fields_are_rejected(client, path):
+    response = client.get(path, params={"fields": "name,password"})
+    assert response.status_code == 422
+    assert "password" in response.json()["detail"]
@@ -0,0 +1,79 @@
+# tests/test_playlists.py
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from backend.app import models, playlists
+from backend.app.database import engine
+from backend.app.progress import add_stimuli
+
+
+def _assign_elsewhere(session_id, image_id, display_order):
+    # As another worker would: this process's caches are not told
+    with Session(engine) as db:
+        db.execute(insert(models.SessionImage).values(
+            session_id=session_id, image_id=image_id, display_order=display_order, is_training=False,
+        ))
+        add_stimuli(db, {session_id: 1})
+        db.commit()
+
+
+def test_images_assigned_by_another_worker_are_served(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    params = {"session_id": session_id}
+    assert client.get("/flow/next_image", params=params).json()["display_order"] == 1
+    assert len(client.get("/flow/manifest", params=params).json()["items"]) == 3
+
+    _assign_elsewhere(session_id, 1, 4)
+    with Session(engine) as db:
+        db.execute(update(models.Session).where(models.Session.session_id == session_id).values(last_image_index=3))
+        db.commit()
+
+    next_image = client.get("/flow/next_image", params=params).json()
+    assert next_image["display_order"] == 4
+    manifest = client.get("/flow/manifest", params=params).json()
+    assert [item["display_order"] for item in manifest["items"]] == [1, 2, 3, 4]
+    assert manifest["last_image_index"] == 3
+
+
+def test_manifest_with_undecodable_image_is_rejected(client, experiment, tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+    image = client.post("/images/", json={"file_name": "broken.jpg", "file_path": str(path)}).json()
+    session_id = experiment["session"]["session_id"]
+    assert client.post("/session-images/", json={
+        "session_id": session_id, "image_id": image["image_id"], "display_order": 4,
+    }).status_code == 200
+
+    response = client.get("/flow/manifest", params={"session_id": session_id})
+    assert response.status_code == 422
+    assert "broken.jpg" in response.json()["detail"]
+
+
+def test_exhausted_playlist_does_not_complete_the_session(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    question_id = experiment["questions"][0]["question_id"]
+    assert client.post("/ratings/batch", json=[
+        {"session_image_id": si["session_image_id"], "question_id": question_id, "rating_value": 3}
+        for si in experiment["session_images"]
+    ]).status_code == 200
+
+    for _ in range(2):  # a retried GET changes nothing either
+        response = client.get("/flow/next_image", params={"session_id": session_id})
+        assert response.status_code == 200
+        assert "session_image_id" not in response.json()
+        assert client.get(f"/sessions/{session_id}").json()["is_completed"] is False
+
+    assert client.patch(f"/sessions/{session_id}/complete").json()["is_completed"] is True
+    done = client.get("/flow/next_image", params={"session_id": session_id}).json()
+    assert done == {"message": "Session is already completed."}
+
+
+def test_manifest_builds_share_one_pool(client, experiment):
+    params = {"session_id": experiment["session"]["session_id"]}
+    assert client.get("/flow/manifest", params={**params, "width": 32}).status_code == 200
+    pool = playlists._build_pool
+    assert pool is not None
+    assert client.get("/flow/manifest", params={**params, "width": 48}).status_code == 200
+    assert playlists._build_pool is pool
+    assert len(pool._threads) <= playlists.MANIFEST_BUILD_THREADS
@@ -0,0 +1,119 @@
+# tests/test_query_plans.py
+
+"""
+Query plans of the statements the routers actually execute: every SELECT,
+UPDATE and DELETE issued while driving the rating flow and the list endpoints
+is captured and run through EXPLAIN QUERY PLAN on the test database. A full
+scan or temporary sort is only accepted for statements listed with allow_scan
+in app/query_plan.py.
+"""
+
+import re
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import event
+
+from backend.app.database import async_engine, engine, make_engine
+from backend.app.migrations import upgrade
+from backend.app.query_plan import AUDITED_QUERIES, audit, plan_problems
+
+_AUDITED = re.compile(r"\s*(SELECT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+
+def _normalized(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+ALLOWED_SCANS = {
+    _normalized(str(query.statement.compile(dialect=engine.dialect))): query.name
+    for query in AUDITED_QUERIES if query.allow_scan
+}
+
+
+@contextmanager
+def captured_statements() -> Iterator[List[Tuple[str, tuple]]]:
+    statements: List[Tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if _AUDITED.match(statement):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    targets = (engine, async_engine.sync_engine)
+    for target in targets:
+        event.listen(target, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        for target in targets:
+            event.remove(target, "before_cursor_execute", capture)
+
+
+def _explain(statement: str, parameters: tuple) -> List[str]:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def test_audited_queries_on_fresh_database(tmp_path):
+    audit_engine = make_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+    try:
+        upgrade(audit_engine)
+        assert audit(audit_engine) == []
+    finally:
+        audit_engine.dispose()
+
+
+def test_router_statements_use_indexes(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    subject_id = experiment["subject"]["subject_id"]
+    si_ids = [si["session_image_id"] for si in experiment["session_images"]]
+    q_ids = [q["question_id"] for q in experiment["questions"]]
+
+    with captured_statements() as statements:
+        assert client.get("/flow/next_image", params={"session_id": session_id}).status_code == 200
+        assert client.get("/flow/manifest", params={"session_id": session_id}).status_code == 200
+        response = client.post("/ratings/", json={"session_image_id": si_ids[0], "question_id": q_ids[0], "rating_value": 3})
+        assert response.status_code == 200
+        response = client.post("/ratings/batch", json=[
+            {"session_image_id": si_ids[1], "question_id": q_id, "rating_value": 4} for q_id in q_ids
+        ])
+        assert response.status_code == 200
+        response = client.post("/ratings/sync", json={"device_id": f"plans-{session_id}", "ratings": [
+            {"client_key": f"plans-{session_id}", "client_seq": 1,
+             "session_image_id": si_ids[2], "question_id": q_ids[0], "rating_value": 2},
+        ]})
+        assert response.status_code == 200
+        for path, params in [
+            ("/subjects/", {}),
+            ("/subjects/", {"after": subject_id - 1}),
+            (f"/subjects/{subject_id}", {}),
+            ("/sessions/", {"subject_id": subject_id}),
+            ("/sessions/", {"is_completed": False, "after": 0}),
+            ("/sessions/active", {}),
+            (f"/sessions/{session_id}", {}),
+            (f"/sessions/{session_id}/progress", {}),
+            ("/session-images/", {"session_id": session_id}),
+            (f"/session-images/{si_ids[0]}", {}),
+            ("/ratings/", {}),
+            ("/ratings/", {"question_id": q_ids[0], "after": 0}),
+            ("/ratings/", {"session_image_id": si_ids[1]}),
+            (f"/ratings/sync/plans-{session_id}", {}),
+            ("/images/", {}),
+            ("/questions/", {}),
+        ]:
+            response = client.get(path, params=params)
+            assert response.status_code == 200, (path, response.text)
+        assert client.patch(f"/sessions/{session_id}/complete").status_code == 200
+
+    assert statements
+    failures = {}
+    for statement, parameters in statements:
+        problems = plan_problems(_explain(statement, parameters))
+        if problems and _normalized(statement) not in ALLOWED_SCANS:
+            failures[_normalized(statement)] = problems
+    assert failures == {}
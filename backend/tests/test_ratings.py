@@ -0,0 +1,142 @@
+# tests/test_ratings.py
+
+import gzip
+import json
+import zlib
+
+from backend.app.routers.ratings import MAX_SYNC_BYTES
+
+
+def _rating(session_image_id, question_id, value=3, **extra):
+    return {"session_image_id": session_image_id, "question_id": question_id, "rating_value": value, **extra}
+
+
+def _sync_item(seq, session_image_id, question_id, key=None, value=3):
+    return _rating(session_image_id, question_id, value, client_seq=seq, client_key=key or f"key-{seq}")
+
+
+def _stored(client, session_image_id):
+    response = client.get("/ratings/", params={"session_image_id": session_image_id})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_single_rating_advances_cursor_and_rejects_duplicate(client, experiment):
+    si, question = experiment["session_images"][1], experiment["questions"][0]
+    response = client.post("/ratings/", json=_rating(si["session_image_id"], question["question_id"]))
+    assert response.status_code == 200
+    assert response.json()["rating_value"] == 3
+
+    duplicate = client.post("/ratings/", json=_rating(si["session_image_id"], question["question_id"], 5))
+    assert duplicate.status_code == 409
+    assert [r["rating_value"] for r in _stored(client, si["session_image_id"])] == [3]
+
+    session = client.get(f"/sessions/{experiment['session']['session_id']}").json()
+    assert session["last_image_index"] == si["display_order"]
+    assert session["rated_images"] == 1
+
+
+def test_single_rating_unknown_references(client, experiment):
+    si, question = experiment["session_images"][0], experiment["questions"][0]
+    assert client.post("/ratings/", json=_rating(10**9, question["question_id"])).status_code == 404
+    assert client.post("/ratings/", json=_rating(si["session_image_id"], 10**9)).status_code == 404
+
+
+def test_batch_inserts_every_answer(client, experiment):
+    si_ids = [si["session_image_id"] for si in experiment["session_images"][:2]]
+    q_ids = [q["question_id"] for q in experiment["questions"]]
+    batch = [_rating(si_id, q_id, 4) for si_id in si_ids for q_id in q_ids]
+
+    response = client.post("/ratings/batch", json=batch)
+    assert response.status_code == 200
+    assert [(r["session_image_id"], r["question_id"]) for r in response.json()] == [
+        (r["session_image_id"], r["question_id"]) for r in batch
+    ]
+    progress = client.get(f"/sessions/{experiment['session']['session_id']}/progress").json()
+    assert progress["rated_images"] == 2
+    assert progress["last_image_index"] == experiment["session_images"][1]["display_order"]
+
+
+def test_batch_is_all_or_nothing(client, experiment):
+    si_id = experiment["session_images"][0]["session_image_id"]
+    q_ids = [q["question_id"] for q in experiment["questions"]]
+    assert client.post("/ratings/", json=_rating(si_id, q_ids[1])).status_code == 200
+
+    # The second answer conflicts with the stored one: the first is not kept either
+    response = client.post("/ratings/batch", json=[_rating(si_id, q_ids[0]), _rating(si_id, q_ids[1])])
+    assert response.status_code == 409
+    assert [r["question_id"] for r in _stored(client, si_id)] == [q_ids[1]]
+
+    response = client.post("/ratings/batch", json=[_rating(si_id, q_ids[0]), _rating(10**9, q_ids[0])])
+    assert response.status_code == 404
+    assert str(10**9) in response.json()["detail"]
+    assert client.post("/ratings/batch", json=[]).json() == []
+
+
+def test_sync_deduplicates_and_tracks_high_water_mark(client, experiment):
+    device = f"tablet-{experiment['session']['session_id']}"
+    si_ids = [si["session_image_id"] for si in experiment["session_images"]]
+    q_id = experiment["questions"][0]["question_id"]
+    items = [_sync_item(seq, si_id, q_id, key=f"{device}-{seq}") for seq, si_id in enumerate(si_ids[:2], 1)]
+
+    first = client.post("/ratings/sync", json={"device_id": device, "ratings": items}).json()
+    assert (first["applied"], first["duplicates"], first["high_water_mark"]) == (2, 0, 2)
+
+    # Resent with one new item: acknowledged items are skipped
+    new = _sync_item(3, si_ids[2], q_id, key=f"{device}-3")
+    second = client.post("/ratings/sync", json={"device_id": device, "ratings": items + [new]}).json()
+    assert (second["applied"], second["duplicates"], second["high_water_mark"]) == (1, 0, 3)
+
+    # Same answer under a new key and sequence number: a duplicate, still acknowledged
+    again = _sync_item(4, si_ids[0], q_id, key=f"{device}-4")
+    third = client.post("/ratings/sync", json={"device_id": device, "ratings": [again]}).json()
+    assert (third["applied"], third["duplicates"], third["high_water_mark"]) == (0, 1, 4)
+    assert len(_stored(client, si_ids[0])) == 1
+
+    assert client.get(f"/ratings/sync/{device}").json()["high_water_mark"] == 4
+
+
+def test_sync_rejects_unknown_items_without_jamming(client, experiment):
+    device = f"tablet-rejects-{experiment['session']['session_id']}"
+    si_id = experiment["session_images"][0]["session_image_id"]
+    q_id = experiment["questions"][0]["question_id"]
+    body = {"device_id": device, "ratings": [
+        _sync_item(1, 10**9, q_id, key=f"{device}-bad"),
+        _sync_item(2, si_id, q_id, key=f"{device}-good"),
+    ]}
+    response = client.post(
+        "/ratings/sync", content=gzip.compress(json.dumps(body).encode()),
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    result = response.json()
+    assert result["rejected"] == [f"{device}-bad"]
+    assert (result["applied"], result["high_water_mark"]) == (1, 2)
+
+
+def _post_encoded(client, content, encoding):
+    return client.post(
+        "/ratings/sync", content=content,
+        headers={"Content-Type": "application/json", "Content-Encoding": encoding},
+    )
+
+
+def test_sync_accepts_deflate(client, experiment):
+    si_id, q_id = experiment["session_images"][0]["session_image_id"], experiment["questions"][0]["question_id"]
+    device = f"tablet-deflate-{si_id}"
+    body = {"device_id": device, "ratings": [_sync_item(1, si_id, q_id, key=f"{device}-1")]}
+    response = _post_encoded(client, zlib.compress(json.dumps(body).encode()), "deflate")
+    assert response.status_code == 200
+    assert response.json()["applied"] == 1
+
+
+def test_sync_limits_the_decompressed_size(client):
+    # ~16 KiB of gzip inflating past the limit is refused without inflating it all
+    bomb = gzip.compress(b" " * (MAX_SYNC_BYTES + 1))
+    assert len(bomb) < MAX_SYNC_BYTES // 100
+    assert _post_encoded(client, bomb, "gzip").status_code == 413
+
+
+def test_sync_rejects_broken_compression(client):
+    body = gzip.compress(json.dumps({"device_id": "tablet-broken", "ratings": []}).encode())
+    assert _post_encoded(client, body[:-12], "gzip").status_code == 400
+    assert _post_encoded(client, b"not gzip", "gzip").status_code == 400
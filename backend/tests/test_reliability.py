@@ -0,0 +1,119 @@
+# tests/test_reliability.py
+
+import numpy as np
+import pytest
+
+from backend.app import models, reliability, studies
+from backend.app.reliability import icc_oneway, krippendorff_alpha, loo_correlation
+
+nan = np.nan
+
+# Krippendorff (2011), "Computing Krippendorff's Alpha-Reliability", C:
+# four observers, twelve units, interval alpha 0.849
+KRIPPENDORFF = np.array([
+    [1, 2, 3, 3, 2, 1, 4, 1, 2, nan, nan, nan],
+    [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, nan, 3],
+    [nan, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, nan],
+    [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, nan],
+])
+
+# Shrout & Fleiss (1979), Table 2: six targets rated by four judges,
+# ICC(1,1) 0.17; rows here are judges, columns targets
+SHROUT_FLEISS = np.array([
+    [9, 6, 8, 7, 10, 6],
+    [2, 1, 4, 1, 5, 2],
+    [5, 3, 6, 2, 6, 4],
+    [8, 2, 8, 6, 9, 7],
+], dtype=float)
+
+
+def test_krippendorff_alpha_interval():
+    assert krippendorff_alpha(KRIPPENDORFF) == pytest.approx(0.849, abs=5e-4)
+
+
+def test_krippendorff_alpha_needs_variation():
+    assert krippendorff_alpha(np.full((3, 4), 2.0)) is None
+
+
+def test_icc_oneway():
+    assert icc_oneway(SHROUT_FLEISS) == pytest.approx(0.1657, abs=5e-4)
+
+
+def test_icc_oneway_with_missing_ratings_matches_the_anova():
+    scores = SHROUT_FLEISS.copy()
+    scores[0, 1] = scores[3, 4] = nan
+    targets = [column[~np.isnan(column)] for column in scores.T]
+    n_i = np.array([len(t) for t in targets])
+    total, a = n_i.sum(), len(targets)
+    grand = np.concatenate(targets).mean()
+    ms_between = sum(len(t) * (t.mean() - grand) ** 2 for t in targets) / (a - 1)
+    ms_within = sum(((t - t.mean()) ** 2).sum() for t in targets) / (total - a)
+    k0 = (total - (n_i ** 2).sum() / total) / (a - 1)
+    expected = (ms_between - ms_within) / (ms_between + (k0 - 1) * ms_within)
+    assert icc_oneway(scores) == pytest.approx(expected)
+
+
+def test_loo_correlation_matches_pearson_on_the_other_subjects_mean():
+    scores = KRIPPENDORFF
+    r, n = loo_correlation(scores)
+    for k, row in enumerate(scores):
+        others = np.delete(scores, k, axis=0)
+        shared = ~np.isnan(row) & (~np.isnan(others)).any(axis=0)
+        loo = np.nanmean(others[:, shared], axis=0)
+        assert n[k] == shared.sum()
+        assert r[k] == pytest.approx(np.corrcoef(row[shared], loo)[0, 1])
+
+
+def test_loo_correlation_without_spread_is_undefined():
+    scores = np.array([[3, 3, 3], [1, 2, 3], [2, 3, 4]], dtype=float)
+    r, _ = loo_correlation(scores)
+    assert np.isnan(r[0])
+    assert r[1] == pytest.approx(1.0)
+
+
+def _queued_job(study=None) -> int:
+    with studies.session(study) as db:
+        job = models.ReliabilityJob(status="queued")
+        db.add(job)
+        db.commit()
+        return job.job_id
+
+
+def _job(study, job_id) -> models.ReliabilityJob:
+    with studies.session(study) as db:
+        return db.get(models.ReliabilityJob, job_id)
+
+
+def test_job_of_archived_study_fails(client):
+    study = "reliability-archived"
+    assert client.post("/studies/", json={"study_id": study, "name": study}).status_code == 200
+    job_id = _queued_job(study)
+    assert client.patch(f"/studies/{study}", json={"status": "archived"}).status_code == 200
+
+    reliability.run_job(study, job_id)
+    job = client.get(f"/analytics/reliability/jobs/{job_id}", headers={"X-Study-Id": study}).json()
+    assert job["status"] == "failed"
+    assert job["error"].startswith("StudyArchived")
+
+
+def test_job_fails_when_its_database_cannot_be_opened(client, monkeypatch):
+    job_id = _queued_job()
+    acquire = studies.registry.acquire
+    calls = []
+
+    def failing_once(study_id):
+        calls.append(study_id)
+        if len(calls) == 1:
+            raise OSError("disk I/O error")
+        return acquire(study_id)
+
+    monkeypatch.setattr(studies.registry, "acquire", failing_once)
+    reliability.run_job(None, job_id)
+    job = _job(None, job_id)
+    assert (job.status, job.error) == ("failed", "OSError: disk I/O error")
+    assert job.finished_at is not None
+
+
+def test_job_of_unknown_study_is_logged(caplog):
+    reliability.run_job("no-such-study", 1)
+    assert "Could not record the failure of reliability job 1" in caplog.text
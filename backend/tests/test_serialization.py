@@ -0,0 +1,54 @@
+# tests/test_serialization.py
+
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from backend.app import models, schemas, serialization
+from backend.app.database import engine
+from backend.app.serialization import encode, schema_columns
+
+ROW = {
+    "rating_id": 7,
+    "rating_value": 3.5,
+    "text_answer": None,
+    "is_training": False,
+    "file_name": "ünïcode \"quoted\".png",
+    "created_at": datetime(2026, 1, 2, 3, 4, 5, 123456),
+    "responded_at": datetime(2026, 1, 2, 3, 4, 5),
+}
+
+
+def test_orjson_and_fallback_encode_alike(monkeypatch):
+    pytest.importorskip("orjson")
+    fast = encode([ROW])
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert encode([ROW]) == fast
+    assert json.loads(fast)[0]["created_at"] == "2026-01-02T03:04:05.123456"
+
+
+def test_schema_columns_follow_the_schema():
+    columns = schema_columns(models.Rating, schemas.RatingOut)
+    assert [c.name for c in columns] == [name for name in schemas.RatingOut.model_fields if name in models.Rating.__table__.c]
+    assert all(c.table is models.Rating.__table__ for c in columns)
+
+
+def test_fast_path_matches_the_response_schema(client, experiment):
+    si_id = experiment["session_images"][0]["session_image_id"]
+    for question in experiment["questions"]:
+        assert client.post("/ratings/", json={
+            "session_image_id": si_id, "question_id": question["question_id"], "rating_value": 2.5,
+            "stimulus_onset_client_ms": 1767225600000.0, "response_client_ms": 1767225601500.0,
+            "clock_offset_ms": 0.0,
+        }).status_code == 200
+
+    served = client.get("/ratings/", params={"session_image_id": si_id}).json()
+    with Session(engine) as db:
+        ratings = db.scalars(
+            select(models.Rating).where(models.Rating.session_image_id == si_id).order_by(models.Rating.rating_id)
+        ).all()
+        expected = [schemas.RatingOut.model_validate(r).model_dump(mode="json") for r in ratings]
+    assert served == expected
@@ -0,0 +1,74 @@
+# tests/test_sessions.py
+
+
+def _rate(client, session_image_id, question_id, response_time=None):
+    response = client.post("/ratings/", json={
+        "session_image_id": session_image_id, "question_id": question_id,
+        "rating_value": 3, "response_time": response_time,
+    })
+    assert response.status_code == 200, response.text
+
+
+def _progress(client, session_id):
+    return client.get(f"/sessions/{session_id}/progress").json()
+
+
+def test_progress_counters_follow_assignments_and_ratings(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    si_ids = [si["session_image_id"] for si in experiment["session_images"]]
+    q_ids = [q["question_id"] for q in experiment["questions"]]
+    progress = _progress(client, session_id)
+    assert (progress["total_images"], progress["rated_images"], progress["avg_response_time"]) == (3, 0, None)
+    assert progress["last_activity_at"] is None
+
+    # A stimulus counts as rated once, however many questions it has
+    _rate(client, si_ids[0], q_ids[0], response_time=1.0)
+    _rate(client, si_ids[0], q_ids[1], response_time=2.0)
+    progress = _progress(client, session_id)
+    assert (progress["rated_images"], progress["avg_response_time"]) == (1, 1.5)
+    assert progress["last_activity_at"] is not None
+
+    sync = client.post("/ratings/sync", json={"device_id": f"progress-{session_id}", "ratings": [
+        {"client_key": f"progress-{session_id}", "client_seq": 1,
+         "session_image_id": si_ids[2], "question_id": q_ids[0], "rating_value": 4},
+    ]})
+    assert sync.status_code == 200
+    progress = _progress(client, session_id)
+    assert (progress["rated_images"], progress["last_image_index"]) == (2, 3)
+    assert progress["avg_response_time"] == 1.5
+
+    active = {p["session_id"]: p for p in client.get("/sessions/active").json()}
+    assert active[session_id] == progress
+
+
+def test_incomplete_session_needs_force(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    _rate(client, experiment["session_images"][0]["session_image_id"], experiment["questions"][0]["question_id"])
+
+    response = client.patch(f"/sessions/{session_id}/complete")
+    assert response.status_code == 409
+    assert "2 of 3" in response.json()["detail"]
+
+    forced = client.patch(f"/sessions/{session_id}/complete", params={"force": True})
+    assert forced.status_code == 200
+    assert forced.json()["is_completed"] is True
+    assert session_id not in {p["session_id"] for p in client.get("/sessions/active").json()}
+
+
+def test_fully_rated_session_completes(client, experiment):
+    session_id = experiment["session"]["session_id"]
+    for si in experiment["session_images"]:
+        _rate(client, si["session_image_id"], experiment["questions"][0]["question_id"])
+    response = client.patch(f"/sessions/{session_id}/complete")
+    assert response.status_code == 200
+    assert response.json()["is_completed"] is True
+    # Completing again is a no-op
+    assert client.patch(f"/sessions/{session_id}/complete").status_code == 200
+
+
+def test_session_without_stimuli_cannot_complete(client, experiment):
+    subject_id = experiment["subject"]["subject_id"]
+    session = client.post("/sessions/", json={"subject_id": subject_id, "session_type": "empty"}).json()
+    response = client.patch(f"/sessions/{session['session_id']}/complete")
+    assert response.status_code == 409
+    assert client.patch(f"/sessions/{session['session_id']}/complete", params={"force": True}).status_code == 200
@@ -0,0 +1,68 @@
+# tests/test_studies.py
+
+import itertools
+import os
+
+import pytest
+
+from backend.app.config import settings
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture
+def study(client):
+    study_id = f"study-{next(_ids)}"
+    response = client.post("/studies/", json={"study_id": study_id, "name": study_id})
+    assert response.status_code == 200, response.text
+    return study_id
+
+
+def _headers(study_id):
+    return {"X-Study-Id": study_id}
+
+
+def test_create_study_uses_study_dir(client, study):
+    assert os.path.exists(os.path.join(settings.STUDY_DB_DIR, f"{study}.db"))
+    assert client.post("/studies/", json={"study_id": study, "name": "again"}).status_code == 409
+    assert "database_url" not in client.get(f"/studies/{study}").json()
+
+
+def test_client_cannot_choose_database_location(client, tmp_path):
+    study_id = f"study-{next(_ids)}"
+    elsewhere = tmp_path / "elsewhere.db"
+    response = client.post("/studies/", json={
+        "study_id": study_id, "name": study_id, "database_url": f"sqlite:///{elsewhere}",
+    })
+    assert response.status_code == 200
+    assert not elsewhere.exists()
+    assert os.path.exists(os.path.join(settings.STUDY_DB_DIR, f"{study_id}.db"))
+
+
+def test_requests_are_routed_to_the_study_database(client, study):
+    question = {"question_text": f"only in {study}"}
+    assert client.post("/questions/", json=question, headers=_headers(study)).status_code == 200
+
+    in_study = client.get("/questions/", headers=_headers(study)).json()
+    by_query = client.get("/questions/", params={"study": study}).json()
+    in_main = client.get("/questions/").json()
+    assert [q["question_text"] for q in in_study] == [question["question_text"]]
+    assert by_query == in_study
+    assert question["question_text"] not in {q["question_text"] for q in in_main}
+
+
+def test_unknown_and_invalid_studies(client):
+    assert client.get("/subjects/", headers=_headers("no-such-study")).status_code == 404
+    assert client.get("/subjects/", headers=_headers("not a valid id!")).status_code == 400
+
+
+def test_archived_study_is_read_only(client, study):
+    response = client.patch(f"/studies/{study}", json={"status": "archived"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "archived"
+
+    assert client.post("/subjects/", json={"name": "late"}, headers=_headers(study)).status_code == 409
+    assert client.get("/subjects/", headers=_headers(study)).status_code == 200
+
+    assert client.patch(f"/studies/{study}", json={"status": "active"}).status_code == 200
+    assert client.post("/subjects/", json={"name": "back"}, headers=_headers(study)).status_code == 200
@@ -0,0 +1,170 @@
+# tests/test_write_behind.py
+
+import glob
+import json
+import os
+
+import logging
+
+import pytest
+
+from backend.app import write_behind as write_behind_module
+from backend.app.config import settings
+from backend.app.routers.ratings import apply_queued
+from backend.app.write_behind import DEAD_LETTER_NAME, LOG_NAME, RatingBuffer, buffer
+
+
+def _segments():
+    paths = glob.glob(os.path.join(settings.WRITE_BEHIND_DIR, f"{LOG_NAME}-*.log"))
+    return sorted(p for p in paths if not os.path.basename(p).startswith(DEAD_LETTER_NAME))
+
+
+def _write_orphan(name, records, torn_tail=b""):
+    os.makedirs(settings.WRITE_BEHIND_DIR, exist_ok=True)
+    path = os.path.join(settings.WRITE_BEHIND_DIR, name)
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(json.dumps(record).encode() + b"\n")
+        f.write(torn_tail)
+    return path
+
+
+def _logged(session_image_id, question_id, value, study=None):
+    return {
+        "study": study,
+        "rating": {"session_image_id": session_image_id, "question_id": question_id, "rating_value": value},
+        "accepted_at": "2026-01-01T00:00:00",
+    }
+
+
+@pytest.fixture
+def write_behind(client):
+    client.portal.call(buffer.open, apply_queued)
+    try:
+        yield buffer
+    finally:
+        client.portal.call(buffer.close)
+
+
+def test_accepted_ratings_are_applied(client, experiment, write_behind):
+    si, question = experiment["session_images"][0], experiment["questions"][0]
+    body = {"session_image_id": si["session_image_id"], "question_id": question["question_id"], "rating_value": 4}
+
+    response = client.post("/ratings/", json=body)
+    assert response.status_code == 202
+    # Seen by this worker before the group commit
+    assert client.post("/ratings/", json=body).status_code == 409
+    next_image = client.get("/flow/next_image", params={"session_id": experiment["session"]["session_id"]})
+    assert next_image.json()["display_order"] == experiment["session_images"][1]["display_order"]
+
+    client.portal.call(buffer.close)
+    stored = client.get("/ratings/", params={"session_image_id": si["session_image_id"]}).json()
+    assert [r["rating_value"] for r in stored] == [4]
+    assert _segments() == []
+    client.portal.call(buffer.open, apply_queued)
+
+
+def test_orphaned_segments_are_replayed_once(client, experiment, write_behind):
+    client.portal.call(buffer.close)
+    si_ids = [si["session_image_id"] for si in experiment["session_images"]]
+    q_id = experiment["questions"][1]["question_id"]
+    records = [_logged(si_id, q_id, 5) for si_id in si_ids[:2]]
+    # A crash after the commit but before truncation replays a duplicate
+    records.append(_logged(si_ids[0], q_id, 1))
+    _write_orphan("ratings-999999-1.log", records, torn_tail=b'{"study": null, "rat')
+
+    client.portal.call(buffer.open, apply_queued)
+    stored = client.get("/ratings/", params={"question_id": q_id}).json()
+    assert sorted((r["session_image_id"], r["rating_value"]) for r in stored) == [(si_ids[0], 5), (si_ids[1], 5)]
+    assert all(r["created_at"].startswith("2026-01-01") for r in stored)
+    assert not os.path.exists(os.path.join(settings.WRITE_BEHIND_DIR, "ratings-999999-1.log"))
+    progress = client.get(f"/sessions/{experiment['session']['session_id']}/progress").json()
+    assert progress["rated_images"] == 2
+
+
+def test_segments_are_replayed_with_write_behind_off(client, experiment):
+    # Left behind by a worker that ran with WRITE_BEHIND before a restart without it
+    si_id = experiment["session_images"][0]["session_image_id"]
+    q_id = experiment["questions"][0]["question_id"]
+    path = _write_orphan("ratings-999998-1.log", [_logged(si_id, q_id, 2)])
+
+    client.portal.call(buffer.replay, apply_queued)
+    assert not buffer.enabled
+    assert not os.path.exists(path)
+    stored = client.get("/ratings/", params={"session_image_id": si_id}).json()
+    assert [r["rating_value"] for r in stored] == [2]
+
+
+def _study_stimulus(client, study):
+    headers = {"X-Study-Id": study}
+    assert client.post("/studies/", json={"study_id": study, "name": study}).status_code == 200
+    subject = client.post("/subjects/", json={"name": "s"}, headers=headers).json()
+    session = client.post("/sessions/", json={"subject_id": subject["subject_id"], "session_type": "block1"},
+                          headers=headers).json()
+    si = client.post(f"/session-images/{session['session_id']}/assign_images", json=[1], headers=headers).json()[0]
+    question = client.post("/questions/", json={"question_text": "q"}, headers=headers).json()
+    return si["session_image_id"], question["question_id"]
+
+
+def _dead_letters(study):
+    pattern = os.path.join(settings.WRITE_BEHIND_DIR, f"{DEAD_LETTER_NAME}-*.log")
+    records = []
+    for path in glob.glob(pattern):
+        with open(path, "rb") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return [(r["rating"]["session_image_id"], r["rating"]["rating_value"]) for r in records if r["study"] == study]
+
+
+def test_pending_ratings_of_archived_study_are_kept(client, write_behind, caplog):
+    study = "write-behind-archived"
+    headers = {"X-Study-Id": study}
+    si_id, q_id = _study_stimulus(client, study)
+    body = {"session_image_id": si_id, "question_id": q_id, "rating_value": 4}
+    assert client.post("/ratings/", json=body, headers=headers).status_code == 202
+    assert client.patch(f"/studies/{study}", json={"status": "archived"}).status_code == 200
+
+    with caplog.at_level(logging.ERROR, logger="backend.app.write_behind"):
+        client.portal.call(buffer.close)
+    assert "archived" in caplog.text
+    assert client.get("/ratings/", headers=headers).json() == []
+    assert _dead_letters(study) == [(si_id, 4)]
+    # Dead letters are left alone by the start-up replay
+    client.portal.call(buffer.open, apply_queued)
+    assert _dead_letters(study) == [(si_id, 4)]
+
+    # Reactivated, the operator renames the dead-letter log to have it replayed
+    assert client.patch(f"/studies/{study}", json={"status": "active"}).status_code == 200
+    for path in glob.glob(os.path.join(settings.WRITE_BEHIND_DIR, f"{DEAD_LETTER_NAME}-*.log")):
+        os.rename(path, path.replace("deadletter-", ""))
+    client.portal.call(buffer.close)
+    client.portal.call(buffer.open, apply_queued)
+    assert [r["rating_value"] for r in client.get("/ratings/", headers=headers).json()] == [4]
+
+
+def test_orphaned_ratings_of_unknown_study_are_kept(client):
+    si_id, q_id = 1, 1
+    path = _write_orphan("ratings-999997-1.log", [_logged(si_id, q_id, 3, "write-behind-missing")])
+    client.portal.call(buffer.replay, apply_queued)
+    assert not os.path.exists(path)
+    assert _dead_letters("write-behind-missing") == [(si_id, 3)]
+
+
+def test_live_segments_are_not_replayed(client, experiment, write_behind):
+    si, question = experiment["session_images"][0], experiment["questions"][0]
+    body = {"session_image_id": si["session_image_id"], "question_id": question["question_id"], "rating_value": 1}
+    assert client.post("/ratings/", json=body).status_code == 202
+    live = _segments()
+    assert len(live) == 1 and os.path.basename(live[0]).startswith(f"{LOG_NAME}-{os.getpid()}-")
+
+    # Another worker starting up leaves the locked segment alone
+    client.portal.call(RatingBuffer().replay, apply_queued)
+    assert _segments() == live
+    assert not glob.glob(os.path.join(settings.WRITE_BEHIND_DIR, ".*.tmp"))
+
+
+def test_write_behind_needs_flock(client, monkeypatch):
+    monkeypatch.setattr(write_behind_module, "fcntl", None)
+    with pytest.raises(RuntimeError, match="flock"):
+        client.portal.call(RatingBuffer().open, apply_queued)
+    # Start-up replay still runs
+    client.portal.call(RatingBuffer().replay, apply_queued)